@@ -1,10 +1,12 @@
 from flask import Flask
 from model import db
-from view import account_bp, file_bp
+from view import account_bp, file_bp, render_queue, derivative_cache, response_cache, file_collector
 from config import config
 from flask_cors import CORS
 from flask_migrate import Migrate
-from model import initialize_tags
+from model import initialize_tags, include_object, configure_engine
+from commands import register_commands
+from metrics import metrics
 
 
 
@@ -14,10 +16,18 @@ def create_app():
     app.config.from_object(config["default"])
     # 在扩展类实例化前加载配置
     db.init_app(app)
-    migrate = Migrate(app, db)
+    migrate = Migrate(app, db, render_as_batch=True,  # SQLite 修改列需要 batch 模式
+                      include_object=include_object)
     app.register_blueprint(account_bp)
     app.register_blueprint(file_bp)
+    render_queue.init_app(app)
+    derivative_cache.init_app(app)
+    response_cache.init_app(app)
+    file_collector.init_app(app)
+    metrics.init_app(app)
+    register_commands(app)
     with app.app_context():
+        configure_engine(db.engine, app.config['SQLITE_PRAGMAS'])
         initialize_tags()
     return app
 
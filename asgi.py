@@ -0,0 +1,341 @@
+"""ASGI 入口：uvicorn asgi:asgi_app --workers 2
+
+/upload 与 /image/<hash> 在事件循环中处理：上传内容边接收边写入磁盘，文件分块异步发送，
+慢速客户端只占用协程而不占用线程；其余路由（包括 /query）在有界线程池中运行 Flask 视图，
+响应分批迭代，等待客户端接收期间线程可处理其他请求。
+/query 使用同步的 SQLAlchemy 会话，没有异步实现，查询本身仍占用 ASGI_DB_THREADS 中的一个线程
+"""
+import asyncio
+import contextvars
+import hashlib
+import mimetypes
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs
+from werkzeug.datastructures import Headers
+from werkzeug.http import http_date, parse_etags, parse_options_header, parse_range_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File as FilePart, MultipartDecoder, NeedData
+from app import create_app
+from model import File
+from metrics import metrics
+from view import authenticate, finish_upload
+from ingest import staged_entry
+from utils import allowed_file
+from config import FILE_SAVE_FOLDER, FILE_ROUTE, FILE_MAX_AGE
+
+BODY_SPOOL_SIZE = 1024 * 1024  # 转交 Flask 的请求体超过该大小时写入临时文件
+
+
+class AsgiApp:
+    """将 Flask 应用包装为 ASGI 应用，数据库操作在 ASGI_DB_THREADS 个线程中执行"""
+
+    def __init__(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=app.config['ASGI_DB_THREADS'],
+                                           thread_name_prefix='asgi-db')
+        self.chunk_size = app.config['ASGI_CHUNK_SIZE']
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        path, method = _route_path(scope), scope['method']
+        if path == '/upload' and method == 'POST':
+            return await self._instrumented('file_bp.upload_file', scope, send,
+                                            lambda send: self._upload(scope, receive, send))
+        if path.startswith(f'/{FILE_ROUTE}/') and method in ('GET', 'HEAD') and self._plain_file(scope):
+            filehash = path[len(FILE_ROUTE) + 2:]
+            if filehash and '/' not in filehash:
+                return await self._instrumented('file_bp.get_file', scope, send,
+                                                lambda send: self._serve_file(scope, send, filehash))
+        await self._call_flask(scope, receive, send)
+
+    async def _instrumented(self, endpoint, scope, send, handler):
+        """记录不经过 Flask 的请求的指标，endpoint 与对应的 Flask 视图相同"""
+        if not self.app.config['METRICS_ENABLED']:
+            return await handler(send)
+        start, status = time.perf_counter(), 500
+
+        async def send_and_record(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await handler(send_and_record)
+        finally:
+            request_bytes = int(_request_headers(scope).get('content-length') or 0)
+            metrics.record_request(endpoint, scope['method'], status, time.perf_counter() - start, request_bytes)
+
+    def _plain_file(self, scope):
+        # 缩略图及由前端服务器发送的文件仍由 Flask 处理
+        if self.app.config['FILE_ACCEL_REDIRECT'] or self.app.config['USE_X_SENDFILE']:
+            return False
+        args = parse_qs(scope['query_string'].decode('latin-1'))
+        return 'w' not in args and 'fmt' not in args
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _run_in_app(self, func, *args):
+        def call():
+            with self.app.app_context():
+                return func(*args)
+        return await self._run(call)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.app.extensions['render_queue'].shutdown()
+                self.executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _upload(self, scope, receive, send):
+        """与 view.upload_file 相同的接口，multipart 请求体边解析边写入临时文件"""
+        headers = _request_headers(scope)
+        current_user, error = await self._run_in_app(authenticate, headers.get('x-access-token'))
+        if error:
+            return await self._send_json(send, {'message': error}, 401)
+
+        content_type, options = parse_options_header(headers.get('content-type'))
+        if content_type != 'multipart/form-data' or not options.get('boundary'):
+            return await self._send_json(send, {'error': 'No file part'}, 400)
+        decoder = MultipartDecoder(options['boundary'].encode('latin-1'))
+        upload, staged, current = None, None, None
+        try:
+            body, event = _iter_body(receive), None
+            while not isinstance(event, Epilogue):
+                chunk = await anext(body, None)
+                decoder.receive_data(chunk)  # None 表示请求体已结束
+                event = decoder.next_event()
+                while not isinstance(event, (NeedData, Epilogue)):
+                    if isinstance(event, (Field, FilePart)):
+                        current = None
+                        # 与 request.files['file'] 一致，只取第一个名为 file 的文件
+                        if isinstance(event, FilePart) and event.name == 'file' and upload is None:
+                            if event.filename == '':
+                                return await self._send_json(send, {'error': 'No selected file'}, 400)
+                            if not allowed_file(event.filename):
+                                return await self._send_json(send, {'error': 'File type not allowed'}, 400)
+                            upload = current = _StagingFile(event.filename, self.chunk_size)
+                    elif isinstance(event, Data) and current is not None:
+                        await current.write(event.data)
+                        if not event.more_data:
+                            staged, current = await current.close(), None
+                    event = decoder.next_event()
+            if staged is None:
+                return await self._send_json(send, {'error': 'No file part'}, 400)
+            result, status = await self._run_in_app(finish_upload, staged, current_user)
+        finally:
+            if upload is not None and staged is None:
+                await upload.discard()
+        await self._send_json(send, result, status)
+
+    async def _serve_file(self, scope, send, filehash):
+        """与 view.get_file 相同的接口（ETag、Range），文件内容在默认线程池中分块读取"""
+        headers = _request_headers(scope)
+        cache_headers = [('etag', f'"{filehash}"'),
+                         ('cache-control', f'public, max-age={FILE_MAX_AGE}, immutable')]
+        path = await self._run_in_app(File.get_path, filehash)
+        if path is None:
+            return await self._send_json(send, {'error': 'File not found'}, 404)
+        # URL 中的哈希即文件内容，文件存在时可直接作为强 ETag 返回 304
+        if filehash in parse_etags(headers.get('if-none-match')):
+            return await _send_response(send, 304, cache_headers)
+
+        loop = asyncio.get_running_loop()
+        stat = await loop.run_in_executor(None, os.stat, path)
+        start, length, status = 0, stat.st_size, 200
+        response_headers = cache_headers + [
+            ('content-type', mimetypes.guess_type(path)[0] or 'application/octet-stream'),
+            ('last-modified', http_date(stat.st_mtime)),
+            ('accept-ranges', 'bytes'),
+        ]
+        ranges = parse_range_header(headers.get('range'))
+        if ranges is not None and headers.get('if-range', f'"{filehash}"') == f'"{filehash}"':
+            byte_range = ranges.range_for_length(stat.st_size)
+            if byte_range is None:
+                return await _send_response(send, 416, response_headers + [
+                    ('content-range', f'bytes */{stat.st_size}')])
+            start, length, status = byte_range[0], byte_range[1] - byte_range[0], 206
+            response_headers.append(('content-range', ranges.to_content_range_header(stat.st_size)))
+        response_headers.append(('content-length', str(length)))
+
+        if scope['method'] == 'HEAD':
+            return await _send_response(send, status, response_headers)
+        await send({'type': 'http.response.start', 'status': status, 'headers': _encode_headers(response_headers)})
+        f = await loop.run_in_executor(None, open, path, 'rb')
+        try:
+            await loop.run_in_executor(None, f.seek, start)
+            while length > 0:
+                data = await loop.run_in_executor(None, f.read, min(self.chunk_size, length))
+                if not data:
+                    break
+                length -= len(data)
+                await send({'type': 'http.response.body', 'body': data, 'more_body': length > 0})
+        finally:
+            await loop.run_in_executor(None, f.close)
+
+    async def _call_flask(self, scope, receive, send):
+        """在线程池中运行 Flask 应用，响应按 ASGI_CHUNK_SIZE 分批迭代并发送"""
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+        async for chunk in _iter_body(receive):
+            body.write(chunk)
+        body.seek(0)
+        environ = _build_environ(scope, body)
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = int(status.split(' ', 1)[0]), headers
+
+        # 同一请求的各步骤在同一上下文中执行，stream_with_context 生成器跨线程迭代时仍能访问请求上下文
+        context = contextvars.copy_context()
+        iterable = await self._run(context.run, self.app, environ, start_response)
+        try:
+            iterator = iter(iterable)
+            data, more = await self._run(context.run, _next_batch, iterator, self.chunk_size)
+            await send({'type': 'http.response.start', 'status': started['status'],
+                        'headers': _encode_headers(started['headers'])})
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more})
+            while more:
+                data, more = await self._run(context.run, _next_batch, iterator, self.chunk_size)
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more})
+        finally:
+            if hasattr(iterable, 'close'):
+                await self._run(context.run, iterable.close)
+            body.close()
+
+    async def _send_json(self, send, data, status):
+        body = self.app.json.dumps(data).encode()
+        await _send_response(send, status, [('content-type', 'application/json'),
+                                            ('content-length', str(len(body)))], body)
+
+
+class _StagingFile:
+    """上传文件的临时文件，按块在默认线程池中写入并计算MD5，结果与 ingest.stage_file 相同"""
+
+    def __init__(self, filename, chunk_size):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.md5 = hashlib.md5()
+        self.buffer = bytearray()
+        Path(FILE_SAVE_FOLDER).mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=FILE_SAVE_FOLDER, suffix='.part')
+        self.out = os.fdopen(fd, 'wb')
+
+    async def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            await self._flush()
+
+    async def close(self):
+        await self._flush()
+        await asyncio.get_running_loop().run_in_executor(None, self._close)
+        return staged_entry(self.filename, self.md5.hexdigest(), self.tmp_path)
+
+    async def discard(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._discard)
+
+    async def _flush(self):
+        data, self.buffer = bytes(self.buffer), bytearray()
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+    def _write(self, data):
+        self.md5.update(data)
+        self.out.write(data)
+
+    def _close(self):
+        self.out.close()
+        os.chmod(self.tmp_path, 0o644)  # mkstemp 默认仅属主可读，需允许前端服务器读取
+
+    def _discard(self):
+        self.out.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+async def _iter_body(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('client disconnected')
+        yield message.get('body', b'')
+        if not message.get('more_body'):
+            return
+
+
+async def _send_response(send, status, headers, body=b''):
+    await send({'type': 'http.response.start', 'status': status, 'headers': _encode_headers(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _next_batch(iterator, size):
+    """从 WSGI 响应中取出至少 size 字节，返回 (数据, 是否还有后续)"""
+    batch = bytearray()
+    for data in iterator:
+        batch += data
+        if len(batch) >= size:
+            return bytes(batch), True
+    return bytes(batch), False
+
+
+def _route_path(scope):
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    return path[len(root_path):] if root_path and path.startswith(root_path) else path
+
+
+def _request_headers(scope):
+    return Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']])
+
+
+def _encode_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+def _build_environ(scope, body):
+    """由 ASGI scope 构造 WSGI environ（PEP 3333）"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': _route_path(scope).encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+asgi_app = AsgiApp(create_app())
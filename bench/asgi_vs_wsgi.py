@@ -0,0 +1,188 @@
+"""WSGI（gunicorn 同步 worker）与 ASGI（uvicorn + asgi.py）并发对比
+
+在临时目录中建立数据库并上传测试文件，分别启动两种服务，测量 /query 快速请求在以下场景下的延迟与吞吐：
+  idle      无其他负载
+  download  同时有 --slow-clients 个慢速客户端下载大文件
+  upload    同时有 --slow-clients 个慢速客户端上传大文件
+
+用法：python bench/asgi_vs_wsgi.py [--duration 10] [--concurrency 8] [--slow-clients 4] [--workers 2]
+需要安装 gunicorn 与 uvicorn
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+import catalog
+
+BOUNDARY = 'benchboundary'
+
+
+def setup(workdir, file_mb, images):
+    """建立合成目录并上传大文件，返回 (令牌, 大文件路径)"""
+    app, _ = catalog.prepare(images, workdir)
+    client = app.test_client()
+    token = catalog.login(client)
+    headers = {'x-access-token': token}
+    big = client.post('/upload', headers=headers,
+                      data={'file': (io.BytesIO(os.urandom(file_mb << 20)), 'big.jpg')}).json['id']
+    url = client.get(f'/query?id={big}', headers=headers).json[0]['img_url']
+    return token, '/' + url
+
+
+def start_server(kind, port, workers):
+    env = dict(os.environ, PYTHONPATH=catalog.ROOT)
+    if kind == 'wsgi':
+        cmd = ['gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'wsgi:appx']
+    else:
+        cmd = ['uvicorn', 'asgi:asgi_app', '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port),
+               '--log-level', 'warning']
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            time.sleep(1)  # 等待所有 worker 启动
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'{kind} server did not start')
+
+
+async def fast_request(port, path, token, timeout):
+    """发送一个请求并读取完整响应，返回 (状态码, 耗时)"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\nx-access-token: {token}\r\n'
+                     f'Connection: close\r\n\r\n'.encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1]), time.perf_counter() - start
+
+
+async def fast_client(port, path, token, stop_at, timeout, latencies, errors):
+    while time.perf_counter() < stop_at:
+        try:
+            status, latency = await fast_request(port, path, token, timeout)
+            if status == 200:
+                latencies.append(latency)
+            else:
+                errors.append(status)
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError) as e:
+            errors.append(type(e).__name__)
+
+
+def _slow_socket(port):
+    # 接收缓冲区较小，使服务端无法一次写完响应
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+    sock.setblocking(False)
+    return sock
+
+
+async def slow_download(port, url, rate):
+    while True:
+        sock = _slow_socket(port)
+        await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+        reader, writer = await asyncio.open_connection(sock=sock)
+        writer.write(f'GET {url} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        while await reader.read(16 * 1024):
+            await asyncio.sleep(16 * 1024 / rate)
+        writer.close()
+
+
+async def slow_upload(port, token, size, rate):
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="slow.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode()
+    tail = f'\r\n--{BOUNDARY}--\r\n'.encode()
+    while True:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'POST /upload HTTP/1.1\r\nHost: bench\r\nx-access-token: {token}\r\n'
+                     f'Content-Type: multipart/form-data; boundary={BOUNDARY}\r\n'
+                     f'Content-Length: {len(head) + size + len(tail)}\r\nConnection: close\r\n\r\n'.encode() + head)
+        chunk = os.urandom(16 * 1024)
+        for _ in range(size // len(chunk)):
+            writer.write(chunk)
+            await writer.drain()
+            await asyncio.sleep(len(chunk) / rate)
+        writer.write(tail)
+        await reader.read()
+        writer.close()
+
+
+async def run_scenario(port, args, token, big_url, scenario):
+    background = []
+    if scenario == 'download':
+        background = [asyncio.ensure_future(slow_download(port, big_url, args.slow_rate))
+                      for _ in range(args.slow_clients)]
+    elif scenario == 'upload':
+        background = [asyncio.ensure_future(slow_upload(port, token, args.file_mb << 20, args.slow_rate))
+                      for _ in range(args.slow_clients)]
+    await asyncio.sleep(1 if background else 0)
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + args.duration
+    await asyncio.gather(*(fast_client(port, '/query?limit=20', token, stop_at, args.timeout, latencies, errors)
+                           for _ in range(args.concurrency)))
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    return summarize(latencies, errors, args.duration)
+
+
+def summarize(latencies, errors, duration):
+    result = {'requests': len(latencies), 'rps': round(len(latencies) / duration, 1), 'errors': len(errors)}
+    if len(latencies) >= 2:
+        quantiles = statistics.quantiles(latencies, n=100)
+        result.update(p50_ms=round(quantiles[49] * 1000, 1), p95_ms=round(quantiles[94] * 1000, 1),
+                      max_ms=round(max(latencies) * 1000, 1))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=10, help='每个场景的持续秒数')
+    parser.add_argument('--concurrency', type=int, default=8, help='快速请求并发数')
+    parser.add_argument('--slow-clients', type=int, default=4, help='慢速客户端数')
+    parser.add_argument('--slow-rate', type=int, default=256 * 1024, help='慢速客户端速率（字节/秒）')
+    parser.add_argument('--file-mb', type=int, default=32, help='大文件大小（MB）')
+    parser.add_argument('--images', type=int, default=200, help='数据库中的图像数')
+    parser.add_argument('--workers', type=int, default=2, help='服务进程数')
+    parser.add_argument('--timeout', type=float, default=10, help='快速请求超时秒数')
+    parser.add_argument('--servers', default='wsgi,asgi')
+    parser.add_argument('--scenarios', default='idle,download,upload')
+    parser.add_argument('--json', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    workdir = tempfile.mkdtemp(prefix='sarms-bench-')
+    token, big_url = setup(workdir, args.file_mb, args.images)
+    results = {}
+    for port, kind in enumerate(args.servers.split(','), start=18000):
+        proc = start_server(kind, port, args.workers)
+        try:
+            for scenario in args.scenarios.split(','):
+                result = asyncio.run(run_scenario(port, args, token, big_url, scenario))
+                results[f'{kind}/{scenario}'] = result
+                print(f'{kind:5} {scenario:9} ' + ' '.join(f'{k}={v}' for k, v in result.items()), flush=True)
+        finally:
+            proc.terminate()
+            proc.wait()
+    shutil.rmtree(workdir, ignore_errors=True)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""合成基准测试数据：在工作目录中建立数据库、图像文件及 label.pkl
+
+prepare() 须在导入 app / view 之前调用：数据库地址在导入 config 时从 DATABASE_URL 读取，
+label.pkl 按当前目录查找
+"""
+import hashlib
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_EMAIL = 'bench@example.com'
+BENCH_PASSWORD = 'bench'
+INSERT_CHUNK = 10000
+# 感知哈希按簇生成：同一簇内为少量位不同的近似图像，接近连续拍摄的真实数据
+PHASH_CLUSTER_SIZE = 50
+PHASH_CLUSTER_FLIPS = 6
+
+
+def prepare(images, workdir=None, seed=0, labeled_ratio=0.6, files=16, days=365, label_db=False):
+    """建立工作目录并写入 images 张合成图像，返回 (app, 工作目录)
+
+    图像名为 0000000.jpg 起的序号，约 labeled_ratio 的图像带 1~3 类标签；
+    所有图像轮流引用 files 个真实的 JPEG 文件
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='sarms-bench-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    from utils import CATEGORIES, convert_label_pickle
+
+    rng = random.Random(seed)
+    labels = {}
+    for i in range(images):
+        if rng.random() < labeled_ratio:
+            tag_ids = rng.sample(sorted(CATEGORIES), rng.randint(1, min(3, len(CATEGORIES))))
+            tags = {tid: rng.randint(1, 5) for tid in tag_ids}
+            labels[image_name(i)] = {'tags': tags, 'box': {tid: [_random_box(rng) for _ in range(num)]
+                                                           for tid, num in tags.items()}}
+    os.makedirs('label', exist_ok=True)
+    with open('label/label.pkl', 'wb') as fb:
+        pickle.dump(labels, fb)
+    if label_db:
+        convert_label_pickle('label/label.pkl', 'label/label.db')
+
+    from flask_migrate import upgrade
+    from app import create_app
+    from model import db, User, initialize_tags, rebuild_stats
+
+    app = create_app()
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        initialize_tags()
+        user = User(name='bench', password=BENCH_PASSWORD, email=BENCH_EMAIL)
+        db.session.add(user)
+        db.session.commit()
+        md5s = _write_files(files, rng)
+        _insert_images(images, labels, md5s, user.id, days, rng)
+        rebuild_stats()
+    return app, workdir
+
+
+def image_name(i):
+    return f"{i:07d}.jpg"
+
+
+def login(client):
+    """以基准测试用户登录，返回访问令牌"""
+    return client.post('/login', json={'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}).json['token']
+
+
+def random_jpeg(rng, size=256):
+    pixels = np.random.default_rng(rng.getrandbits(32)).integers(0, 256, (size, size, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', pixels)[1].tobytes()
+
+
+def near_hash(phash, flips, rng):
+    """翻转 phash 中随机 flips 位"""
+    for bit in rng.sample(range(64), flips):
+        phash ^= 1 << bit
+    return phash
+
+
+def _random_box(rng):
+    return [rng.randint(0, 200), rng.randint(0, 200), rng.randint(4, 56), rng.randint(4, 56)]
+
+
+def _write_files(count, rng):
+    from model import db, File
+    from config import FILE_SAVE_FOLDER
+
+    os.makedirs(FILE_SAVE_FOLDER, exist_ok=True)
+    md5s = []
+    for _ in range(count):
+        data = random_jpeg(rng)
+        md5_hash = hashlib.md5(data).hexdigest()
+        path = f"{FILE_SAVE_FOLDER}/{md5_hash}.jpg"
+        with open(path, 'wb') as f:
+            f.write(data)
+        db.session.add(File(md5=md5_hash, path=path, refs=0))
+        md5s.append(md5_hash)
+    db.session.commit()
+    return md5s
+
+
+def _insert_images(count, labels, md5s, author_id, days, rng):
+    from sqlalchemy import insert
+    from model import db, Image, ImageTag, File, phash_values
+    from config import FILE_ROUTE
+
+    start = time.time()
+    now = datetime.now()
+    refs = dict.fromkeys(md5s, 0)
+    centers = [rng.getrandbits(64) for _ in range(max(1, count // PHASH_CLUSTER_SIZE))]
+    for offset in range(0, count, INSERT_CHUNK):
+        rows, tag_rows = [], []
+        for i in range(offset, min(offset + INSERT_CHUNK, count)):
+            name = image_name(i)
+            md5_hash = md5s[i % len(md5s)]
+            refs[md5_hash] += 1
+            row = {
+                'id': uuid.UUID(int=rng.getrandbits(128), version=4),
+                'img_url': f"{FILE_ROUTE}/{md5_hash}",
+                'img_date': now - timedelta(seconds=rng.randint(0, days * 86400)),
+                'img_md5': md5_hash,
+                'img_name': name,
+                'is_labeled': name in labels,
+                'labeled_image_url': None,
+                'labeled_image_md5': None,
+                'author_id': author_id,
+                **phash_values(near_hash(rng.choice(centers), rng.randint(0, PHASH_CLUSTER_FLIPS), rng)),
+            }
+            if name in labels:
+                tag_rows.extend({'tag_id': tid, 'image_id': row['id'], 'num': num}
+                                for tid, num in labels[name]['tags'].items())
+            rows.append(row)
+        db.session.execute(insert(Image), rows)
+        if tag_rows:
+            db.session.execute(insert(ImageTag), tag_rows)
+        db.session.commit()
+        print(f"\rinserted {offset + len(rows)}/{count} images ({time.time() - start:.0f}s)",
+              end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    for md5_hash, ref_count in refs.items():
+        File.query.filter_by(md5=md5_hash).update({File.refs: max(ref_count, 1)})
+    db.session.commit()
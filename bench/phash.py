@@ -0,0 +1,97 @@
+"""感知哈希近似检索基准：在合成目录上比较分段索引检索（Image.find_similar）与线性扫描
+
+  indexed  Image.find_similar，按各段哈希的索引取候选
+  scan     从数据库读出全部哈希后逐个比较（不建索引时的做法）
+  memory   全部哈希常驻进程内存、NumPy 向量化比较（多 worker 间无法保持同步，仅作下限参考）
+
+合成哈希按簇分布（见 catalog.PHASH_CLUSTER_SIZE），查询为已有哈希随机翻转若干位，
+并以 memory 的结果校验 indexed 的结果。
+
+用法：python bench/phash.py [--images 100000] [--queries 200] [--distances 4,8,12] [--json out.json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import time
+import numpy as np
+import catalog
+
+SCAN_QUERIES = 5  # scan 较慢，每个距离只测少量查询
+
+
+def memory_scan(hashes, ids, phash, distance):
+    xor = hashes ^ np.uint64(phash)
+    distances = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+    return {ids[i] for i in np.flatnonzero(distances <= distance)}
+
+
+def summarize(latencies):
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {'p50_ms': round(quantiles[49] * 1000, 2), 'p95_ms': round(quantiles[94] * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=100000, help='合成图像数')
+    parser.add_argument('--queries', type=int, default=200, help='每个距离的查询数')
+    parser.add_argument('--distances', default='4,8,12', help='检索距离（逗号分隔）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='保留合成数据的目录（默认使用临时目录并在结束后删除）')
+    parser.add_argument('--json', help='结果写入的 JSON 文件')
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    app, workdir = catalog.prepare(args.images, args.workdir, seed=args.seed)
+    from model import db, Image, hamming_distance
+
+    def db_scan(phash, distance):
+        return {image_id for image_id, candidate in db.session.query(Image.id, Image.phash)
+                if candidate is not None and hamming_distance(phash, candidate) <= distance}
+
+    rng = random.Random(args.seed)
+    results = {}
+    try:
+        with app.app_context():
+            rows = db.session.query(Image.id, Image.phash).all()
+            ids = [image_id for image_id, _ in rows]
+            hashes = np.array([phash for _, phash in rows], dtype=np.int64).view(np.uint64)
+            for distance in (int(d) for d in args.distances.split(',')):
+                queries = [catalog.near_hash(int(hashes[rng.randrange(len(ids))]), rng.randint(0, distance), rng)
+                           for _ in range(args.queries)]
+                timings = {'indexed': [], 'scan': [], 'memory': []}
+                matches = []
+                for i, phash in enumerate(queries):
+                    start = time.perf_counter()
+                    found = Image.find_similar(phash, distance)
+                    timings['indexed'].append(time.perf_counter() - start)
+                    db.session.expunge_all()
+                    if i < SCAN_QUERIES:
+                        start = time.perf_counter()
+                        db_scan(phash, distance)
+                        timings['scan'].append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    expected = memory_scan(hashes, ids, phash, distance)
+                    timings['memory'].append(time.perf_counter() - start)
+                    if {image.id for image, _ in found} != expected:
+                        raise AssertionError(f'index and linear scan disagree for {phash:016x} at distance {distance}')
+                    matches.append(len(found))
+                result = {kind: summarize(values) for kind, values in timings.items()}
+                result['matches'] = round(statistics.mean(matches), 1)
+                results[str(distance)] = result
+                print(f"distance={distance:<3} matches={result['matches']:<6} "
+                      + ' '.join(f"{kind}: p50={result[kind]['p50_ms']}ms p95={result[kind]['p95_ms']}ms"
+                                 for kind in timings), flush=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
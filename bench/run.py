@@ -0,0 +1,333 @@
+"""API 基准测试：在合成目录上并发请求各接口，统计延迟分位数、吞吐、每请求 SQL 数及峰值内存
+
+  python bench/run.py --images 10000 --save bench/baseline.json      # 记录基线
+  python bench/run.py --images 10000 --compare bench/baseline.json   # 与基线比较，退化时返回 1
+
+--mode client 使用 Flask 测试客户端（进程内，可统计 SQL 数）；
+--mode gunicorn 启动本地 gunicorn，经 HTTP 请求，内存为各 worker 峰值 RSS 之和
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import event
+import catalog
+
+MULTIPART_BOUNDARY = 'sarmsbenchboundary'
+# 与基线比较时，p95 延迟、吞吐、SQL 数的变化超过阈值即视为退化
+COMPARE_KEYS = (('p95_ms', 1), ('rps', -1), ('queries', 1))
+
+
+def endpoints(images, md5s):
+    """接口名 -> 生成 (方法, 路径, 上传文件) 的函数"""
+    def name_query(rng):
+        # 名称前 5 位，约匹配 100 张图像
+        return 'GET', f"/query?name={catalog.image_name(rng.randrange(images))[:5]}&limit=100", None
+
+    def date_query(rng):
+        end = datetime.now() - timedelta(days=rng.randint(0, 300))
+        start = end - timedelta(days=7)
+        return 'GET', (f"/query?start_date={start.strftime('%Y-%m-%dT%H:%M:%S.%f')}"
+                       f"&end_date={end.strftime('%Y-%m-%dT%H:%M:%S.%f')}&limit=100"), None
+
+    def upload(rng):
+        return 'POST', '/upload', (f"bench-{rng.getrandbits(64):016x}.jpg", catalog.random_jpeg(rng, 64))
+
+    return {
+        'query_page': lambda rng: ('GET', '/query?limit=100', None),
+        'query_tags_any': lambda rng: ('GET', '/query?tags=ship,car&limit=100', None),
+        'query_tags_all': lambda rng: ('GET', '/query?tags=ship,aircraft&match=all&min_count=2&limit=100', None),
+        'query_name': name_query,
+        'query_date': date_query,
+        'query_stream': lambda rng: ('GET', '/query?stream=true&limit=2000', None),
+        'info': lambda rng: ('POST', '/info', None),
+        'get_file': lambda rng: ('GET', f"/image/{rng.choice(md5s)}", None),
+        'thumbnail': lambda rng: ('GET', f"/image/{rng.choice(md5s)}?w=256", None),
+        'upload': upload,
+    }
+
+
+class TestClientDriver:
+    """进程内驱动，每个线程使用独立的测试客户端，按线程统计每个请求执行的 SQL 数"""
+
+    def __init__(self, app, token):
+        from model import db
+
+        self.app = app
+        self.token = token
+        self.local = threading.local()
+        with app.app_context():
+            engine = db.engine
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count_query(*args):
+            self.local.queries = getattr(self.local, 'queries', 0) + 1
+
+    def request(self, method, path, upload):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        self.local.queries = 0
+        kwargs = {'headers': {'x-access-token': self.token}}
+        if upload:
+            kwargs['data'] = {'file': (io.BytesIO(upload[1]), upload[0])}
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()  # 流式响应在读取时才执行查询
+        response.close()
+        return response.status_code, self.local.queries
+
+    def rss_pids(self):
+        return [os.getpid()]
+
+    def close(self):
+        pass
+
+
+class GunicornDriver:
+    """启动本地 gunicorn，每个线程保持一个 HTTP 长连接"""
+
+    def __init__(self, workdir, token, workers, port):
+        self.token = token
+        self.port = port
+        self.local = threading.local()
+        env = dict(os.environ, PYTHONPATH=catalog.ROOT)
+        self.proc = subprocess.Popen(['gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'wsgi:appx'],
+                                     cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.2)
+        while len(self.rss_pids()) < workers + 1 and time.time() < deadline:
+            time.sleep(0.2)
+
+    def request(self, method, path, upload):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers, body = {'x-access-token': self.token}, None
+        if upload:
+            body = _multipart(*upload)
+            headers['Content-Type'] = f'multipart/form-data; boundary={MULTIPART_BOUNDARY}'
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            raise
+        return response.status, None
+
+    def rss_pids(self):
+        """gunicorn 主进程及其 worker"""
+        pids = [self.proc.pid]
+        for pid in os.listdir('/proc'):
+            if pid.isdigit():
+                try:
+                    with open(f'/proc/{pid}/stat') as f:
+                        if int(f.read().rsplit(')', 1)[1].split()[1]) == self.proc.pid:
+                            pids.append(int(pid))
+                except (OSError, IndexError, ValueError):
+                    continue
+        return pids
+
+    def close(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+
+class RssSampler(threading.Thread):
+    """定期采样进程 RSS 之和，记录峰值（MB）"""
+
+    def __init__(self, pids, interval=0.05):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        while not self._stop_event.is_set():
+            total = 0
+            for pid in self.pids:
+                try:
+                    with open(f'/proc/{pid}/statm') as f:
+                        total += int(f.read().split()[1]) * page_size
+                except (OSError, IndexError, ValueError):
+                    continue
+            self.peak = max(self.peak, total)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return round(self.peak / (1 << 20), 1) if self.peak else None
+
+
+def run_endpoint(driver, make_request, requests, concurrency, warmup, seed):
+    for i in range(warmup):
+        driver.request(*make_request(random.Random(seed - i - 1)))
+
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            request = make_request(random.Random(seed + i))
+            start = time.perf_counter()
+            try:
+                status, query_count = driver.request(*request)
+            except (OSError, http.client.HTTPException) as e:
+                status, query_count = type(e).__name__, None
+            latency = time.perf_counter() - start
+            with lock:
+                if status not in (200, 304):
+                    errors.append(status)
+                else:
+                    latencies.append(latency)
+                    if query_count is not None:
+                        queries.append(query_count)
+
+    sampler = RssSampler(driver.rss_pids())
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - start
+    peak_rss = sampler.stop()
+    return summarize(latencies, queries, errors, elapsed, peak_rss)
+
+
+def summarize(latencies, queries, errors, elapsed, peak_rss):
+    result = {'requests': len(latencies), 'errors': len(errors), 'rps': round(len(latencies) / elapsed, 1)}
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        result.update(p50_ms=round(cuts[49] * 1000, 2), p95_ms=round(cuts[94] * 1000, 2),
+                      p99_ms=round(cuts[98] * 1000, 2))
+    result['queries'] = round(statistics.mean(queries), 2) if queries else None
+    result['peak_rss_mb'] = peak_rss
+    if errors:
+        result['error_samples'] = sorted({str(e) for e in errors})[:5]
+    return result
+
+
+def compare(results, baseline, threshold):
+    """打印与基线的对比，返回退化项列表"""
+    regressions = []
+    print(f"\n{'endpoint':16} {'metric':8} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:16} (not in baseline)")
+            continue
+        for key, direction in COMPARE_KEYS:
+            old, new = base.get(key), current.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change * direction > threshold
+            if regressed:
+                regressions.append(f"{name}.{key}")
+            print(f"{name:16} {key:8} {old:>10} {new:>10} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def _multipart(filename, data):
+    return (f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + data + f'\r\n--{MULTIPART_BOUNDARY}--\r\n'.encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=10000, help='合成图像数（1 万 ~ 100 万）')
+    parser.add_argument('--mode', choices=('client', 'gunicorn'), default='client')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker 数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发客户端数')
+    parser.add_argument('--requests', type=int, default=200, help='每个接口的请求数')
+    parser.add_argument('--warmup', type=int, default=5, help='每个接口不计入结果的预热请求数')
+    parser.add_argument('--endpoints', help='只测试这些接口（逗号分隔）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='保留合成数据的目录（默认使用临时目录并在结束后删除）')
+    parser.add_argument('--save', help='将结果保存为 JSON 基线')
+    parser.add_argument('--compare', help='与该 JSON 基线比较')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定退化的相对变化')
+    args = parser.parse_args()
+    save_path = os.path.abspath(args.save) if args.save else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    start = time.time()
+    app, workdir = catalog.prepare(args.images, args.workdir and os.path.abspath(args.workdir), seed=args.seed)
+    print(f"catalog of {args.images} images ready in {time.time() - start:.1f}s ({workdir})", file=sys.stderr)
+    from model import File
+    with app.app_context():
+        md5s = [file.md5 for file in File.query.all()]
+    token = catalog.login(app.test_client())
+
+    if args.mode == 'client':
+        driver = TestClientDriver(app, token)
+    else:
+        driver = GunicornDriver(workdir, token, args.workers, port=18100)
+    selected = endpoints(args.images, md5s)
+    if args.endpoints:
+        selected = {name: selected[name] for name in args.endpoints.split(',')}
+
+    results = {}
+    try:
+        for name, make_request in selected.items():
+            result = run_endpoint(driver, make_request, args.requests, args.concurrency, args.warmup, args.seed)
+            results[name] = result
+            print(f"{name:16} " + ' '.join(f"{k}={v}" for k, v in result.items()), flush=True)
+    finally:
+        driver.close()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'images': args.images, 'mode': args.mode, 'workers': args.workers, 'concurrency': args.concurrency,
+            'requests': args.requests, 'seed': args.seed, 'python': platform.python_version(),
+            'machine': platform.machine(), 'date': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+    if save_path:
+        with open(save_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    if baseline is not None:
+        mismatched = [key for key in ('images', 'mode', 'workers', 'concurrency')
+                      if baseline['meta'].get(key) != report['meta'][key]]
+        if mismatched:
+            print(f"warning: baseline differs in {', '.join(mismatched)}", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
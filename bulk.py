@@ -0,0 +1,105 @@
+from collections import Counter
+from sqlalchemy import delete, exists, func, literal, select, update
+from model import db, Image, ImageTag, Box, File, IN_CLAUSE_CHUNK, record_images_stats, upsert_insert
+
+
+def _chunks(items):
+    for i in range(0, len(items), IN_CLAUSE_CHUNK):
+        yield items[i:i + IN_CLAUSE_CHUNK]
+
+
+def _image_stats(chunk):
+    """统计表所需的各图像 (img_date, is_labeled, 标签 id 列表)"""
+    tags = {}
+    for image_id, tag_id in db.session.query(ImageTag.image_id, ImageTag.tag_id).filter(ImageTag.image_id.in_(chunk)):
+        tags.setdefault(image_id, []).append(tag_id)
+    return [(img_date, is_labeled, tags.get(image_id, ()))
+            for image_id, img_date, is_labeled in
+            db.session.query(Image.id, Image.img_date, Image.is_labeled).filter(Image.id.in_(chunk))]
+
+
+def _record_stats(stats, delta):
+    # 没有日期的图像不计入统计（与 rebuild_stats 一致）
+    record_images_stats([item for item in stats if item[0] is not None], delta)
+
+
+def _execute(stmt):
+    # 批量语句不同步会话中的对象，调用方在提交前不再使用它们
+    return db.session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def delete_images(image_ids):
+    """删除图像及其标签、标签框并释放文件引用，在当前事务中执行，不提交；返回删除的图像数
+
+    引用归零的文件记入 file_tombstone，提交后由 FileCollector 删除
+    """
+    image_ids = list(image_ids)
+    stats, refs = [], Counter()
+    deleted = 0
+    for chunk in _chunks(image_ids):
+        stats.extend(_image_stats(chunk))
+        # 标签图像的引用与 is_labeled 无关：按列是否有值释放
+        for img_md5, labeled_md5 in db.session.query(
+                Image.img_md5, Image.labeled_image_md5).filter(Image.id.in_(chunk)):
+            refs.update(md5 for md5 in (img_md5, labeled_md5) if md5)
+        _execute(delete(ImageTag).where(ImageTag.image_id.in_(chunk)))
+        _execute(delete(Box).where(Box.image_id.in_(chunk)))
+        deleted += _execute(delete(Image).where(Image.id.in_(chunk))).rowcount
+    _record_stats(stats, -1)
+    File.release_many(refs)
+    return deleted
+
+
+def rename_images(image_ids, prefix='', suffix='', replace=None):
+    """批量重命名为 prefix + 原名（可先将 replace[0] 替换为 replace[1]）+ suffix，返回修改的图像数
+
+    结果超过名称长度上限时抛出 ValueError，不做修改
+    """
+    image_ids = list(image_ids)
+    new_name = Image.img_name
+    if replace:
+        new_name = func.replace(new_name, *replace)
+    new_name = literal(prefix) + new_name + literal(suffix)
+    max_length = Image.img_name.type.length
+    for chunk in _chunks(image_ids):
+        longest = db.session.query(func.max(func.length(new_name))).filter(Image.id.in_(chunk)).scalar()
+        if longest is not None and longest > max_length:
+            raise ValueError(f'Invalid rename, names must be at most {max_length} characters')
+    updated = 0
+    for chunk in _chunks(image_ids):
+        updated += _execute(update(Image).where(Image.id.in_(chunk)).values(img_name=new_name)).rowcount
+    return updated
+
+
+def retag_images(image_ids, add_tags=None, remove_tags=()):
+    """批量修改标签：add_tags 为 类别 id -> 数量（已有时覆盖数量），remove_tags 为要删除的类别 id
+
+    删除类别时一并删除该类别的标签框；is_labeled 随是否还有标签更新，变为无标签的图像同时释放并清空标签图像；
+    统计表按修改前后的差值更新。返回涉及的图像数
+    """
+    image_ids = list(image_ids)
+    add_tags = add_tags or {}
+    before, after = [], []
+    released = Counter()
+    for chunk in _chunks(image_ids):
+        before.extend(_image_stats(chunk))
+        if remove_tags:
+            _execute(delete(ImageTag).where(ImageTag.image_id.in_(chunk), ImageTag.tag_id.in_(remove_tags)))
+            _execute(delete(Box).where(Box.image_id.in_(chunk), Box.tag_id.in_(remove_tags)))
+        for tag_id, num in add_tags.items():
+            stmt = upsert_insert(ImageTag).from_select(
+                ['tag_id', 'image_id', 'num'],
+                select(literal(tag_id), Image.id, literal(num)).where(Image.id.in_(chunk)))
+            db.session.execute(stmt.on_conflict_do_update(index_elements=['tag_id', 'image_id'],
+                                                          set_={'num': stmt.excluded.num}))
+        _execute(update(Image).where(Image.id.in_(chunk)).
+                 values(is_labeled=exists().where(ImageTag.image_id == Image.id)))
+        unlabeled = (Image.id.in_(chunk), Image.is_labeled.is_(False), Image.labeled_image_url.isnot(None))
+        released.update(md5 for (md5,) in db.session.query(Image.labeled_image_md5).filter(*unlabeled) if md5)
+        # 渲染中的任务（labeled_image_url 为 render/<id>）完成时不再关联到该图像
+        _execute(update(Image).where(*unlabeled).values(labeled_image_url=None, labeled_image_md5=None))
+        after.extend(_image_stats(chunk))
+    _record_stats(before, -1)
+    _record_stats(after, 1)
+    File.release_many(released)
+    return len(before)
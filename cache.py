@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存，超过 maxsize 时淘汰最久未使用的项
+
+    给定 sizeof 时按 sizeof(value) 之和计算容量（如字节数），否则每项计为 1
+    """
+
+    def __init__(self, maxsize=1024, sizeof=None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self._size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self._size -= self._sizeof(self._data[key])
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._size += self._sizeof(value)
+            while self._size > self.maxsize and self._data:
+                self._size -= self._sizeof(self._data.popitem(last=False)[1])
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self._size -= self._sizeof(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def _sizeof(self, value):
+        return self.sizeof(value) if self.sizeof else 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TTLCache(LRUCache):
+    """带过期时间的 LRU 缓存，过期项在读取时视为不存在"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        item = super().get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires <= time.monotonic():
+            self.pop(key)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        super().set(key, (time.monotonic() + ttl, value))
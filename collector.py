@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+from sqlalchemy import event
+from model import db, File, FileTombstone
+
+logger = logging.getLogger(__name__)
+
+COLLECT_BATCH = 100  # 每个事务处理的墓碑数
+
+
+class FileCollector:
+    """删除引用归零的文件
+
+    File.release_many 在删除 File 记录的同一事务中写入 file_tombstone，提交后唤醒后台线程删除文件。
+    墓碑行的删除、确认内容未被重新登记与删除文件在同一事务中完成，进程中断后剩余的墓碑在下次启动后处理；
+    多个进程同时处理时每个墓碑只由一个进程删除
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['file_collector'] = self
+        app.before_request(self._start_once)
+        event.listen(db.session, 'do_orm_execute', self._track_tombstones)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def wake(self):
+        """在后台线程中处理所有墓碑，线程在首次调用时创建"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='file-collector', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def collect(self, batch_size=COLLECT_BATCH):
+        """删除所有墓碑对应的文件，返回删除的文件数"""
+        removed = 0
+        last_md5 = ''
+        while True:
+            tombstones = db.session.query(FileTombstone.md5, FileTombstone.path). \
+                filter(FileTombstone.md5 > last_md5).order_by(FileTombstone.md5).limit(batch_size).all()
+            if not tombstones:
+                break
+            last_md5 = tombstones[-1][0]
+            for md5, path in tombstones:
+                # 删除墓碑行即取得写锁/行锁，重新登记同一内容的 File.acquire 会等待本事务结束
+                if not db.session.query(FileTombstone).filter(FileTombstone.md5 == md5). \
+                        delete(synchronize_session=False):
+                    continue
+                if File.query.filter_by(md5=md5).first() is not None:
+                    continue
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning('failed to remove %s: %s', path, e)
+            db.session.commit()
+        return removed
+
+    def _start_once(self):
+        # 处理上次退出前未完成的墓碑
+        if not self._started:
+            self._started = True
+            self.wake()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    removed = self.collect()
+                if removed:
+                    logger.info('removed %d unreferenced files', removed)
+            except Exception:
+                logger.exception('file collection failed')
+
+    @staticmethod
+    def _track_tombstones(orm_execute_state):
+        if orm_execute_state.is_insert:
+            table = getattr(orm_execute_state.statement, 'table', None)
+            if table is not None and table.name == FileTombstone.__tablename__:
+                orm_execute_state.session.info['file_tombstones'] = True
+
+    def _after_commit(self, session):
+        if session.info.pop('file_tombstones', False):
+            self.wake()
+
+    @staticmethod
+    def _after_rollback(session):
+        session.info.pop('file_tombstones', None)
@@ -0,0 +1,224 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import exists, insert
+from model import db, User, RefreshToken, Image, Box, File, ImportRecord, rebuild_stats, store_phashes
+from utils import allowed_file, convert_label_pickle, perceptual_hash
+from ingest import prepare_import, add_images, discard_staged
+
+stats_cli = AppGroup('stats', help='统计表维护')
+
+
+@stats_cli.command('rebuild')
+def rebuild_stats_command():
+    """根据现有图片数据全量重建 /info 统计表"""
+    days, tags = rebuild_stats()
+    click.echo(f"Rebuilt stats: {days} days, {tags} tags.")
+
+
+files_cli = AppGroup('files', help='文件存储维护')
+
+
+@files_cli.command('gc')
+def collect_files_command():
+    """删除引用已归零的文件（通常由服务的后台线程完成）"""
+    removed = current_app.extensions['file_collector'].collect()
+    click.echo(f"Removed {removed} unreferenced files.")
+
+
+tokens_cli = AppGroup('tokens', help='刷新令牌维护')
+
+
+@tokens_cli.command('prune')
+@click.option('--keep-revoked-days', default=7, show_default=True, help='已吊销令牌的保留天数，保留期内可检测重放')
+def prune_tokens_command(keep_revoked_days):
+    """删除已过期及吊销超过保留期的刷新令牌"""
+    removed = RefreshToken.prune(timedelta(days=keep_revoked_days))
+    db.session.commit()
+    click.echo(f"Removed {removed} refresh tokens.")
+
+
+render_cli = AppGroup('render', help='标签框渲染任务')
+
+
+@render_cli.command('resume')
+@click.option('--requeue-running', is_flag=True, help='同时重新执行中断的 running 任务（需先停止服务）')
+def resume_render_command(requeue_running):
+    """执行所有未完成的渲染任务并等待结束"""
+    render_queue = current_app.extensions['render_queue']
+    if requeue_running:
+        click.echo(f"Requeued {render_queue.requeue_running()} running jobs.")
+    render_queue.resume()
+    render_queue.shutdown(wait=True)
+    click.echo("Render jobs finished.")
+
+
+labels_cli = AppGroup('labels', help='标签数据')
+
+
+@labels_cli.command('convert')
+@click.argument('label_pkl', default='label/label.pkl')
+@click.argument('label_db', required=False)
+def convert_labels_command(label_pkl, label_db):
+    """将 label.pkl 转换为按图像名查询的 SQLite 标签索引（默认写入同名 .db）"""
+    label_db = label_db or str(Path(label_pkl).with_suffix('.db'))
+    count = convert_label_pickle(label_pkl, label_db)
+    click.echo(f"Converted {count} labels to {label_db}.")
+
+
+boxes_cli = AppGroup('boxes', help='标签框索引')
+
+
+@boxes_cli.command('backfill')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='每个事务处理的图像数')
+@click.option('--rebuild', is_flag=True, help='先删除已有的标签框再全部重新写入')
+def backfill_boxes_command(batch_size, rebuild):
+    """根据标签数据为已有的带标签图像写入标签框，可中断后重新执行以继续"""
+    if rebuild:
+        db.session.query(Box).delete()
+        db.session.commit()
+    sar_tools = current_app.extensions['render_queue'].sar_tools
+    pending = db.session.query(Image.id, Image.img_name). \
+        filter(Image.is_labeled, ~exists().where(Box.image_id == Image.id)).order_by(Image.id)
+    images = boxes = 0
+    last_id = None
+    while True:
+        batch = (pending if last_id is None else pending.filter(Image.id > last_id)).limit(batch_size).all()
+        if not batch:
+            break
+        labels = sar_tools.get_labels(name for _, name in batch)
+        rows = [row for image_id, name in batch if name in labels
+                for row in Box.rows(image_id, labels[name].get('box') or {})]
+        if rows:
+            db.session.execute(insert(Box), rows)
+        db.session.commit()
+        last_id = batch[-1][0]
+        images += len(batch)
+        boxes += len(rows)
+        click.echo(f"Processed {images} images, {boxes} boxes written.")
+    click.echo(f"Done: {boxes} boxes written for {images} images.")
+
+
+phash_cli = AppGroup('phash', help='感知哈希索引')
+
+
+@phash_cli.command('backfill')
+@click.option('--workers', type=int, default=os.cpu_count(), show_default=True, help='解码图像的进程数')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='每个事务处理的文件数')
+def backfill_phash_command(workers, batch_size):
+    """为没有感知哈希的已有图像计算并写入，相同内容只计算一次，可中断后重新执行"""
+    pending = db.session.query(Image.img_md5).filter(Image.phash.is_(None), Image.img_md5.isnot(None)). \
+        distinct().order_by(Image.img_md5)
+    files = failed = 0
+    last_md5 = None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        while True:
+            batch = [md5 for (md5,) in (pending if last_md5 is None else pending.filter(Image.img_md5 > last_md5)).
+                     limit(batch_size)]
+            if not batch:
+                break
+            paths = dict(db.session.query(File.md5, File.path).filter(File.md5.in_(batch)))
+            md5s = [md5 for md5 in batch if md5 in paths]
+            hashes = {}
+            for md5, phash in zip(md5s, pool.map(perceptual_hash, [paths[md5] for md5 in md5s])):
+                if phash is None:
+                    failed += 1
+                    continue
+                hashes[md5] = phash
+            store_phashes(hashes)
+            db.session.commit()
+            last_md5 = batch[-1]
+            files += len(batch)
+            click.echo(f"Processed {files} files.")
+    click.echo(f"Done: {files} files processed, {failed} could not be decoded.")
+
+
+def _discard_futures(futures):
+    """取消尚未开始的 prepare_import 任务，删除已完成任务暂存的文件"""
+    for future in futures:
+        future.cancel()
+    for future in futures:
+        if future.cancelled() or future.exception() is not None:
+            continue
+        item = future.result()
+        if 'error' not in item:
+            discard_staged([item])
+
+
+@click.command('import-images')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--author', 'author_email', required=True, help='图像作者（已注册用户的邮箱）')
+@click.option('--workers', type=int, default=os.cpu_count(), show_default=True, help='复制与渲染进程数')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='每个事务写入的图像数')
+def import_images_command(directory, author_email, workers, batch_size):
+    """从目录批量导入图像，可中断后重新执行以继续导入"""
+    author = User.query.filter(User.email == author_email).first()
+    if author is None:
+        raise click.ClickException(f"User {author_email} not found.")
+    sar_tools = current_app.extensions['render_queue'].sar_tools
+
+    root = os.path.abspath(directory)
+    sources = sorted(os.path.join(dirpath, name)
+                     for dirpath, _, names in os.walk(root) for name in names if allowed_file(name))
+    done = {source for (source,) in db.session.query(ImportRecord.source).
+            filter(ImportRecord.source.startswith(root + os.sep))}
+    todo = [source for source in sources if source not in done]
+    click.echo(f"{len(sources)} images found, {len(done)} already imported, {len(todo)} to import.")
+
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    imported = failed = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        def submit(batch):
+            labels = sar_tools.get_labels(os.path.basename(source) for source in batch)
+            futures = [pool.submit(prepare_import, source, labels.get(os.path.basename(source), {}).get('box'))
+                       for source in batch]
+            return labels, futures
+
+        # 当前批次写库时，下一批次已在进程池中处理
+        pending = submit(batches[0]) if batches else None
+        futures = None
+        try:
+            for index in range(len(batches)):
+                labels, futures = pending
+                pending = submit(batches[index + 1]) if index + 1 < len(batches) else None
+                items = [future.result() for future in futures]
+                futures = None  # 此后暂存文件由 add_images 移入存储目录或由 discard_staged 删除
+                staged = [item for item in items if 'error' not in item]
+                for item in items:
+                    if 'error' in item:
+                        click.echo(f"Failed {item['source']}: {item['error']}", err=True)
+                try:
+                    rows, _ = add_images(staged, author.id, labels)
+                    if rows:
+                        db.session.execute(insert(ImportRecord), [{'source': item['source'], 'image_id': row['id']}
+                                                                  for item, row in zip(staged, rows)])
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    discard_staged(staged)
+                    raise
+                imported += len(staged)
+                failed += len(items) - len(staged)
+                click.echo(f"Imported {imported}/{len(todo)} images.")
+        finally:
+            # 中断时删除尚未写入的批次（含已提交给进程池的下一批次）暂存的文件
+            for batch_futures in (futures, pending and pending[1]):
+                if batch_futures:
+                    _discard_futures(batch_futures)
+    click.echo(f"Done: {imported} imported, {failed} failed.")
+
+
+def register_commands(app):
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(render_cli)
+    app.cli.add_command(labels_cli)
+    app.cli.add_command(boxes_cli)
+    app.cli.add_command(phash_cli)
+    app.cli.add_command(files_cli)
+    app.cli.add_command(tokens_cli)
+    app.cli.add_command(import_images_command)
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows：只在进程内互斥
+    fcntl = None
+
+RESCAN_FRACTION = 0.01  # 每个进程写入超过上限的该比例后重新扫描目录大小
+
+
+class DerivativeCache:
+    """内容寻址的派生图像缓存（缩略图等）
+
+    文件名由缓存键的哈希决定，命中时更新 mtime，总大小超过上限时按 mtime 淘汰最久未用的文件；
+    对同一键的并发请求（包括多个 worker 进程）只渲染一次：渲染前取得目标文件旁 <文件名>.lock 的 flock，
+    其余请求等待后直接使用结果。目录总大小由扫描目录得到，多个进程共享同一上限
+    """
+
+    def __init__(self, app=None, config_prefix='DERIVATIVE_CACHE'):
+        self.config_prefix = config_prefix
+        self.folder = None
+        self.max_bytes = 0
+        self._unscanned = None  # 本进程自上次扫描目录后写入的字节数，None 表示尚未扫描
+        self._guard = threading.Lock()
+        self._locks = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # 以配置前缀区分多个实例，如 RESPONSE_CACHE_FOLDER / RESPONSE_CACHE_MAX_BYTES
+        self.folder = app.config[f'{self.config_prefix}_FOLDER']
+        self.max_bytes = app.config[f'{self.config_prefix}_MAX_BYTES']
+        app.extensions[self.config_prefix.lower()] = self
+
+    def get(self, key: str, ext: str, render) -> str:
+        """返回键对应的缓存文件路径，不存在时调用 render() 生成文件内容"""
+        path = self._path(key, ext)
+        if self._touch(path):
+            return path
+        with self._key_lock(path), self._file_lock(path):
+            if self._touch(path):  # 等待期间已由其他请求或进程生成
+                return path
+            self._write(path, render())
+        return path
+
+    def lookup(self, key: str, ext: str) -> str | None:
+        """返回已缓存文件的路径，不存在时返回 None"""
+        path = self._path(key, ext)
+        return path if self._touch(path) else None
+
+    def put(self, key: str, ext: str, data: bytes):
+        self._write(self._path(key, ext), data)
+
+    def _path(self, key, ext):
+        return os.path.join(self.folder, hashlib.sha1(key.encode()).hexdigest() + ext)
+
+    def _write(self, path, data):
+        Path(self.folder).mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.part')
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        self._added(len(data))
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def _key_lock(self, key):
+        with self._guard:
+            lock, waiters = self._locks.get(key, (threading.Lock(), 0))
+            self._locks[key] = (lock, waiters + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._guard:
+                lock, waiters = self._locks[key]
+                if waiters == 1:
+                    del self._locks[key]
+                else:
+                    self._locks[key] = (lock, waiters - 1)
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(path):
+        """跨进程的键锁：持有 <path>.lock 的 flock，释放前删除锁文件
+
+        等待期间锁文件可能已被持有者删除并由其他进程重新创建，取得锁后确认锁住的仍是当前的锁文件
+        """
+        if fcntl is None:
+            yield
+            return
+        lock_path = path + '.lock'
+        Path(lock_path).parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_ino == os.stat(lock_path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        try:
+            yield
+        finally:
+            os.unlink(lock_path)
+            os.close(fd)
+
+    def _added(self, size):
+        # 目录大小每次都扫描代价较高：各进程写入累计超过上限的 RESCAN_FRACTION 后才重新扫描，
+        # 因此 N 个进程时最多超出上限 N * RESCAN_FRACTION
+        with self._guard:
+            if self._unscanned is not None:
+                self._unscanned += size
+                if self._unscanned < self.max_bytes * RESCAN_FRACTION:
+                    return
+            self._unscanned = 0
+            entries = list(self._entries())
+            if sum(size for _, size, _ in entries) > self.max_bytes:
+                self._evict(entries)
+
+    def _entries(self):
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith(('.part', '.lock')):
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime
+                except FileNotFoundError:  # 其他进程同时淘汰
+                    continue
+
+    def _evict(self, entries):
+        # 淘汰到上限的 90%，避免每次写入都触发淘汰
+        entries.sort(key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
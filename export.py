@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import zipfile
+from datetime import datetime
+from model import db, Box, IN_CLAUSE_CHUNK
+from utils import CATEGORIES, image_size
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('coco', 'yolo')
+READ_CHUNK = 1 << 20  # 读取原始文件的块大小
+TEXT_CHUNK = 64 * 1024  # 标注文本攒够该大小后写入 zip
+
+
+class _ZipOutput:
+    """只写输出流：zipfile 写入的数据暂存于此，由生成器逐段取出
+
+    没有 tell/seek，zipfile 按不可定位的流写入：条目头之后用数据描述符记录 CRC 与大小
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def stream_dataset(batches, fmt):
+    """逐段生成数据集 zip：images/ 下为原始文件，另附 COCO（annotations/instances.json）或
+    YOLO（labels/*.txt 与 data.yaml）标注，标注来自 box 表
+
+    batches 逐批给出 (图像 id, 名称, 文件路径)。不生成临时文件，图像以 stored 方式写入，
+    单个条目或整个 zip 超过 4GB 时自动使用 ZIP64；内存占用与条目数成正比（zip 中央目录），与文件大小无关
+    """
+    output = _ZipOutput()
+    class_index = {tid: i for i, tid in enumerate(sorted(CATEGORIES))}
+    used_names = set()
+    exported = []  # COCO：(图像 id, 文件名, 宽, 高)，所有图像写完后再写标注
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED, strict_timestamps=False) as zf:
+        for batch in batches:
+            boxes = _boxes_by_image([image_id for image_id, _, _ in batch]) if fmt == 'yolo' else None
+            for image_id, img_name, path in batch:
+                try:
+                    size = image_size(path)
+                    if size is None:
+                        logger.warning('export: skipped unreadable image %s', path)
+                        continue
+                    name = _archive_name(img_name, path, used_names)
+                    yield from _write_file(zf, output, path, f'images/{name}')
+                except FileNotFoundError:  # 导出过程中被删除
+                    logger.warning('export: skipped missing file %s', path)
+                    continue
+                if fmt == 'yolo':
+                    label = _yolo_label(boxes.get(image_id, ()), size, class_index)
+                    zf.writestr(f'labels/{os.path.splitext(name)[0]}.txt', label, zipfile.ZIP_DEFLATED)
+                else:
+                    exported.append((image_id, name, *size))
+                yield from output.drain()
+
+        if fmt == 'yolo':
+            zf.writestr('data.yaml', _yolo_data_yaml(class_index), zipfile.ZIP_DEFLATED)
+        else:
+            yield from _write_coco(zf, output, exported, class_index)
+    yield from output.drain()
+
+
+def _archive_name(img_name, path, used_names):
+    """zip 中的文件名：图像名（去掉路径分隔符，扩展名与存储的文件一致），同名时追加序号
+
+    YOLO 按文件名主干对应标注文件，因此按主干去重
+    """
+    ext = os.path.splitext(path)[1].lower()
+    stem = (img_name or '').replace('/', '_').replace('\\', '_')
+    if os.path.splitext(stem)[1].lower() == ext:
+        stem = os.path.splitext(stem)[0]
+    stem = stem.strip('.') or 'image'
+    candidate, n = stem, 1
+    while candidate.lower() in used_names:
+        n += 1
+        candidate = f'{stem}_{n}'
+    used_names.add(candidate.lower())
+    return candidate + ext
+
+
+def _write_file(zf, output, path, arcname):
+    # 先取大小，条目需要时使用 ZIP64；CRC 在写入时计算
+    info = zipfile.ZipInfo.from_file(path, arcname)
+    with open(path, 'rb') as src, zf.open(info, 'w') as dst:
+        while chunk := src.read(READ_CHUNK):
+            dst.write(chunk)
+            yield from output.drain()
+
+
+def _boxes_by_image(image_ids):
+    """各图像的标签框 {图像 id: [(类别 id, x, y, w, h)]}"""
+    boxes = {}
+    for i in range(0, len(image_ids), IN_CLAUSE_CHUNK):
+        chunk = image_ids[i:i + IN_CLAUSE_CHUNK]
+        for image_id, tag_id, x, y, w, h in db.session.query(
+                Box.image_id, Box.tag_id, Box.x, Box.y, Box.w, Box.h). \
+                filter(Box.image_id.in_(chunk)).order_by(Box.image_id, Box.id):
+            boxes.setdefault(image_id, []).append((tag_id, x, y, w, h))
+    return boxes
+
+
+def _yolo_label(boxes, size, class_index):
+    # 每行：类别序号 中心x 中心y 宽 高（按图像尺寸归一化）；没有标签框的图像为空文件
+    width, height = size
+    return ''.join(f'{class_index[tag_id]} {(x + w / 2) / width:.6f} {(y + h / 2) / height:.6f} '
+                   f'{w / width:.6f} {h / height:.6f}\n'
+                   for tag_id, x, y, w, h in boxes if tag_id in class_index)
+
+
+def _yolo_data_yaml(class_index):
+    names = ''.join(f'  {i}: {CATEGORIES[tid]}\n' for tid, i in class_index.items())
+    return f'path: .\ntrain: images\nval: images\nnc: {len(class_index)}\nnames:\n{names}'
+
+
+def _write_coco(zf, output, exported, class_index):
+    """逐段写入 COCO 标注：images 数组之后按批查询标签框写入 annotations 数组；类别与图像编号从 1 开始"""
+    info = zipfile.ZipInfo('annotations/instances.json', datetime.now().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    # 标注文件大小未知，预留 ZIP64 字段
+    with zf.open(info, 'w', force_zip64=True) as dst:
+        writer = _TextWriter(dst, output)
+        categories = [{'id': i + 1, 'name': CATEGORIES[tid]} for tid, i in class_index.items()]
+        yield from writer.write('{"info": %s, "categories": %s, "images": [' % (
+            json.dumps({'description': 'SARMS dataset export', 'date_created': datetime.now().isoformat()}),
+            json.dumps(categories, ensure_ascii=False)))
+        for number, (_, name, width, height) in enumerate(exported, 1):
+            item = {'id': number, 'file_name': name, 'width': width, 'height': height}
+            yield from writer.write(('' if number == 1 else ', ') + json.dumps(item, ensure_ascii=False))
+        yield from writer.write('], "annotations": [')
+        annotation_id = 0
+        for start in range(0, len(exported), IN_CLAUSE_CHUNK):
+            chunk = exported[start:start + IN_CLAUSE_CHUNK]
+            boxes = _boxes_by_image([image_id for image_id, _, _, _ in chunk])
+            for number, (image_id, _, _, _) in enumerate(chunk, start + 1):
+                for tag_id, x, y, w, h in boxes.get(image_id, ()):
+                    if tag_id not in class_index:
+                        continue
+                    annotation_id += 1
+                    item = {'id': annotation_id, 'image_id': number, 'category_id': class_index[tag_id] + 1,
+                            'bbox': [x, y, w, h], 'area': w * h, 'iscrowd': 0}
+                    yield from writer.write(('' if annotation_id == 1 else ', ') + json.dumps(item))
+        yield from writer.write(']}')
+        yield from writer.flush()
+
+
+class _TextWriter:
+    """把小段文本攒成块再写入 zip 条目，减少压缩器调用"""
+
+    def __init__(self, dst, output):
+        self.dst = dst
+        self.output = output
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= TEXT_CHUNK:
+            yield from self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.dst.write(''.join(self._parts).encode())
+            self._parts, self._size = [], 0
+        yield from self.output.drain()
@@ -0,0 +1,217 @@
+import io
+import os
+import tarfile
+import uuid
+import zipfile
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import insert
+from werkzeug.utils import secure_filename
+from model import db, Image, ImageTag, Box, File, RenderJob, record_images_stats, phash_values, IN_CLAUSE_CHUNK
+from utils import save_stream, encode_boxes, perceptual_hash
+from config import FILE_SAVE_FOLDER, FILE_ROUTE
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+class ArchiveLimitError(ValueError):
+    """压缩包超出 ARCHIVE_MAX_* 限制"""
+
+
+class _LimitedReader:
+    """读取压缩包成员时累计解压后的字节数，超过单个成员或整个压缩包的限制时抛出 ArchiveLimitError"""
+
+    def __init__(self, stream, name, max_bytes, budget):
+        self.stream, self.name, self.max_bytes, self.budget = stream, name, max_bytes, budget
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.read_bytes += len(data)
+        self.budget['remaining'] -= len(data)
+        if self.read_bytes > self.max_bytes:
+            raise ArchiveLimitError(f'Archive member {self.name} exceeds {self.max_bytes} bytes')
+        if self.budget['remaining'] < 0:
+            raise ArchiveLimitError(f'Archive exceeds {self.budget["max_bytes"]} uncompressed bytes')
+        return data
+
+
+def iter_archive(file, max_members, max_member_bytes, max_total_bytes):
+    """逐个产出压缩包中的 (文件名, 文件流)，tar 以流式方式读取
+
+    成员数、单个成员大小（按声明大小预先检查）及解压后的总字节数（读取时累计）超过限制时抛出 ArchiveLimitError
+    """
+    budget = {'remaining': max_total_bytes, 'max_bytes': max_total_bytes}
+
+    def members(entries):
+        for count, (name, size, open_member) in enumerate(entries, 1):
+            if count > max_members:
+                raise ArchiveLimitError(f'Archive contains more than {max_members} files')
+            if size > max_member_bytes:
+                raise ArchiveLimitError(f'Archive member {name} exceeds {max_member_bytes} bytes')
+            if size > budget['remaining']:
+                raise ArchiveLimitError(f'Archive exceeds {max_total_bytes} uncompressed bytes')
+            with open_member() as member:
+                # 声明的大小可能与实际不符，读取时再按实际字节数限制
+                yield os.path.basename(name), _LimitedReader(member, name, max_member_bytes, budget)
+
+    if file.filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(file.stream) as zf:
+            yield from members((info.filename, info.file_size, lambda info=info: zf.open(info))
+                               for info in zf.infolist() if not info.is_dir())
+    else:
+        with tarfile.open(fileobj=file.stream, mode='r|*') as tf:
+            yield from members((member.name, member.size, lambda member=member: tf.extractfile(member))
+                               for member in tf if member.isfile())
+
+
+def stage_file(stream, filename):
+    """流式保存到临时文件并计算MD5，返回供 add_images 使用的条目"""
+    md5_hash, tmp_path = save_stream(stream, FILE_SAVE_FOLDER)
+    return staged_entry(filename, md5_hash, tmp_path)
+
+
+def staged_entry(filename, md5_hash, tmp_path):
+    _, ext = os.path.splitext(secure_filename(filename))
+    return {'name': filename, 'md5': md5_hash, 'tmp_path': tmp_path, 'ext': ext}
+
+
+def hash_staged(item):
+    """计算暂存文件的感知哈希，需解码图像，不应在事务中执行"""
+    item['phash'] = perceptual_hash(item['tmp_path'])
+    return item['phash']
+
+
+def render_staged(item, boxes):
+    """渲染标签图像到暂存文件，结果记为 item['labeled']，与原始文件一样在登记后才移入存储目录"""
+    data = encode_boxes(boxes, item['tmp_path'])
+    md5_hash, tmp_path = save_stream(io.BytesIO(data), FILE_SAVE_FOLDER)
+    item['labeled'] = {'md5': md5_hash, 'tmp_path': tmp_path, 'ext': '.jpg'}
+
+
+def prepare_import(source, boxes=None):
+    """离线导入的进程池任务：复制并计算MD5与感知哈希，有标签框时同时渲染标签图像
+
+    出错时删除已暂存的文件并返回带 'error' 的条目而不抛出，避免单个文件中断整个导入
+    """
+    item = None
+    try:
+        with open(source, 'rb') as stream:
+            item = stage_file(stream, os.path.basename(source))
+        hash_staged(item)
+        if boxes:
+            render_staged(item, boxes)
+    except Exception as e:
+        if item is not None:
+            discard_staged([item])
+        return {'source': source, 'error': str(e)}
+    item['source'] = source
+    return item
+
+
+def discard_staged(staged):
+    """删除未被采用的暂存文件（含渲染的标签图像）
+
+    事务回滚后调用时，add_images 已移入存储目录、但回滚后没有 File 记录的文件一并删除
+    """
+    stored = {}
+    for item in staged:
+        for entry in (item, item.get('labeled')):
+            if not entry:
+                continue
+            if entry.get('tmp_path') and os.path.exists(entry['tmp_path']):
+                os.remove(entry['tmp_path'])
+            if entry.get('stored_path'):
+                stored[entry['md5']] = entry.pop('stored_path')
+    md5s = list(stored)
+    for i in range(0, len(md5s), IN_CLAUSE_CHUNK):
+        chunk = md5s[i:i + IN_CLAUSE_CHUNK]
+        for (md5_hash,) in db.session.query(File.md5).filter(File.md5.in_(chunk)):
+            del stored[md5_hash]
+    for path in stored.values():
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _store_staged(entries):
+    """按内容登记 File 引用，新内容的暂存文件移入存储目录，返回 md5 -> 存储路径
+
+    相同内容只登记一次，引用数为出现次数；移入的文件记为 'stored_path'，供回滚后的 discard_staged 删除
+    """
+    first_entries = {}
+    for entry in entries:
+        first_entries.setdefault(entry['md5'], entry)
+    stored_paths = {}
+    for md5_hash, count in Counter(entry['md5'] for entry in entries).items():
+        entry = first_entries[md5_hash]
+        path, created = File.acquire(md5_hash, f"{FILE_SAVE_FOLDER}/{md5_hash}{entry['ext']}", count)
+        if created:
+            os.replace(entry['tmp_path'], path)
+            entry['stored_path'] = path
+        stored_paths[md5_hash] = path
+    # 未移入的暂存文件（重复内容或已有记录）
+    for entry in entries:
+        if os.path.exists(entry['tmp_path']):
+            os.remove(entry['tmp_path'])
+    return stored_paths
+
+
+def add_images(staged, author_id, labels):
+    """在当前事务中写入一批图像，不提交
+
+    staged 为 stage_file 返回的条目，可带 'labeled'（render_staged 渲染的标签图像）与 'phash'（hash_staged 的结果）；
+    labels 为 图像名 -> 标签数据。File 按内容登记引用计数，Image、ImageTag、Box 批量插入，
+    统计表按键聚合后更新。返回 (图像行列表, 渲染任务列表)，渲染任务需在提交后提交给 RenderQueue
+    """
+    if not staged:
+        return [], []
+    img_date = datetime.now()
+
+    stored_paths = _store_staged(staged)
+    _store_staged([item['labeled'] for item in staged if item.get('labeled')])
+
+    rows, tag_rows, box_rows, jobs = [], [], [], []
+    for item in staged:
+        label = labels.get(item['name'])
+        row = {
+            'id': uuid.uuid4(),
+            'img_url': f"{FILE_ROUTE}/{item['md5']}",
+            'img_date': img_date,
+            'img_md5': item['md5'],
+            'img_name': item['name'],
+            'is_labeled': label is not None,
+            'labeled_image_url': None,
+            'labeled_image_md5': None,
+            'author_id': author_id,
+            **phash_values(item.get('phash')),
+        }
+        if label is not None:
+            tag_rows.extend({'tag_id': tid, 'image_id': row['id'], 'num': num} for tid, num in label['tags'].items())
+            box_rows.extend(Box.rows(row['id'], label.get('box') or {}))
+            if item.get('labeled'):
+                row['labeled_image_md5'] = item['labeled']['md5']
+                row['labeled_image_url'] = f"{FILE_ROUTE}/{item['labeled']['md5']}"
+            elif label.get('box'):  # 没有标签框时无需渲染
+                jobs.append(RenderJob(image_id=row['id'], image_name=item['name'],
+                                      src_path=stored_paths[item['md5']]))
+        rows.append(row)
+
+    if jobs:
+        # 先写入渲染任务以获得任务 id，标签图像渲染完成前 labeled_image_url 指向任务
+        db.session.add_all(jobs)
+        db.session.flush()
+        row_by_id = {row['id']: row for row in rows}
+        for job in jobs:
+            row_by_id[job.image_id]['labeled_image_url'] = f"render/{job.id}"
+    db.session.execute(insert(Image), rows)
+    if tag_rows:
+        db.session.execute(insert(ImageTag), tag_rows)
+    if box_rows:
+        db.session.execute(insert(Box), box_rows)
+    record_images_stats((img_date, row['is_labeled'], labels[row['img_name']]['tags'] if row['is_labeled'] else ())
+                        for row in rows)
+    return rows, jobs
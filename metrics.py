@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import Response, g, has_app_context, has_request_context, request, current_app
+from sqlalchemy import event
+from model import db
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class _Metric:
+    """按标签值分组的指标，标签名在创建时固定"""
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            items = sorted((key, _copy(value)) for key, value in self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self, key, value):
+        return [f'{self.name}_total{self._format_labels(key)} {_number(value)}']
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各桶计数（非累计）、总和、次数
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, key, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else _number(bound)
+            lines.append(f'{self.name}_bucket{self._format_labels(key, [("le", le)])} {cumulative}')
+        lines.append(f'{self.name}_sum{self._format_labels(key)} {_number(total)}')
+        lines.append(f'{self.name}_count{self._format_labels(key)} {count}')
+        return lines
+
+
+class Metrics:
+    """请求与数据库指标
+
+    记录各接口的请求耗时、SQL 条数与耗时、请求体字节数，以及渲染耗时，
+    以 Prometheus 文本格式在 /metrics 提供，并在响应中添加 Server-Timing 头；
+    耗时超过 SLOW_QUERY_MS 的 SQL 写入日志。指标保存在进程内，多 worker 部署时各自独立
+    """
+
+    def __init__(self, app=None):
+        self.slow_query_ms = None
+        self.requests = Counter('sarms_http_requests', 'HTTP requests', ('endpoint', 'method', 'status'))
+        self.request_duration = Histogram('sarms_http_request_duration_seconds', 'HTTP request duration',
+                                          ('endpoint', 'method'))
+        self.request_bytes = Counter('sarms_http_request_bytes', 'HTTP request body bytes', ('endpoint',))
+        self.request_queries = Histogram('sarms_db_queries_per_request', 'SQL statements per request',
+                                         ('endpoint',), COUNT_BUCKETS)
+        self.query_duration = Histogram('sarms_db_query_duration_seconds', 'SQL statement duration')
+        self.slow_queries = Counter('sarms_db_slow_queries', 'SQL statements slower than SLOW_QUERY_MS')
+        self.render_duration = Histogram('sarms_render_duration_seconds', 'Label box rendering time in worker')
+        self.render_jobs = Counter('sarms_render_jobs', 'Finished render jobs', ('status',))
+        self.derivative_duration = Histogram('sarms_derivative_render_seconds', 'Thumbnail rendering time',
+                                             ('fmt',))
+        self.overlay_duration = Histogram('sarms_overlay_render_seconds', 'Label overlay rendering time',
+                                          ('base',))
+        self.response_cache = Counter('sarms_response_cache_requests', 'Response cache lookups',
+                                      ('endpoint', 'result'))
+        self._metrics = [self.requests, self.request_duration, self.request_bytes, self.request_queries,
+                         self.query_duration, self.slow_queries, self.render_duration, self.render_jobs,
+                         self.derivative_duration, self.overlay_duration, self.response_cache]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+        self.slow_query_ms = app.config['SLOW_QUERY_MS']
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def record_request(self, endpoint, method, status, duration, request_bytes=0):
+        """记录一个请求（ASGI 入口中不经过 Flask 的请求也调用此方法）"""
+        self.requests.inc(endpoint=endpoint, method=method, status=status)
+        self.request_duration.observe(duration, endpoint=endpoint, method=method)
+        if request_bytes:
+            self.request_bytes.inc(request_bytes, endpoint=endpoint)
+
+    def export(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    @staticmethod
+    def _before_request():
+        g.metrics_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+
+    def _after_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        duration = time.perf_counter() - g.metrics_start
+        endpoint = request.endpoint or 'unmatched'
+        self.record_request(endpoint, request.method, response.status_code, duration, request.content_length)
+        self.request_queries.observe(g.sql_count, endpoint=endpoint)
+        # 流式响应的查询在返回后才执行，不计入
+        response.headers.add('Server-Timing', f'db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_count} queries"')
+        response.headers.add('Server-Timing', f'app;dur={duration * 1000:.1f}')
+        return response
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        self.query_duration.observe(elapsed)
+        if has_request_context() and 'sql_count' in g:
+            g.sql_count += 1
+            g.sql_seconds += elapsed
+        if elapsed * 1000 >= self.slow_query_ms:
+            self.slow_queries.inc()
+            endpoint = request.endpoint if has_request_context() else None
+            log = current_app.logger if has_app_context() else logger
+            log.warning('slow query %.1fms (%s): %s', elapsed * 1000, endpoint, ' '.join(statement.split()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _copy(value):
+    return [list(value[0])] + value[1:] if isinstance(value, list) else value
+
+
+metrics = Metrics()
@@ -0,0 +1,23 @@
+"""image md5 index
+
+Revision ID: 2d7a9c4e5f10
+Revises: 6b3f0d2c8a57
+Create Date: 2026-10-18 11:58:23.604115
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7a9c4e5f10'
+down_revision = '6b3f0d2c8a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_image_img_md5'), 'image', ['img_md5'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_image_img_md5'), table_name='image')
@@ -0,0 +1,67 @@
+"""image name fts
+
+Revision ID: 3f1b6d0e9a42
+Revises: 7c17fcea9fc8
+Create Date: 2026-10-18 11:02:40.153207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1b6d0e9a42'
+down_revision = '7c17fcea9fc8'
+branch_labels = None
+depends_on = None
+
+# image 表没有 INTEGER PRIMARY KEY，VACUUM 可能改变其 rowid，
+# 因此用 image_name_fts_rowid 保存稳定的 rowid <-> image_id 映射
+STATEMENTS = [
+    "CREATE VIRTUAL TABLE image_name_fts USING fts5(img_name, tokenize='trigram')",
+    "CREATE TABLE image_name_fts_rowid (rowid INTEGER PRIMARY KEY, image_id CHAR(32) NOT NULL UNIQUE)",
+    """CREATE TRIGGER image_name_fts_ai AFTER INSERT ON image BEGIN
+        INSERT INTO image_name_fts_rowid (image_id) VALUES (new.id);
+        INSERT INTO image_name_fts (rowid, img_name) VALUES (last_insert_rowid(), new.img_name);
+    END""",
+    """CREATE TRIGGER image_name_fts_ad AFTER DELETE ON image BEGIN
+        DELETE FROM image_name_fts WHERE rowid =
+            (SELECT rowid FROM image_name_fts_rowid WHERE image_id = old.id);
+        DELETE FROM image_name_fts_rowid WHERE image_id = old.id;
+    END""",
+    """CREATE TRIGGER image_name_fts_au AFTER UPDATE OF img_name ON image BEGIN
+        UPDATE image_name_fts SET img_name = new.img_name WHERE rowid =
+            (SELECT rowid FROM image_name_fts_rowid WHERE image_id = new.id);
+    END""",
+    "INSERT INTO image_name_fts_rowid (image_id) SELECT id FROM image",
+    """INSERT INTO image_name_fts (rowid, img_name)
+        SELECT m.rowid, image.img_name FROM image_name_fts_rowid AS m JOIN image ON image.id = m.image_id""",
+]
+
+
+def _fts5_trigram_supported(bind):
+    try:
+        bind.exec_driver_sql("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x, tokenize='trigram')")
+        bind.exec_driver_sql("DROP TABLE temp._fts5_probe")
+        return True
+    except sa.exc.OperationalError:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    # 非 SQLite 或 SQLite 未编译 FTS5 / trigram（3.34 以前）时不建索引，查询退化为 LIKE
+    if bind.dialect.name != 'sqlite' or not _fts5_trigram_supported(bind):
+        return
+    for statement in STATEMENTS:
+        op.execute(statement)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    for trigger in ('image_name_fts_ai', 'image_name_fts_ad', 'image_name_fts_au'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS image_name_fts_rowid")
+    op.execute("DROP TABLE IF EXISTS image_name_fts")
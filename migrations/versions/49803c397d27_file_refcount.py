@@ -0,0 +1,35 @@
+"""file refcount
+
+Revision ID: 49803c397d27
+Revises: d1d7d19e76a8
+Create Date: 2026-10-18 10:42:01.147495
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '49803c397d27'
+down_revision = 'd1d7d19e76a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('file', sa.Column('refs', sa.Integer(), server_default='1', nullable=False))
+
+    # 引用计数取引用该内容的图片数，再合并重复上传产生的同 MD5 记录
+    op.execute("""UPDATE file SET refs =
+        (SELECT COUNT(*) FROM image WHERE image.img_md5 = file.md5) +
+        (SELECT COUNT(*) FROM image WHERE image.labeled_image_md5 = file.md5)""")
+    op.execute("DELETE FROM file WHERE id NOT IN (SELECT MIN(id) FROM file GROUP BY md5)")
+    op.execute("UPDATE file SET refs = 1 WHERE refs < 1")
+
+    op.create_index(op.f('ix_file_md5'), 'file', ['md5'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_file_md5'), table_name='file')
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.drop_column('refs')
@@ -0,0 +1,29 @@
+"""import records
+
+Revision ID: 5a2c8e7b1d03
+Revises: bf18f5d99962
+Create Date: 2026-10-18 10:52:13.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a2c8e7b1d03'
+down_revision = 'bf18f5d99962'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_record',
+    sa.Column('source', sa.String(length=255), nullable=False),
+    sa.Column('image_id', sa.Uuid(), nullable=True),
+    sa.Column('imported_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('source')
+    )
+
+
+def downgrade():
+    op.drop_table('import_record')
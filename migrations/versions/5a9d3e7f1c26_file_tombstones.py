@@ -0,0 +1,29 @@
+"""file tombstones
+
+Revision ID: 5a9d3e7f1c26
+Revises: 8f5e1b7c3d94
+Create Date: 2026-10-18 12:58:21.604137
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9d3e7f1c26'
+down_revision = '8f5e1b7c3d94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('file_tombstone',
+    sa.Column('md5', sa.String(length=32), nullable=False),
+    sa.Column('path', sa.String(length=100), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('md5')
+    )
+
+
+def downgrade():
+    op.drop_table('file_tombstone')
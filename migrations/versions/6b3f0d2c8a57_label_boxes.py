@@ -0,0 +1,80 @@
+"""label boxes
+
+Revision ID: 6b3f0d2c8a57
+Revises: c4e81a2f7b36
+Create Date: 2026-10-18 11:41:07.318520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '6b3f0d2c8a57'
+down_revision = 'c4e81a2f7b36'
+branch_labels = None
+depends_on = None
+
+# box.id 为 INTEGER PRIMARY KEY（即 rowid），R*Tree 使用相同的 id；
+# 面积与类别 id 作为上下界相同的维度，便于与坐标条件一起在索引中检索
+STATEMENTS = [
+    """CREATE VIRTUAL TABLE box_rtree USING rtree_i32(
+        id, min_x, max_x, min_y, max_y, min_area, max_area, min_tag, max_tag, +image_id)""",
+    """CREATE TRIGGER box_rtree_ai AFTER INSERT ON box BEGIN
+        INSERT INTO box_rtree VALUES (new.id, new.x, new.x + new.w, new.y, new.y + new.h,
+            new.area, new.area, new.tag_id, new.tag_id, new.image_id);
+    END""",
+    """CREATE TRIGGER box_rtree_ad AFTER DELETE ON box BEGIN
+        DELETE FROM box_rtree WHERE id = old.id;
+    END""",
+    """CREATE TRIGGER box_rtree_au AFTER UPDATE ON box BEGIN
+        DELETE FROM box_rtree WHERE id = old.id;
+        INSERT INTO box_rtree VALUES (new.id, new.x, new.x + new.w, new.y, new.y + new.h,
+            new.area, new.area, new.tag_id, new.tag_id, new.image_id);
+    END""",
+]
+
+
+def _rtree_supported(bind):
+    # 辅助列（+image_id）需 SQLite 3.24 及以上
+    try:
+        bind.exec_driver_sql("CREATE VIRTUAL TABLE temp._rtree_probe USING rtree_i32(id, x0, x1, +aux)")
+        bind.exec_driver_sql("DROP TABLE temp._rtree_probe")
+        return True
+    except sa.exc.OperationalError:
+        return False
+
+
+def upgrade():
+    op.create_table('box',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('image_id', sa.Uuid(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('x', sa.Integer(), nullable=False),
+    sa.Column('y', sa.Integer(), nullable=False),
+    sa.Column('w', sa.Integer(), nullable=False),
+    sa.Column('h', sa.Integer(), nullable=False),
+    sa.Column('area', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['image_id'], ['image.id'], ),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_box_image_id'), 'box', ['image_id'], unique=False)
+    op.create_index('ix_box_tag_id_area', 'box', ['tag_id', 'area'], unique=False)
+
+    bind = op.get_bind()
+    # 非 SQLite 或 SQLite 未编译 R*Tree 时不建索引，查询使用 box 表的索引
+    if bind.dialect.name != 'sqlite' or not _rtree_supported(bind):
+        return
+    for statement in STATEMENTS:
+        op.execute(statement)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for trigger in ('box_rtree_ai', 'box_rtree_ad', 'box_rtree_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS box_rtree")
+    op.drop_index('ix_box_tag_id_area', table_name='box')
+    op.drop_index(op.f('ix_box_image_id'), table_name='box')
+    op.drop_table('box')
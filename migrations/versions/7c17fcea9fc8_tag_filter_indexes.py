@@ -0,0 +1,25 @@
+"""tag filter indexes
+
+Revision ID: 7c17fcea9fc8
+Revises: 8c9e2eb2a331
+Create Date: 2026-10-18 10:39:11.870681
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7c17fcea9fc8'
+down_revision = '8c9e2eb2a331'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_image_img_date'), 'image', ['img_date'], unique=False)
+    op.create_index('ix_tags_image_id_tag_id', 'tags', ['image_id', 'tag_id', 'num'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tags_image_id_tag_id', table_name='tags')
+    op.drop_index(op.f('ix_image_img_date'), table_name='image')
@@ -0,0 +1,67 @@
+"""initial schema
+
+Revision ID: 8c9e2eb2a331
+Revises: 
+Create Date: 2025-01-02 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8c9e2eb2a331'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('file',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('md5', sa.String(length=32), nullable=True),
+    sa.Column('path', sa.String(length=100), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('tag',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=30), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=20), nullable=True),
+    sa.Column('password', sa.String(length=20), nullable=True),
+    sa.Column('email', sa.String(length=50), nullable=True),
+    sa.Column('permission', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email')
+    )
+    op.create_table('image',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('img_url', sa.String(length=100), nullable=True),
+    sa.Column('img_date', sa.DateTime(), nullable=True),
+    sa.Column('img_md5', sa.String(length=50), nullable=True),
+    sa.Column('img_name', sa.String(length=30), nullable=True),
+    sa.Column('is_labeled', sa.Boolean(), nullable=True),
+    sa.Column('labeled_image_url', sa.String(length=100), nullable=True),
+    sa.Column('labeled_image_md5', sa.String(length=50), nullable=True),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('tags',
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('image_id', sa.Uuid(), nullable=False),
+    sa.Column('num', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['image_id'], ['image.id'], ),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ),
+    sa.PrimaryKeyConstraint('tag_id', 'image_id')
+    )
+
+
+def downgrade():
+    op.drop_table('tags')
+    op.drop_table('image')
+    op.drop_table('user')
+    op.drop_table('tag')
+    op.drop_table('file')
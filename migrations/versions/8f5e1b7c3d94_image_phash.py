@@ -0,0 +1,33 @@
+"""image phash
+
+Revision ID: 8f5e1b7c3d94
+Revises: 2d7a9c4e5f10
+Create Date: 2026-10-18 12:16:52.470391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f5e1b7c3d94'
+down_revision = '2d7a9c4e5f10'
+branch_labels = None
+depends_on = None
+
+PARTS = ('phash_0', 'phash_1', 'phash_2', 'phash_3')
+
+
+def upgrade():
+    op.add_column('image', sa.Column('phash', sa.BigInteger(), nullable=True))
+    for name in PARTS:
+        op.add_column('image', sa.Column(name, sa.Integer(), nullable=True))
+        op.create_index(op.f(f'ix_image_{name}'), 'image', [name], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('image', schema=None) as batch_op:
+        for name in PARTS:
+            batch_op.drop_index(batch_op.f(f'ix_image_{name}'))
+            batch_op.drop_column(name)
+        batch_op.drop_column('phash')
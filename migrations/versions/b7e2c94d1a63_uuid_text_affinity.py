@@ -0,0 +1,168 @@
+"""uuid text affinity
+
+Revision ID: b7e2c94d1a63
+Revises: 5a9d3e7f1c26
+Create Date: 2026-10-18 14:07:45.218934
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c94d1a63'
+down_revision = '5a9d3e7f1c26'
+branch_labels = None
+depends_on = None
+
+# 早期版本的迁移在 SQLite 上把图像 id 列声明为 UUID（NUMERIC 亲和性），形如数字的十六进制 id 会被转换为数值；
+# 这些迁移现已改为 sa.Uuid()（CHAR(32)），本迁移只转换按旧迁移建立的数据库。PostgreSQL 为原生 uuid，无需修改
+
+# 表名 -> (新建表语句, 复制的列, 索引)，与 5a9d3e7f1c26 时的表结构一致，仅 id 列改为 CHAR(32)
+TABLES = {
+    'image': ("""CREATE TABLE _image_new (
+        id CHAR(32) NOT NULL,
+        img_url VARCHAR(100),
+        img_date DATETIME,
+        img_md5 VARCHAR(50),
+        img_name VARCHAR(30),
+        is_labeled BOOLEAN,
+        labeled_image_url VARCHAR(100),
+        labeled_image_md5 VARCHAR(50),
+        author_id INTEGER,
+        phash BIGINT,
+        phash_0 INTEGER,
+        phash_1 INTEGER,
+        phash_2 INTEGER,
+        phash_3 INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY(author_id) REFERENCES user (id)
+    )""", ['id', 'img_url', 'img_date', 'img_md5', 'img_name', 'is_labeled', 'labeled_image_url',
+           'labeled_image_md5', 'author_id', 'phash', 'phash_0', 'phash_1', 'phash_2', 'phash_3'], [
+        "CREATE INDEX ix_image_img_date ON image (img_date)",
+        "CREATE INDEX ix_image_img_md5 ON image (img_md5)",
+        "CREATE INDEX ix_image_phash_0 ON image (phash_0)",
+        "CREATE INDEX ix_image_phash_1 ON image (phash_1)",
+        "CREATE INDEX ix_image_phash_2 ON image (phash_2)",
+        "CREATE INDEX ix_image_phash_3 ON image (phash_3)",
+    ]),
+    'tags': ("""CREATE TABLE _tags_new (
+        tag_id INTEGER NOT NULL,
+        image_id CHAR(32) NOT NULL,
+        num INTEGER,
+        PRIMARY KEY (tag_id, image_id),
+        FOREIGN KEY(image_id) REFERENCES image (id),
+        FOREIGN KEY(tag_id) REFERENCES tag (id)
+    )""", ['tag_id', 'image_id', 'num'], [
+        "CREATE INDEX ix_tags_image_id_tag_id ON tags (image_id, tag_id, num)",
+    ]),
+    'box': ("""CREATE TABLE _box_new (
+        id INTEGER NOT NULL,
+        image_id CHAR(32) NOT NULL,
+        tag_id INTEGER NOT NULL,
+        x INTEGER NOT NULL,
+        y INTEGER NOT NULL,
+        w INTEGER NOT NULL,
+        h INTEGER NOT NULL,
+        area INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(image_id) REFERENCES image (id),
+        FOREIGN KEY(tag_id) REFERENCES tag (id)
+    )""", ['id', 'image_id', 'tag_id', 'x', 'y', 'w', 'h', 'area'], [
+        "CREATE INDEX ix_box_image_id ON box (image_id)",
+        "CREATE INDEX ix_box_tag_id_area ON box (tag_id, area)",
+    ]),
+    'render_job': ("""CREATE TABLE _render_job_new (
+        id INTEGER NOT NULL,
+        image_id CHAR(32),
+        image_name VARCHAR(30),
+        src_path VARCHAR(100),
+        status VARCHAR(10) NOT NULL,
+        result_md5 VARCHAR(32),
+        error VARCHAR(200),
+        created_at DATETIME,
+        finished_at DATETIME,
+        PRIMARY KEY (id)
+    )""", ['id', 'image_id', 'image_name', 'src_path', 'status', 'result_md5', 'error', 'created_at',
+           'finished_at'], [
+        "CREATE INDEX ix_render_job_image_id ON render_job (image_id)",
+        "CREATE INDEX ix_render_job_status ON render_job (status)",
+    ]),
+    'import_record': ("""CREATE TABLE _import_record_new (
+        source VARCHAR(255) NOT NULL,
+        image_id CHAR(32),
+        imported_at DATETIME,
+        PRIMARY KEY (source)
+    )""", ['source', 'image_id', 'imported_at'], []),
+    # 全文索引的映射表，SQLite 不支持 FTS5 时不存在
+    'image_name_fts_rowid': (
+        "CREATE TABLE _image_name_fts_rowid_new (rowid INTEGER PRIMARY KEY, image_id CHAR(32) NOT NULL UNIQUE)",
+        ['rowid', 'image_id'], []),
+}
+
+# 删除旧表时其上的触发器随之删除，需重新创建（语句同 3f1b6d0e9a42、6b3f0d2c8a57）
+FTS_TRIGGERS = [
+    """CREATE TRIGGER image_name_fts_ai AFTER INSERT ON image BEGIN
+        INSERT INTO image_name_fts_rowid (image_id) VALUES (new.id);
+        INSERT INTO image_name_fts (rowid, img_name) VALUES (last_insert_rowid(), new.img_name);
+    END""",
+    """CREATE TRIGGER image_name_fts_ad AFTER DELETE ON image BEGIN
+        DELETE FROM image_name_fts WHERE rowid =
+            (SELECT rowid FROM image_name_fts_rowid WHERE image_id = old.id);
+        DELETE FROM image_name_fts_rowid WHERE image_id = old.id;
+    END""",
+    """CREATE TRIGGER image_name_fts_au AFTER UPDATE OF img_name ON image BEGIN
+        UPDATE image_name_fts SET img_name = new.img_name WHERE rowid =
+            (SELECT rowid FROM image_name_fts_rowid WHERE image_id = new.id);
+    END""",
+]
+RTREE_TRIGGERS = [
+    """CREATE TRIGGER box_rtree_ai AFTER INSERT ON box BEGIN
+        INSERT INTO box_rtree VALUES (new.id, new.x, new.x + new.w, new.y, new.y + new.h,
+            new.area, new.area, new.tag_id, new.tag_id, new.image_id);
+    END""",
+    """CREATE TRIGGER box_rtree_ad AFTER DELETE ON box BEGIN
+        DELETE FROM box_rtree WHERE id = old.id;
+    END""",
+    """CREATE TRIGGER box_rtree_au AFTER UPDATE ON box BEGIN
+        DELETE FROM box_rtree WHERE id = old.id;
+        INSERT INTO box_rtree VALUES (new.id, new.x, new.x + new.w, new.y, new.y + new.h,
+            new.area, new.area, new.tag_id, new.tag_id, new.image_id);
+    END""",
+]
+
+
+def _table_exists(bind, name):
+    return bind.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).first() is not None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    id_type = next(row[2] for row in bind.exec_driver_sql("PRAGMA table_info(image)") if row[1] == 'id')
+    if id_type.upper() != 'UUID':  # 由修正后的迁移建立
+        return
+    # 按 SQLite 文档的步骤重建表：新建、复制数据、删除旧表、改名、重建索引。
+    # 不使用 batch 模式：其复制数据时的 CAST(... AS UUID) 按 NUMERIC 转换，会把 "8074af..." 变为 8074。
+    # 已被转换为数值的 id 无法恢复，原样复制
+    for table, (create_sql, columns, indexes) in TABLES.items():
+        if not _table_exists(bind, table):
+            continue
+        names = ', '.join(columns)
+        op.execute(create_sql)
+        op.execute(f'INSERT INTO _{table}_new ({names}) SELECT {names} FROM {table}')
+        op.execute(f'DROP TABLE {table}')
+        op.execute(f'ALTER TABLE _{table}_new RENAME TO {table}')
+        for statement in indexes:
+            op.execute(statement)
+    if _table_exists(bind, 'image_name_fts_rowid'):
+        for statement in FTS_TRIGGERS:
+            op.execute(statement)
+    if _table_exists(bind, 'box_rtree'):
+        for statement in RTREE_TRIGGERS:
+            op.execute(statement)
+
+
+def downgrade():
+    # 之前的迁移同样声明为 CHAR(32)，无需恢复
+    pass
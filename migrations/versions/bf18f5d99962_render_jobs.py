@@ -0,0 +1,39 @@
+"""render jobs
+
+Revision ID: bf18f5d99962
+Revises: 49803c397d27
+Create Date: 2026-10-18 10:43:38.052980
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bf18f5d99962'
+down_revision = '49803c397d27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('render_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('image_id', sa.Uuid(), nullable=True),
+    sa.Column('image_name', sa.String(length=30), nullable=True),
+    sa.Column('src_path', sa.String(length=100), nullable=True),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('result_md5', sa.String(length=32), nullable=True),
+    sa.Column('error', sa.String(length=200), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_render_job_image_id'), 'render_job', ['image_id'], unique=False)
+    op.create_index(op.f('ix_render_job_status'), 'render_job', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_render_job_status'), table_name='render_job')
+    op.drop_index(op.f('ix_render_job_image_id'), table_name='render_job')
+    op.drop_table('render_job')
@@ -0,0 +1,29 @@
+"""catalog version
+
+Revision ID: c4e81a2f7b36
+Revises: 9e4d2a6f7c18
+Create Date: 2026-10-18 11:20:41.627310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e81a2f7b36'
+down_revision = '9e4d2a6f7c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalog_version = op.create_table('catalog_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(catalog_version, [{'id': 1, 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('catalog_version')
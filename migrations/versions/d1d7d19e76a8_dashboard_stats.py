@@ -0,0 +1,54 @@
+"""dashboard stats
+
+Revision ID: d1d7d19e76a8
+Revises: 3f1b6d0e9a42
+Create Date: 2026-10-18 10:40:59.048673
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1d7d19e76a8'
+down_revision = '3f1b6d0e9a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    image_daily_stat = op.create_table('image_daily_stat',
+    sa.Column('day', sa.String(length=10), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('unlabeled', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    tag_stat = op.create_table('tag_stat',
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('frequency', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ),
+    sa.PrimaryKeyConstraint('tag_id')
+    )
+
+    # 回填已有数据，日期在 Python 中格式化以兼容不同数据库
+    bind = op.get_bind()
+    days = {}
+    rows = sa.text("SELECT img_date, is_labeled FROM image WHERE img_date IS NOT NULL"). \
+        columns(sa.column('img_date', sa.DateTime), sa.column('is_labeled', sa.Boolean))
+    for img_date, is_labeled in bind.execute(rows):
+        day = days.setdefault(img_date.strftime('%Y-%m-%d'), [0, 0])
+        day[0] += 1
+        if not is_labeled:
+            day[1] += 1
+    if days:
+        op.bulk_insert(image_daily_stat, [{'day': day, 'total': total, 'unlabeled': unlabeled}
+                                          for day, (total, unlabeled) in days.items()])
+    frequencies = bind.execute(sa.text(
+        "SELECT tag_id, COUNT(image_id) FROM tags GROUP BY tag_id")).all()
+    if frequencies:
+        op.bulk_insert(tag_stat, [{'tag_id': tag_id, 'frequency': freq} for tag_id, freq in frequencies])
+
+
+def downgrade():
+    op.drop_table('tag_stat')
+    op.drop_table('image_daily_stat')
@@ -0,0 +1,25 @@
+"""render job started at
+
+Revision ID: e5c2a8d4b716
+Revises: b7e2c94d1a63
+Create Date: 2026-10-18 16:42:09.381275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c2a8d4b716'
+down_revision = 'b7e2c94d1a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('render_job', sa.Column('started_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('render_job', schema=None) as batch_op:
+        batch_op.drop_column('started_at')
@@ -1,19 +1,69 @@
+import hashlib
+import os
+import secrets
+from collections import Counter, namedtuple
+from itertools import combinations
+from functools import lru_cache
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_
-from sqlalchemy.orm import aliased
+from sqlalchemy import func, and_, or_, bindparam, column, event, exists, false, insert, inspect, select, table, \
+    text, update
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import  generate_password_hash, check_password_hash
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 import uuid
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Uuid
 from utils import CATEGORIES
+from cache import LRUCache, TTLCache
+from config import FILE_PATH_CACHE_SIZE, USER_CACHE_SIZE, USER_CACHE_TTL
 
 db = SQLAlchemy()
 
+# 图像 id 类型：PostgreSQL 为原生 uuid，其他数据库为 CHAR(32) 十六进制串；
+# SQLite 中声明为 UUID 的列为 NUMERIC 亲和性，形如数字的十六进制串（如 "4e1..."）会被转换为数值
+UUID = Uuid(as_uuid=True)
+
+# SQLite 单条语句绑定参数数量有限，IN 查询需分批
+IN_CLAUSE_CHUNK = 500
+
+# Tag 由 initialize_tags 一次性写入，进程内缓存 id -> name
+_tag_names = {}
+
+# 邮箱 -> 用户身份
+user_identity_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+# 文件内容哈希 -> 存储路径，内容寻址的文件路径不会改变
+file_path_cache = LRUCache(FILE_PATH_CACHE_SIZE)
+
+# img_name 的 FTS5 trigram 索引表，由迁移创建并通过触发器与 image 表同步
+IMAGE_NAME_FTS = 'image_name_fts'
+
+# 标签框的 R*Tree 索引表（SQLite），由迁移创建并通过触发器与 box 表同步；
+# 各维度为 x、y、面积与类别 id，面积与类别的上下界相同，附加列 image_id 免去回表
+BOX_RTREE = 'box_rtree'
+box_rtree = table(BOX_RTREE, column('id'), column('min_x'), column('max_x'), column('min_y'), column('max_y'),
+                  column('min_area'), column('max_area'), column('min_tag'), column('max_tag'),
+                  column('image_id', UUID))
+
+# 64 位感知哈希按 16 位分为 4 段分别建索引（multi-index hashing）：
+# 两个哈希距离不超过 d 时，至少有一段的距离不超过 d // 4
+PHASH_BITS = 64
+PHASH_PART_BITS = 16
+PHASH_PARTS = PHASH_BITS // PHASH_PART_BITS
+
+# (数据库地址, 表名) -> 是否存在，用于判断原生 SQL 维护的索引表是否已建立
+_sqlite_tables = {}
+
+
+def _chunks(items, size=IN_CLAUSE_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)  # 主键
     name = db.Column(db.String(20))  # 名字
-    password = db.Column(db.String(20))
+    password = db.Column(db.String(256))  # 密码哈希，格式为 method$salt$hash
     email = db.Column(db.String(50), unique=True)
     permission = db.Column(db.String(20))
 
@@ -22,63 +72,239 @@ class User(db.Model):
 
     def __init__(self, name, password, email):
         self.name = name
-        self.password = generate_password_hash(password)
+        self.set_password(password)
         self.email = email
         self.permission = "user"
 
+    def set_password(self, password):
+        # 哈希算法与代价由 PASSWORD_HASH_METHOD 配置
+        self.password = generate_password_hash(password, method=current_app.config['PASSWORD_HASH_METHOD'],
+                                               salt_length=current_app.config['PASSWORD_SALT_LENGTH'])
+
     def check_password(self, password):
         return check_password_hash(self.password, password)
 
+    def needs_rehash(self):
+        """已存储的哈希是否与当前配置的算法或代价不一致"""
+        return self.password.split('$', 1)[0] != _canonical_hash_method(current_app.config['PASSWORD_HASH_METHOD'])
 
-class Tag(db.Model):
+
+@lru_cache
+def _canonical_hash_method(method):
+    # 配置可省略参数（如 "pbkdf2"），以 werkzeug 实际写入的前缀为准
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+class RefreshToken(db.Model):
+    """刷新令牌，只保存令牌的 SHA-256，使用后即轮换"""
+    __tablename__ = 'refresh_token'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(30))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True, nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime)
 
     @staticmethod
-    def get_images_by_tags(tag_names: list):
-        if not tag_names:
-            # 如果标签列表为空，则返回一个空的查询对象
-            return Image.query.filter(False)
+    def hash_token(token):
+        return hashlib.sha256(token.encode()).hexdigest()
 
-        # 获取与指定标签名匹配的标签ID列表
-        tags = Tag.query.filter(Tag.name.in_(tag_names)).all()
-        if not tags:
-            return Image.query.filter(False)  # 如果没有找到匹配的标签，则返回空查询对象
+    @staticmethod
+    def issue(user_id):
+        """生成新的刷新令牌并加入当前会话，返回令牌明文"""
+        token = secrets.token_urlsafe(32)
+        db.session.add(RefreshToken(user_id=user_id, token_hash=RefreshToken.hash_token(token),
+                                    expires_at=datetime.now() + current_app.config['REFRESH_TOKEN_EXPIRES']))
+        return token
+
+    @staticmethod
+    def revoke_all(user_id):
+        RefreshToken.query.filter(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None)). \
+            update({RefreshToken.revoked_at: datetime.now()})
+
+    @staticmethod
+    def rotate(token_hash):
+        """以条件更新吊销未过期的有效令牌，返回是否吊销成功；并发使用同一令牌时只有一个请求成功"""
+        now = datetime.now()
+        return RefreshToken.query.filter(RefreshToken.token_hash == token_hash, RefreshToken.revoked_at.is_(None),
+                                         RefreshToken.expires_at > now). \
+            update({RefreshToken.revoked_at: now}, synchronize_session=False) == 1
+
+    @staticmethod
+    def prune(keep_revoked):
+        """删除已过期的令牌及吊销超过 keep_revoked 的令牌，返回删除数量（保留期内仍可检测重放）"""
+        now = datetime.now()
+        return RefreshToken.query.filter(or_(RefreshToken.expires_at <= now,
+                                             RefreshToken.revoked_at <= now - keep_revoked)). \
+            delete(synchronize_session=False)
+
+
+# 鉴权使用的用户身份，缓存在进程内，不持有数据库会话
+UserIdentity = namedtuple('UserIdentity', ['id', 'name', 'email', 'permission'])
+
+
+def get_user_identity(email):
+    """按邮箱获取用户身份，结果按 USER_CACHE_TTL 缓存，用户不存在时返回 None"""
+    identity = user_identity_cache.get(email)
+    if identity is None:
+        user = User.query.filter(User.email == email).first()
+        if user is None:
+            return None
+        identity = UserIdentity(user.id, user.name, user.email, user.permission)
+        user_identity_cache.set(email, identity)
+    return identity
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user_identity(mapper, connection, target):
+    user_identity_cache.pop(target.email)
+    history = inspect(target).attrs.email.history
+    for email in history.deleted or ():
+        user_identity_cache.pop(email)
+
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(30))
 
-        tag_ids = [tag.id for tag in tags]
+    @staticmethod
+    def images_filter(tag_names: list, match: str = 'any', min_num: int | None = None):
+        """按标签筛选图片的条件，使用 EXISTS 半连接走 tags 表索引
 
-        # 使用别名来避免命名冲突
-        image_alias = aliased(Image)
+        match='any' 时包含任一标签即可，match='all' 时需包含全部标签；
+        min_num 限定该标签在图片中的最少目标数量
+        """
+        name_to_id = {name: tid for tid, name in get_tag_names().items()}
+        tag_ids = {name_to_id[name] for name in tag_names if name in name_to_id}
+        if not tag_ids or (match == 'all' and len(tag_ids) < len(set(tag_names))):
+            return false()  # 没有匹配的标签，返回空结果
 
-        # 查询所有与这些标签关联的图片
-        images_query = db.session.query(image_alias). \
-            join(ImageTag, ImageTag.image_id == image_alias.id). \
-            filter(ImageTag.tag_id.in_(tag_ids))
+        def has_tag(condition):
+            conditions = [ImageTag.image_id == Image.id, condition]
+            if min_num is not None:
+                conditions.append(ImageTag.num >= min_num)
+            return exists().where(*conditions)
 
-        return images_query
+        if match == 'all':
+            return and_(*[has_tag(ImageTag.tag_id == tid) for tid in sorted(tag_ids)])
+        return has_tag(ImageTag.tag_id.in_(tag_ids))
 
 
 class ImageTag(db.Model):
     __tablename__ = 'tags'
     tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'), primary_key=True)
-    image_id = db.Column(UUID(as_uuid=True), db.ForeignKey('image.id'), primary_key=True, default=uuid.uuid4)
+    image_id = db.Column(UUID, db.ForeignKey('image.id'), primary_key=True, default=uuid.uuid4)
     num = db.Column(db.Integer)
+    # 主键 (tag_id, image_id) 用于按标签找图片，此索引用于按图片查标签
+    __table_args__ = (db.Index('ix_tags_image_id_tag_id', 'image_id', 'tag_id', 'num'),)
 
     # 定义与Tag和Image的关系
     tag = db.relationship('Tag', backref=db.backref('image_associations', cascade='all, delete-orphan'))
     image = db.relationship('Image', backref=db.backref('tag_associations', cascade='all, delete-orphan'))
 
 
+class Box(db.Model):
+    """标签框，坐标为原图像素，(x, y) 为左上角；SQLite 下另有 R*Tree 索引 box_rtree"""
+    __tablename__ = 'box'
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(UUID, db.ForeignKey('image.id'), nullable=False, index=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'), nullable=False)
+    x = db.Column(db.Integer, nullable=False)
+    y = db.Column(db.Integer, nullable=False)
+    w = db.Column(db.Integer, nullable=False)
+    h = db.Column(db.Integer, nullable=False)
+    area = db.Column(db.Integer, nullable=False)  # w * h
+    # 没有 R*Tree 索引时按类别与面积筛选
+    __table_args__ = (db.Index('ix_box_tag_id_area', 'tag_id', 'area'),)
+
+    image = db.relationship('Image', backref=db.backref('boxes', cascade='all, delete-orphan'))
+
+    @staticmethod
+    def rows(image_id, boxes: dict):
+        """将标签数据中的 {类别 id: [[x, y, w, h], ...]} 转为批量插入的行"""
+        rows = []
+        for tid, items in boxes.items():
+            for x, y, w, h in items:
+                x, y, w, h = int(x), int(y), int(w), int(h)
+                rows.append({'image_id': image_id, 'tag_id': tid, 'x': x, 'y': y, 'w': w, 'h': h, 'area': w * h})
+        return rows
+
+    @staticmethod
+    def for_file(md5: str, tag_ids=None):
+        """引用该文件的图像的标签框 (类别 id, x, y, w, h)，去重并按固定顺序返回；tag_ids 限定类别"""
+        query = db.session.query(Box.tag_id, Box.x, Box.y, Box.w, Box.h). \
+            join(Image, Image.id == Box.image_id).filter(Image.img_md5 == md5)
+        if tag_ids is not None:
+            query = query.filter(Box.tag_id.in_(tag_ids))
+        return [tuple(row) for row in query.distinct().order_by(Box.tag_id, Box.y, Box.x, Box.w, Box.h)]
+
+    @staticmethod
+    def images_filter(tag_names: list | None = None, min_area: int | None = None, max_area: int | None = None,
+                      region: tuple | None = None, region_match: str = 'inside', min_boxes: int = 1):
+        """按标签框筛选图片的条件：满足全部条件的框不少于 min_boxes 个
+
+        条件为框的类别、面积范围及与 region=(x1, y1, x2, y2) 的关系，region_match='inside' 时框需完全落在区域内，
+        'overlap' 时与区域相交即可。SQLite 已建立 R*Tree 索引时在 box_rtree 上检索，否则使用 box 表的索引
+        """
+        tag_ids = None
+        if tag_names:
+            name_to_id = {name: tid for tid, name in get_tag_names().items()}
+            tag_ids = sorted({name_to_id[name] for name in tag_names if name in name_to_id})
+            if not tag_ids:
+                return false()  # 没有匹配的标签，返回空结果
+
+        if box_rtree_available():
+            index = box_rtree
+            x1, x2, y1, y2 = index.c.min_x, index.c.max_x, index.c.min_y, index.c.max_y
+            conditions = []
+            if tag_ids:
+                # R*Tree 只能利用范围条件，多个类别时先按范围检索再精确过滤
+                conditions += [index.c.min_tag >= tag_ids[0], index.c.max_tag <= tag_ids[-1]]
+                if len(tag_ids) < tag_ids[-1] - tag_ids[0] + 1:
+                    conditions.append(index.c.min_tag.in_(tag_ids))
+            if min_area is not None:
+                conditions.append(index.c.min_area >= min_area)
+            if max_area is not None:
+                conditions.append(index.c.max_area <= max_area)
+            image_id = index.c.image_id
+        else:
+            x1, x2, y1, y2 = Box.x, Box.x + Box.w, Box.y, Box.y + Box.h
+            conditions = []
+            if tag_ids:
+                conditions.append(Box.tag_id.in_(tag_ids))
+            if min_area is not None:
+                conditions.append(Box.area >= min_area)
+            if max_area is not None:
+                conditions.append(Box.area <= max_area)
+            image_id = Box.image_id
+
+        if region is not None:
+            left, top, right, bottom = region
+            if region_match == 'overlap':
+                conditions += [x2 >= left, x1 <= right, y2 >= top, y1 <= bottom]
+            else:
+                conditions += [x1 >= left, x2 <= right, y1 >= top, y2 <= bottom]
+        matched = select(image_id).where(*conditions)
+        if min_boxes > 1:
+            matched = matched.group_by(image_id).having(func.count() >= min_boxes)
+        return Image.id.in_(matched)
+
+
 class Image(db.Model):
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = db.Column(UUID, primary_key=True, default=uuid.uuid4)
     img_url = db.Column(db.String(100))
-    img_date = db.Column(db.DateTime)
-    img_md5 = db.Column(db.String(50))
+    img_date = db.Column(db.DateTime, index=True)
+    img_md5 = db.Column(db.String(50), index=True)
     img_name = db.Column(db.String(30))
     is_labeled = db.Column(db.Boolean)
     labeled_image_url = db.Column(db.String(100))
     labeled_image_md5 = db.Column(db.String(50))
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    phash = db.Column(db.BigInteger)  # 感知哈希，按有符号 64 位整数存储
+    phash_0 = db.Column(db.Integer, index=True)  # 感知哈希各段，用于近似检索
+    phash_1 = db.Column(db.Integer, index=True)
+    phash_2 = db.Column(db.Integer, index=True)
+    phash_3 = db.Column(db.Integer, index=True)
 
     def __init__(self, img_date, img_name, author_id, is_labeled):
         self.img_date = img_date
@@ -93,39 +319,247 @@ class Image(db.Model):
             db.session.add(tag_image)
 
 
+    @staticmethod
+    def name_filter(name: str):
+        """按名称子串筛选，SQLite 支持 FTS5 trigram 时走全文索引，否则退化为 LIKE"""
+        # trigram 至少需要 3 个字符；含 LIKE 通配符时保持原有语义
+        if len(name) < 3 or '%' in name or '_' in name or not name_fts_available():
+            # SQLite 的 LIKE 不区分大小写，其他数据库用 ILIKE 保持一致
+            if db.engine.dialect.name == 'sqlite':
+                return Image.img_name.like(f"%{name}%")
+            return Image.img_name.ilike(f"%{name}%")
+        phrase = '"' + name.replace('"', '""') + '"'
+        matched = text(f"SELECT m.image_id FROM {IMAGE_NAME_FTS}_rowid AS m "
+                       f"JOIN {IMAGE_NAME_FTS} ON {IMAGE_NAME_FTS}.rowid = m.rowid "
+                       f"WHERE {IMAGE_NAME_FTS} MATCH :phrase").bindparams(phrase=phrase)
+        return Image.id.in_(matched.columns(image_id=Image.id.type))
+
+    @staticmethod
+    def find_similar(phash: int, distance: int, limit: int | None = None, exclude_id=None):
+        """查找感知哈希距离不超过 distance 的图像，返回按距离排序的 [(图像, 距离)]
+
+        先按各段哈希的索引取出候选哈希值（任一段距离不超过 distance // 4）并计算完整距离，
+        再只为距离符合的哈希加载图像
+        """
+        radius = distance // PHASH_PARTS
+        parts = phash_values(phash)
+        conditions = [getattr(Image, f'phash_{i}').in_(_hamming_ball(parts[f'phash_{i}'], PHASH_PART_BITS, radius))
+                      for i in range(PHASH_PARTS)]
+        candidates = db.session.query(Image.phash).filter(or_(*conditions)).distinct()
+        matched = {}
+        for (candidate,) in candidates:
+            d = hamming_distance(phash, candidate)
+            if d <= distance:
+                matched[candidate] = d
+        if not matched:
+            return []
+
+        mask = (1 << PHASH_PART_BITS) - 1
+        results = []
+        for chunk in _chunks(list(matched)):
+            # 第一段哈希走索引，完整哈希精确过滤
+            query = Image.query.filter(Image.phash_0.in_({candidate & mask for candidate in chunk}),
+                                       Image.phash.in_(chunk))
+            if exclude_id is not None:
+                query = query.filter(Image.id != exclude_id)
+            results.extend((image, matched[image.phash]) for image in query)
+        results.sort(key=lambda item: (item[1], item[0].img_date or datetime.min, item[0].id))
+        return results[:limit]
+
     @staticmethod
     def get_images_by_author(author):
         return Image.query.filter_by(author_id=author).all()
 
 
-    def __get_tags(self):
-        if not self.is_labeled:
-            return {}
-        tags =  ImageTag.query.filter_by(image_id=self.id).all()
-        tags_dict = {}
-        for tag in tags:
-            tid = tag.tag_id
-            tag_name = Tag.query.filter_by(id=tid).first().name
-            tags_dict[tag_name] = tag.num
-        return tags_dict
+    def serialize(self):
+        return Image.serialize_many([self])[0]
 
+    @staticmethod
+    def serialize_many(images):
+        """批量序列化，作者和标签按固定次数查询，避免逐行查询"""
+        images = list(images)
+        author_ids = list({image.author_id for image in images})
+        authors = {}
+        for chunk in _chunks(author_ids):
+            authors.update(db.session.query(User.id, User.name).filter(User.id.in_(chunk)).all())
+
+        tag_names = get_tag_names()
+        labeled_ids = [image.id for image in images if image.is_labeled]
+        tags_by_image = {}
+        for chunk in _chunks(labeled_ids):
+            rows = db.session.query(ImageTag.image_id, ImageTag.tag_id, ImageTag.num). \
+                filter(ImageTag.image_id.in_(chunk)).all()
+            for image_id, tag_id, num in rows:
+                tags_by_image.setdefault(image_id, {})[tag_names[tag_id]] = num
+
+        return [{
+            'id': str(image.id),
+            'img_url': image.img_url,
+            'img_date': image.img_date.isoformat() if image.img_date else None,  # 确保日期格式化为字符串
+            'img_name': image.img_name,
+            'labeled_image_url': image.labeled_image_url,
+            'author': authors.get(image.author_id),
+            'tags': tags_by_image.get(image.id, {}) if image.is_labeled else {},
+        } for image in images]
+
+class RenderJob(db.Model):
+    """标签框渲染任务，持久化以便进程重启后继续执行"""
+    __tablename__ = 'render_job'
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(UUID, index=True)
+    image_name = db.Column(db.String(30))
+    src_path = db.Column(db.String(100))
+    status = db.Column(db.String(10), index=True, nullable=False, default=PENDING)
+    result_md5 = db.Column(db.String(32))
+    error = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)  # 置为 running 的时间
+    finished_at = db.Column(db.DateTime)
+
+    def claim(self):
+        """将任务从 pending 原子地置为 running，多个进程中只有一个能成功"""
+        claimed = db.session.query(RenderJob). \
+            filter(RenderJob.id == self.id, RenderJob.status == RenderJob.PENDING). \
+            update({RenderJob.status: RenderJob.RUNNING, RenderJob.started_at: datetime.now()},
+                   synchronize_session='fetch')
+        db.session.commit()
+        return claimed == 1
+
+    @staticmethod
+    def requeue_stale(max_age):
+        """将开始超过 max_age 仍为 running 的任务（执行它的进程已退出）置为 pending，返回任务数"""
+        cutoff = datetime.now() - max_age
+        count = RenderJob.query.filter(
+            RenderJob.status == RenderJob.RUNNING,
+            or_(RenderJob.started_at < cutoff, and_(RenderJob.started_at.is_(None), RenderJob.created_at < cutoff))). \
+            update({RenderJob.status: RenderJob.PENDING}, synchronize_session=False)
+        db.session.commit()
+        return count
 
     def serialize(self):
-        author_name = User.query.filter_by(id=self.author_id).first().name
         return {
-            'id': str(self.id),
-            'img_url': self.img_url,
-            'img_date': self.img_date.isoformat() if self.img_date else None,  # 确保日期格式化为字符串
-            'img_name': self.img_name,
-            'labeled_image_url': self.labeled_image_url,
-            'author': author_name,
-            'tags': self.__get_tags(),
+            'id': self.id,
+            'image_id': str(self.image_id),
+            'status': self.status,
+            'error': self.error,
         }
 
+
+class ImportRecord(db.Model):
+    """离线导入进度，与图像记录在同一事务中写入，中断后据此跳过已导入的文件"""
+    __tablename__ = 'import_record'
+    source = db.Column(db.String(255), primary_key=True)  # 源文件绝对路径
+    image_id = db.Column(UUID)
+    imported_at = db.Column(db.DateTime, default=datetime.now)
+
+
+class ImageDailyStat(db.Model):
+    """按天汇总的图片数量，由写操作增量维护"""
+    __tablename__ = 'image_daily_stat'
+    day = db.Column(db.String(10), primary_key=True)  # YYYY-MM-DD
+    total = db.Column(db.Integer, nullable=False, default=0)
+    unlabeled = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TagStat(db.Model):
+    """每个标签关联的图片数量，由写操作增量维护"""
+    __tablename__ = 'tag_stat'
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    frequency = db.Column(db.Integer, nullable=False, default=0)
+
+
 class File(db.Model):
+    """按内容（MD5）存储的文件，相同内容只保存一份，refs 为引用它的图片数"""
     id = db.Column(db.Integer, primary_key=True)
-    md5 = db.Column(db.String(32))
+    md5 = db.Column(db.String(32), index=True, unique=True)
     path = db.Column(db.String(100))
+    refs = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    @staticmethod
+    def acquire(md5, path, count=1):
+        """增加 count 次引用，内容尚未登记时以 path 新建记录
+
+        返回 (实际存储路径, 是否新建)；新建时调用方负责把文件放到 path
+        """
+        if File._increment(md5, count):
+            return File.query.filter_by(md5=md5).first().path, False
+        try:
+            with db.session.begin_nested():
+                # 该内容刚被释放、文件尚未删除时撤销删除；FileCollector 删除同一墓碑行，二者互斥
+                db.session.query(FileTombstone).filter(FileTombstone.md5 == md5).delete(synchronize_session=False)
+                db.session.add(File(md5=md5, path=path, refs=count))
+            return path, True
+        except IntegrityError:
+            # 其他进程同时登记了相同内容
+            File._increment(md5, count)
+            return File.query.filter_by(md5=md5).first().path, False
+
+    @staticmethod
+    def release(md5):
+        """减少一次引用，见 release_many"""
+        if md5 is not None:
+            File.release_many({md5: 1})
+
+    @staticmethod
+    def release_many(counts: dict):
+        """按 md5 -> 次数批量减少引用，引用归零的记录删除并写入 file_tombstone
+
+        文件本身在事务提交后由 FileCollector 删除，事务回滚时墓碑随之回滚，不会误删文件
+        """
+        if not counts:
+            return
+        table = File.__table__
+        db.session.execute(update(table).where(table.c.md5 == bindparam('b_md5')).
+                           values(refs=table.c.refs - bindparam('b_count')),
+                           [{'b_md5': md5, 'b_count': count} for md5, count in counts.items()])
+        for chunk in _chunks(list(counts)):
+            unused = db.session.query(File.md5, File.path).filter(File.md5.in_(chunk), File.refs <= 0).all()
+            if not unused:
+                continue
+            db.session.execute(insert(FileTombstone), [{'md5': md5, 'path': path} for md5, path in unused])
+            db.session.query(File).filter(File.md5.in_([md5 for md5, _ in unused])). \
+                delete(synchronize_session=False)
+            for md5, _ in unused:
+                file_path_cache.pop(md5)
+
+    @staticmethod
+    def get_path(md5):
+        """按内容哈希查找存储路径，结果缓存在进程内"""
+        path = file_path_cache.get(md5)
+        # 其他进程可能已删除该文件，缓存的路径不存在时重新查询
+        if path is not None and os.path.exists(path):
+            return path
+        file = File.query.filter_by(md5=md5).first()
+        if file is None:
+            file_path_cache.pop(md5)
+            return None
+        file_path_cache.set(md5, file.path)
+        return file.path
+
+    @staticmethod
+    def _increment(md5, delta):
+        return db.session.query(File).filter(File.md5 == md5). \
+            update({File.refs: File.refs + delta}, synchronize_session='fetch')
+
+
+class FileTombstone(db.Model):
+    """引用归零、待删除的文件，与 File 记录的删除在同一事务中写入"""
+    __tablename__ = 'file_tombstone'
+    md5 = db.Column(db.String(32), primary_key=True)
+    path = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+
+class CatalogVersion(db.Model):
+    """目录版本号（单行），图像、标签或统计数据有写入时在同一事务中加一，用作响应缓存的失效依据"""
+    __tablename__ = 'catalog_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
 
 
 
@@ -135,6 +569,9 @@ class File(db.Model):
 
 
 def initialize_tags():
+    # 数据库尚未迁移（如执行 flask db upgrade 时）则跳过
+    if not inspect(db.engine).has_table(Tag.__tablename__):
+        return
     # 检查 Tag 表中是否有数据
     if not Tag.query.first():
         # 插入 CATEGORIES 中的数据
@@ -145,6 +582,88 @@ def initialize_tags():
         print("Tags initialized successfully!")
     else:
         print("Tags already exist.")
+    _tag_names.clear()
+    get_tag_names()
+
+
+def get_tag_names():
+    """返回 Tag id -> name 映射，首次调用时从数据库加载"""
+    if not _tag_names:
+        _tag_names.update(db.session.query(Tag.id, Tag.name).all())
+    return _tag_names
+
+
+def name_fts_available():
+    """当前数据库是否已建立 img_name 全文索引（按数据库地址缓存）"""
+    return _sqlite_table_exists(IMAGE_NAME_FTS)
+
+
+def box_rtree_available():
+    """当前数据库是否已建立标签框 R*Tree 索引（按数据库地址缓存）"""
+    return _sqlite_table_exists(BOX_RTREE)
+
+
+def _sqlite_table_exists(name):
+    key = (str(db.engine.url), name)
+    if key not in _sqlite_tables:
+        _sqlite_tables[key] = db.engine.dialect.name == 'sqlite' and inspect(db.engine).has_table(name)
+    return _sqlite_tables[key]
+
+
+def phash_values(phash: int | None) -> dict:
+    """感知哈希对应的 Image 列值（完整哈希及各段），phash 为 None 时各列为 None"""
+    if phash is None:
+        return {name: None for name in ('phash', *(f'phash_{i}' for i in range(PHASH_PARTS)))}
+    mask = (1 << PHASH_PART_BITS) - 1
+    values = {'phash': phash - (1 << PHASH_BITS) if phash >= 1 << (PHASH_BITS - 1) else phash}
+    for i in range(PHASH_PARTS):
+        values[f'phash_{i}'] = (phash >> (PHASH_PART_BITS * i)) & mask
+    return values
+
+
+def store_phashes(hashes: dict):
+    """按内容写入感知哈希（md5 -> phash），只更新尚未计算的图像，不提交"""
+    if not hashes:
+        return
+    table = Image.__table__
+    stmt = update(table).where(table.c.img_md5 == bindparam('b_md5'), table.c.phash.is_(None)). \
+        values({name: bindparam(f'b_{name}') for name in phash_values(0)})
+    db.session.execute(stmt, [{'b_md5': md5, **{f'b_{name}': value for name, value in phash_values(phash).items()}}
+                              for md5, phash in hashes.items()])
+
+
+def hamming_distance(a: int, b: int) -> int:
+    # 数据库中为有符号值，按无符号 64 位比较
+    return ((a ^ b) & ((1 << PHASH_BITS) - 1)).bit_count()
+
+
+def _hamming_ball(value, bits, radius):
+    """与 value 的汉明距离不超过 radius 的所有 bits 位整数"""
+    values = [value]
+    for r in range(1, radius + 1):
+        for positions in combinations(range(bits), r):
+            values.append(value ^ sum(1 << p for p in positions))
+    return values
+
+
+def configure_engine(engine, pragmas):
+    """为 SQLite 连接设置 PRAGMA（WAL、synchronous、busy_timeout、mmap 等），需在首次连接前调用"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """迁移自动生成时忽略由原生 SQL 维护的索引表"""
+    if type_ == 'table' and reflected and name.startswith((IMAGE_NAME_FTS, BOX_RTREE)):
+        return False
+    return True
 
 
 def generate_date_series(start_date, end_date):
@@ -152,6 +671,120 @@ def generate_date_series(start_date, end_date):
     delta = end_date - start_date
     return [(end_date - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(delta.days + 1)]
 
+def upsert_insert(model):
+    """支持 on_conflict_do_update 的 INSERT 语句，仅支持 SQLite 与 PostgreSQL"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f'Unsupported database dialect: {dialect}, use SQLite or PostgreSQL')
+    return insert(model)
+
+
+def _upsert_increment(model, keys: dict, deltas: dict):
+    """在当前事务中对统计行做原子自增，行不存在时插入"""
+    stmt = upsert_insert(model).values(**keys, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: getattr(model, name) + stmt.excluded[name] for name in deltas})
+    db.session.execute(stmt)
+
+
+def record_image_stats(img_date, is_labeled, tag_ids, delta=1):
+    """图片新增（delta=1）或删除（delta=-1）时更新统计表，需与图片写入在同一事务中提交"""
+    record_images_stats([(img_date, is_labeled, tag_ids)], delta)
+
+
+def record_images_stats(images, delta=1):
+    """批量更新统计表，images 为 (img_date, is_labeled, tag_ids) 序列，每个统计行只更新一次"""
+    days = {}
+    tags = Counter()
+    for img_date, is_labeled, tag_ids in images:
+        day = days.setdefault(img_date.strftime('%Y-%m-%d'), [0, 0])
+        day[0] += delta
+        if not is_labeled:
+            day[1] += delta
+        tags.update({tag_id: delta for tag_id in tag_ids})
+    for day, (total, unlabeled) in days.items():
+        _upsert_increment(ImageDailyStat, {'day': day}, {'total': total, 'unlabeled': unlabeled})
+    for tag_id, frequency in tags.items():
+        _upsert_increment(TagStat, {'tag_id': tag_id}, {'frequency': frequency})
+
+
+def rebuild_stats():
+    """根据 image 与 tags 表全量重建统计表"""
+    days = {}
+    rows = db.session.query(Image.img_date, Image.is_labeled). \
+        filter(Image.img_date.isnot(None)).execution_options(yield_per=1000)
+    for img_date, is_labeled in rows:
+        day = days.setdefault(img_date.strftime('%Y-%m-%d'), [0, 0])
+        day[0] += 1
+        if not is_labeled:
+            day[1] += 1
+    frequencies = db.session.query(ImageTag.tag_id, func.count(ImageTag.image_id)). \
+        group_by(ImageTag.tag_id).all()
+
+    db.session.query(ImageDailyStat).delete()
+    db.session.query(TagStat).delete()
+    db.session.add_all([ImageDailyStat(day=day, total=total, unlabeled=unlabeled)
+                        for day, (total, unlabeled) in days.items()])
+    db.session.add_all([TagStat(tag_id=tag_id, frequency=freq) for tag_id, freq in frequencies])
+    db.session.commit()
+    return len(days), len(frequencies)
+
+
+# 写入这些表即视为目录发生变化
+CATALOG_TABLES = frozenset(model.__tablename__ for model in (Image, ImageTag, Box, User, ImageDailyStat, TagStat))
+
+
+def get_catalog_version():
+    return db.session.query(CatalogVersion.version).filter(CatalogVersion.id == 1).scalar() or 0
+
+
+def mark_catalog_changed(session=None):
+    """标记当前事务修改了目录，提交时版本号加一；ORM 之外的写入（如原生 SQL）需手动调用"""
+    (session or db.session).info['catalog_changed'] = True
+
+
+@event.listens_for(db.session, 'before_flush')
+def _track_catalog_flush(session, flush_context, instances):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if obj.__table__.name in CATALOG_TABLES and not _password_only_update(session, obj):
+            mark_catalog_changed(session)
+            return
+
+
+def _password_only_update(session, obj):
+    """只修改了密码哈希的用户（如登录时透明升级）：图像列表只包含用户名，不影响目录"""
+    if not isinstance(obj, User) or obj not in session.dirty:
+        return False
+    changed = {attr.key for attr in inspect(obj).attrs if attr.history.has_changes()}
+    return changed <= {'password'}
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_catalog_execute(orm_execute_state):
+    # insert(Image) 批量插入、query.update() / delete() 不经过 flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and table.name in CATALOG_TABLES:
+            mark_catalog_changed(orm_execute_state.session)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _bump_catalog_version(session):
+    session.flush()  # 提交时的 flush 在此事件之后，先执行以便 before_flush 记录修改
+    if session.info.pop('catalog_changed', False):
+        _upsert_increment(CatalogVersion, {'id': 1}, {'version': 1})
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _reset_catalog_changed(session):
+    session.info.pop('catalog_changed', None)
+
+
 def count_image_num_by_date():
     # 获取当前时间和10天前的时间
     end_date = datetime.now()
@@ -160,20 +793,9 @@ def count_image_num_by_date():
     # 生成日期序列
     date_series = generate_date_series(start_date, end_date)
 
-    # 查询数据库中过去10天每天的图片数量
-    image_counts_by_date = db.session.query(
-        func.strftime('%Y-%m-%d', Image.img_date).label('date'),
-        func.count(Image.id).label('count')
-    ).filter(
-        and_(Image.img_date >= start_date, Image.img_date <= end_date)
-    ).group_by(
-        func.strftime('%Y-%m-%d', Image.img_date)
-    ).order_by(
-        'date'
-    ).all()
-
-    # 将查询结果转换为字典以便后续处理
-    image_count_dict = {item.date: item.count for item in image_counts_by_date}
+    # 从按天汇总表读取过去10天每天的图片数量
+    image_count_dict = dict(db.session.query(ImageDailyStat.day, ImageDailyStat.total).
+                            filter(ImageDailyStat.day.in_(date_series)).all())
 
     # 合并结果，确保所有日期都存在，并且对于没有数据的日子填充0
     image_count_list = [{'date': date, 'count': image_count_dict.get(date, 0)} for date in date_series]
@@ -181,17 +803,16 @@ def count_image_num_by_date():
     return image_count_list
 
 def get_tag_frequencies():
-    # 使用左外连接以确保所有标签都被包括进来，即使它们没有关联的图片
+    # 使用左外连接以确保所有标签都被包括进来，即使它们还没有统计行
+    frequency = func.coalesce(TagStat.frequency, 0)
     tag_frequencies = db.session.query(
         Tag.id,
         Tag.name,
-        func.coalesce(func.count(ImageTag.tag_id), 0).label('frequency')  # 使用 coalesce 将 NULL 替换为 0
+        frequency.label('frequency')  # 使用 coalesce 将 NULL 替换为 0
     ).outerjoin(
-        ImageTag, Tag.id == ImageTag.tag_id  # 使用左外连接
-    ).group_by(
-        Tag.id, Tag.name  # 按标签ID和名称分组
+        TagStat, Tag.id == TagStat.tag_id  # 使用左外连接
     ).order_by(
-        func.coalesce(func.count(ImageTag.tag_id), 0).desc()  # 按频率降序排列
+        frequency.desc(), Tag.id  # 按频率降序排列，频率相同按标签 id
     ).all()
 
     # 将结果整理成一个易于阅读的列表格式
@@ -200,14 +821,14 @@ def get_tag_frequencies():
     return frequency_list
 
 def get_unlabeled_image_percentage():
-    # 查询所有图片的总数
-    total_images = db.session.query(func.count(Image.id)).scalar()
+    # 从按天汇总表累加图片总数与未标记数量
+    total_images, unlabeled_images = db.session.query(
+        func.coalesce(func.sum(ImageDailyStat.total), 0),
+        func.coalesce(func.sum(ImageDailyStat.unlabeled), 0)
+    ).one()
 
     if total_images == 0:
-        return "No images available."
-
-    # 查询未标记图片的数量
-    unlabeled_images = db.session.query(func.count(Image.id)).filter(Image.is_labeled == False).scalar()
+        return 0.0, 0
 
     # 计算未标记图片的比例
     percentage = (unlabeled_images / total_images) * 100
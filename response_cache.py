@@ -0,0 +1,106 @@
+import hashlib
+import json
+from functools import wraps
+from flask import current_app, make_response, request
+from cache import LRUCache
+from derivatives import DerivativeCache
+from metrics import metrics
+from model import get_catalog_version
+
+# 响应体之外随缓存保存的响应头
+CACHED_HEADERS = ('Content-Type', 'X-Next-Cursor')
+
+
+class ResponseCache:
+    """只读接口（/query、/info）的响应缓存
+
+    缓存键由接口、规范化后的请求参数及目录版本号组成，任何写入都会使版本号加一，旧条目不再命中，
+    无需逐条失效；缓存键的哈希同时作为 ETag，客户端带 If-None-Match 时只需查询版本号即可返回 304。
+    进程内为 LRU 缓存，配置 RESPONSE_CACHE_FOLDER 后另有多个 worker 共享的文件缓存
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.max_item_bytes = 0
+        self.memory = None
+        self.files = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['RESPONSE_CACHE_ENABLED']
+        self.max_item_bytes = app.config['RESPONSE_CACHE_MAX_ITEM_BYTES']
+        self.memory = LRUCache(app.config['RESPONSE_CACHE_SIZE'])
+        if app.config['RESPONSE_CACHE_FOLDER']:
+            self.files = DerivativeCache(app, config_prefix='RESPONSE_CACHE')
+        app.extensions['response_cache'] = self
+
+    def cached(self, key=None):
+        """视图装饰器；key(request.args) 返回规范化的参数，默认为排序后的全部参数
+
+        只缓存非流式的 200 响应，其他响应原样返回
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+                params = key(request.args) if key else sorted(request.args.items(multi=True))
+                raw_key = f"{request.endpoint}|{get_catalog_version()}|{json.dumps(params, default=str)}"
+                etag = hashlib.sha1(raw_key.encode()).hexdigest()
+                if etag in request.if_none_match:
+                    metrics.response_cache.inc(endpoint=request.endpoint, result='not_modified')
+                    return _revalidate(current_app.response_class(status=304), etag)
+
+                data = self._get(etag)
+                if data is not None:
+                    metrics.response_cache.inc(endpoint=request.endpoint, result='hit')
+                    return _revalidate(_unpack(data), etag)
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                metrics.response_cache.inc(endpoint=request.endpoint, result='miss')
+                data = _pack(response)
+                if len(data) <= self.max_item_bytes:
+                    self._set(etag, data)
+                return _revalidate(response, etag)
+
+            return decorated
+
+        return decorator
+
+    def _get(self, key):
+        data = self.memory.get(key)
+        if data is None and self.files is not None:
+            path = self.files.lookup(key, '.resp')
+            if path is not None:
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError:  # 读取前被淘汰
+                    return None
+                self.memory.set(key, data)
+        return data
+
+    def _set(self, key, data):
+        self.memory.set(key, data)
+        if self.files is not None:
+            self.files.put(key, '.resp', data)
+
+
+def _pack(response):
+    headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+    return json.dumps(headers).encode() + b'\n' + response.get_data()
+
+
+def _unpack(data):
+    headers, _, body = data.partition(b'\n')
+    return current_app.response_class(body, headers=json.loads(headers))
+
+
+def _revalidate(response, etag):
+    # 携带令牌的接口：浏览器可缓存，但每次使用前须验证
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,153 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from model import db, Image, File, RenderJob, store_phashes
+from utils import render_boxes, perceptual_hash
+from metrics import metrics
+from config import FILE_SAVE_FOLDER, FILE_ROUTE
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueue:
+    """标签框渲染队列
+
+    任务记录在 render_job 表中，渲染在进程池中执行，不占用请求线程；
+    完成后在回调线程中更新图像记录。进程池在首次提交任务时才创建。
+    上传时未计算的感知哈希也在该进程池中计算，不记录任务，进程退出时未完成的由 flask phash backfill 补齐
+    """
+
+    def __init__(self, sar_tools, app=None):
+        self.sar_tools = sar_tools
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._resumed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['render_queue'] = self
+        app.before_request(self._resume_once)
+
+    def submit(self, job):
+        if not job.claim():
+            return
+        boxes = self.sar_tools.get_boxes(job.image_name)
+        if not self.app.config['RENDER_ASYNC']:
+            self._finish(job.id, *self._run(boxes, job.src_path))
+            return
+        job_id = job.id
+        future = self._get_executor().submit(timed_render, boxes, job.src_path, FILE_SAVE_FOLDER)
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+
+    def submit_phash(self, md5_hash, path):
+        """计算内容为 md5_hash 的图像的感知哈希并写入"""
+        if not self.app.config['RENDER_ASYNC']:
+            self._store_phash(md5_hash, perceptual_hash(path))
+            return
+        future = self._get_executor().submit(perceptual_hash, path)
+        future.add_done_callback(lambda f: self._on_phash(md5_hash, f))
+
+    def resume(self):
+        """提交所有未执行的任务（进程重启后调用）"""
+        for job in RenderJob.query.filter_by(status=RenderJob.PENDING).order_by(RenderJob.id).all():
+            self.submit(job)
+
+    def requeue_running(self):
+        """将中断的 running 任务重新置为 pending，仅在没有工作进程运行时使用"""
+        count = RenderJob.query.filter_by(status=RenderJob.RUNNING). \
+            update({RenderJob.status: RenderJob.PENDING})
+        db.session.commit()
+        return count
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _resume_once(self):
+        if not self._resumed:
+            self._resumed = True
+            # 进程重启前被中断的 running 任务超过 RENDER_STALE_AFTER 后重新执行
+            RenderJob.requeue_stale(self.app.config['RENDER_STALE_AFTER'])
+            self.resume()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn 避免在多线程的 worker 中 fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.app.config['RENDER_WORKERS'],
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    @staticmethod
+    def _run(boxes, src_path):
+        try:
+            result, seconds = timed_render(boxes, src_path, FILE_SAVE_FOLDER)
+        except Exception as e:
+            return None, e
+        metrics.render_duration.observe(seconds)
+        return result, None
+
+    def _on_done(self, job_id, future):
+        try:
+            (result, seconds), error = future.result(), None
+            metrics.render_duration.observe(seconds)
+        except Exception as e:
+            result, error = None, e
+        with self.app.app_context():
+            self._finish(job_id, result, error)
+
+    def _on_phash(self, md5_hash, future):
+        try:
+            phash = future.result()
+        except Exception:
+            logger.exception('perceptual hash of %s failed', md5_hash)
+            return
+        with self.app.app_context():
+            self._store_phash(md5_hash, phash)
+
+    @staticmethod
+    def _store_phash(md5_hash, phash):
+        if phash is None:  # 无法解码
+            return
+        store_phashes({md5_hash: phash})
+        db.session.commit()
+
+    def _finish(self, job_id, result, error):
+        job = db.session.get(RenderJob, job_id)
+        job.finished_at = datetime.now()
+        metrics.render_jobs.inc(status=RenderJob.FAILED if error is not None else RenderJob.DONE)
+        if error is not None:
+            job.status = RenderJob.FAILED
+            job.error = str(error)[:200]
+            db.session.commit()
+            return
+        md5_hash, path = result
+        image = db.session.get(Image, job.image_id)
+        # 渲染期间图像可能已被删除，或经批量修改后不再有标签
+        attached = image is not None and image.is_labeled
+        if attached:
+            File.acquire(md5_hash, path)
+            image.labeled_image_url = f"{FILE_ROUTE}/{md5_hash}"
+            image.labeled_image_md5 = md5_hash
+        job.status = RenderJob.DONE
+        job.result_md5 = md5_hash
+        db.session.commit()
+        # 结果未被采用，且该内容没有其他引用
+        if not attached and File.query.filter_by(md5=md5_hash).first() is None and os.path.exists(path):
+            os.remove(path)
+
+
+def timed_render(boxes, src_path, save_path):
+    """在渲染进程中执行 render_boxes，返回 (结果, 耗时秒数)，耗时不含排队时间"""
+    start = time.perf_counter()
+    result = render_boxes(boxes, src_path, save_path)
+    return result, time.perf_counter() - start
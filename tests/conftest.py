@@ -0,0 +1,172 @@
+"""测试环境
+
+默认使用临时目录中的 SQLite 数据库；设置 DATABASE_URL 时在该数据库上运行（如 PostgreSQL，
+可用 docker compose -f docker-compose.test.yml up -d 启动，见 README），
+该数据库必须为空，测试开始时执行 flask db upgrade，结束后降级到 base。
+标记为 sqlite / postgresql 的测试只在对应数据库上运行。
+应用在导入时读取配置与 label/label.pkl，并使用相对路径 ./uploads，因此在临时工作目录中运行
+"""
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS = os.path.join(ROOT, 'migrations')
+sys.path.insert(0, ROOT)
+
+# 测试图像：名称 -> 标签（None 为未标记）
+LABELS = {
+    'scene_0.jpg': {'tags': {0: 2, 1: 1}, 'box': {0: [[10, 10, 20, 30], [50, 40, 60, 30]], 1: [[5, 5, 8, 8]]}},
+    'scene_1.jpg': {'tags': {0: 1, 2: 1}, 'box': {0: [[20, 20, 30, 30]], 2: [[70, 60, 20, 10]]}},
+    'scene_2.jpg': {'tags': {3: 1}, 'box': {}},
+    'scene_3.jpg': None,
+    'scene_4.jpg': None,
+}
+
+_workdir = None
+
+
+def pytest_configure(config):
+    global _workdir
+    config.addinivalue_line('markers', 'sqlite: 只在 SQLite 上运行')
+    config.addinivalue_line('markers', 'postgresql: 只在 DATABASE_URL 为 PostgreSQL 时运行（见 README）')
+    _workdir = tempfile.mkdtemp(prefix='sarms-test-')
+    os.makedirs(os.path.join(_workdir, 'label'))
+    os.makedirs(os.path.join(_workdir, 'imgs'))
+    os.makedirs(os.path.join(_workdir, 'uploads'))
+    with open(os.path.join(_workdir, 'label', 'label.pkl'), 'wb') as fb:
+        pickle.dump({name: label for name, label in LABELS.items() if label is not None}, fb)
+    for i, name in enumerate(LABELS):
+        image = (np.random.RandomState(i).rand(120, 160, 3) * 255).astype('uint8')
+        cv2.imwrite(os.path.join(_workdir, 'imgs', name), image)
+    # config 在导入时读取 DATABASE_URL
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_workdir, 'test.db'))
+    os.chdir(_workdir)
+
+
+def pytest_unconfigure(config):
+    if _workdir is not None:
+        os.chdir(ROOT)
+        shutil.rmtree(_workdir, ignore_errors=True)
+
+
+def pytest_collection_modifyitems(config, items):
+    dialect = os.environ['DATABASE_URL'].split(':', 1)[0].split('+', 1)[0]
+    dialect = 'postgresql' if dialect == 'postgres' else dialect
+    for item in items:
+        for name in ('sqlite', 'postgresql'):
+            if item.get_closest_marker(name) and dialect != name:
+                item.add_marker(pytest.mark.skip(reason=f'requires {name}, DATABASE_URL is {dialect}'))
+
+
+def _flask_db(*args, database_url=None):
+    """在子进程中执行 flask db 命令（如 upgrade），返回 CompletedProcess"""
+    env = dict(os.environ, PYTHONPATH=ROOT, DATABASE_URL=database_url or os.environ['DATABASE_URL'])
+    result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', *args, '-d', MIGRATIONS],
+                            cwd=_workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise AssertionError(f'flask db {" ".join(args)} failed:\n{result.stdout}\n{result.stderr}')
+    return result
+
+
+@pytest.fixture(scope='session')
+def database():
+    """从空数据库迁移到最新版本，测试结束后降级（PostgreSQL）或删除（SQLite）"""
+    from sqlalchemy import create_engine, inspect, text
+    url = os.environ['DATABASE_URL']
+    engine = create_engine(url)
+    try:
+        if inspect(engine).get_table_names():
+            pytest.exit(f'refusing to run tests on a non-empty database: {engine.url!r}', returncode=1)
+        _flask_db('upgrade')
+        yield url
+        if not url.startswith('sqlite'):
+            _flask_db('downgrade', 'base')
+            with engine.begin() as connection:
+                connection.execute(text('DROP TABLE alembic_version'))
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture(scope='session')
+def app(database):
+    # 扩展在 db.session 上注册事件监听，整个测试过程只创建一个应用
+    from app import create_app
+    from model import db
+    app = create_app()
+    app.config.update(TESTING=True, RENDER_ASYNC=False)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def _clean_catalog(request):
+    """每个测试结束后清空除 tag 外的数据、存储的文件及进程内缓存"""
+    yield
+    if 'app' not in request.fixturenames:
+        return
+    app = request.getfixturevalue('app')
+    from model import db, file_path_cache, user_identity_cache
+    from view import token_cache
+    with app.app_context():
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name not in ('tag', 'catalog_version'):
+                db.session.execute(table.delete())
+        db.session.commit()
+    for name in os.listdir('uploads'):
+        os.remove(os.path.join('uploads', name))
+    file_path_cache.clear()
+    user_identity_cache.clear()
+    token_cache.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def headers(client):
+    """已登录用户的请求头"""
+    client.post('/register', json={'username': 'tester', 'password': 'secret', 'email': 'tester@example.com'})
+    response = client.post('/login', json={'email': 'tester@example.com', 'password': 'secret'})
+    return {'x-access-token': response.json['token']}
+
+
+@pytest.fixture
+def upload(client, headers):
+    """上传 imgs 中的测试图像（可指定上传时使用的名称），返回图像 id"""
+    def upload(name, as_name=None):
+        with open(os.path.join('imgs', name), 'rb') as fb:
+            response = client.post('/upload', headers=headers, data={'file': (fb, as_name or name)})
+        assert response.status_code == 200, response.json
+        return response.json['id']
+    return upload
+
+
+@pytest.fixture
+def flask_db():
+    return _flask_db
+
+
+@pytest.fixture
+def wait_until():
+    """等待后台线程（如 FileCollector）完成，超时返回 False"""
+    def wait_until(predicate, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+    return wait_until
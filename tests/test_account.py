@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import pytest
+
+
+def _login(client):
+    client.post('/register', json={'username': 'tester', 'password': 'secret', 'email': 'tester@example.com'})
+    return client.post('/login', json={'email': 'tester@example.com', 'password': 'secret'}).json
+
+
+def _refresh(client, token):
+    return client.post('/refresh', json={'refresh_token': token})
+
+
+def test_refresh_rotates_and_detects_reuse(client):
+    token = _login(client)['refresh_token']
+    response = _refresh(client, token)
+    assert response.status_code == 200
+    rotated = response.json['refresh_token']
+    # 旧令牌再次使用：视为泄露，新令牌一并吊销
+    assert _refresh(client, token).status_code == 401
+    assert _refresh(client, rotated).status_code == 401
+
+
+@pytest.mark.sqlite  # PostgreSQL 的外键约束不允许删除仍有刷新令牌的用户
+def test_refresh_deleted_user(app, client):
+    from model import db, User, RefreshToken
+    token = _login(client)['refresh_token']
+    with app.app_context():
+        User.query.delete()
+        db.session.commit()
+    assert _refresh(client, token).status_code == 401
+    with app.app_context():
+        assert RefreshToken.query.filter(RefreshToken.revoked_at.is_(None)).count() == 0
+
+
+def test_prune_tokens(app, client):
+    from model import db, RefreshToken
+    _login(client)
+    token = _login(client)['refresh_token']
+    _refresh(client, token)
+    with app.app_context():
+        # 4 个令牌：两次登录、一次轮换（旧令牌已吊销）；将其中一个设为已过期
+        record = RefreshToken.query.filter(RefreshToken.revoked_at.is_(None)).first()
+        record.expires_at = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+    runner = app.test_cli_runner()
+    assert 'Removed 1 refresh tokens.' in runner.invoke(args=['tokens', 'prune']).output
+    assert 'Removed 1 refresh tokens.' in runner.invoke(args=['tokens', 'prune', '--keep-revoked-days', '0']).output
+    with app.app_context():
+        assert RefreshToken.query.count() == 1
+
+
+def test_rehash_keeps_catalog_version(app, client, monkeypatch):
+    from model import db, User, get_catalog_version
+    client.post('/register', json={'username': 'tester', 'password': 'secret', 'email': 'tester@example.com'})
+    with app.app_context():
+        version = get_catalog_version()
+        stored = db.session.query(User.password).scalar()
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    assert client.post('/login', json={'email': 'tester@example.com', 'password': 'secret'}).json['status'] == 'success'
+    with app.app_context():
+        # 密码哈希已升级，图像目录未变化
+        assert db.session.query(User.password).scalar() != stored
+        assert get_catalog_version() == version
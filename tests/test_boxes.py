@@ -0,0 +1,64 @@
+import pytest
+
+
+@pytest.fixture
+def uploaded(upload):
+    return {name: upload(name) for name in ('scene_0.jpg', 'scene_1.jpg', 'scene_2.jpg', 'scene_3.jpg')}
+
+
+@pytest.fixture(params=['rtree', 'table'])
+def box_index(request, app, monkeypatch):
+    """分别在 box_rtree 与 box 表上检索"""
+    import model
+    if request.param == 'rtree':
+        with app.app_context():
+            if not model.box_rtree_available():
+                pytest.skip('box_rtree requires SQLite with the R*Tree module')
+    else:
+        monkeypatch.setattr(model, 'box_rtree_available', lambda: False)
+    return request.param
+
+
+def _names(app, **kwargs):
+    from model import db, Image, Box
+    with app.app_context():
+        return sorted(name for (name,) in db.session.query(Image.img_name).filter(Box.images_filter(**kwargs)))
+
+
+# (条件, 结果)；scene_0：ship (10, 10, 20, 30)、(50, 40, 60, 30)，aircraft (5, 5, 8, 8)；
+# scene_1：ship (20, 20, 30, 30)，car (70, 60, 20, 10)；scene_2 有标签无标签框
+CASES = [
+    ({}, ['scene_0.jpg', 'scene_1.jpg']),
+    ({'tag_names': ['ship']}, ['scene_0.jpg', 'scene_1.jpg']),
+    ({'tag_names': ['car']}, ['scene_1.jpg']),
+    ({'tag_names': ['nope']}, []),
+    # ship 与 car 之间的 aircraft 在 R*Tree 的类别范围内，需精确过滤
+    ({'tag_names': ['ship', 'car'], 'max_area': 100}, []),
+    ({'tag_names': ['ship', 'car'], 'min_area': 1000}, ['scene_0.jpg']),
+    ({'min_area': 100, 'max_area': 700}, ['scene_0.jpg', 'scene_1.jpg']),
+    ({'max_area': 100}, ['scene_0.jpg']),
+    ({'region': (0, 0, 60, 60)}, ['scene_0.jpg', 'scene_1.jpg']),
+    ({'region': (0, 0, 40, 45)}, ['scene_0.jpg']),
+    ({'region': (0, 0, 40, 45), 'tag_names': ['car']}, []),
+    ({'region': (85, 65, 100, 100), 'region_match': 'overlap'}, ['scene_0.jpg', 'scene_1.jpg']),
+    ({'region': (85, 65, 100, 100)}, []),
+    ({'region': (100, 0, 120, 20), 'region_match': 'overlap'}, []),
+    ({'min_boxes': 2}, ['scene_0.jpg', 'scene_1.jpg']),
+    ({'min_boxes': 3}, ['scene_0.jpg']),
+    ({'tag_names': ['ship'], 'min_boxes': 2}, ['scene_0.jpg']),
+]
+
+
+def test_images_filter(app, uploaded, box_index):
+    # 每组条件单独上传图像耗时较长，共用一次上传
+    for kwargs, expected in CASES:
+        assert _names(app, **kwargs) == expected, kwargs
+
+
+def test_rtree_follows_box_changes(app, client, headers, uploaded, box_index):
+    # 删除标签时其标签框一并删除，R*Tree 由触发器同步
+    response = client.post('/modify/batch', headers=headers,
+                           json={'action': 'retag', 'ids': [uploaded['scene_1.jpg']], 'remove_tags': ['car']})
+    assert response.status_code == 200
+    assert _names(app, tag_names=['car']) == []
+    assert _names(app, tag_names=['ship']) == ['scene_0.jpg', 'scene_1.jpg']
@@ -0,0 +1,119 @@
+import os
+import uuid
+import pytest
+
+
+def _images(app):
+    """图像名 -> (is_labeled, labeled_image_md5, {标签 id: 数量}, 标签框的标签 id 列表)"""
+    from model import db, Image, ImageTag, Box
+    with app.app_context():
+        images = {}
+        for image_id, name, is_labeled, labeled_md5 in db.session.query(
+                Image.id, Image.img_name, Image.is_labeled, Image.labeled_image_md5):
+            tags = dict(db.session.query(ImageTag.tag_id, ImageTag.num).filter(ImageTag.image_id == image_id))
+            boxes = sorted(tag_id for (tag_id,) in db.session.query(Box.tag_id).filter(Box.image_id == image_id))
+            images[name] = (is_labeled, labeled_md5, tags, boxes)
+        return images
+
+
+def _image_files(app, image_id):
+    """图像的 (原始文件 md5, 标签图像 md5)"""
+    from model import db, Image
+    with app.app_context():
+        return db.session.query(Image.img_md5, Image.labeled_image_md5).filter(Image.id == uuid.UUID(image_id)).one()
+
+
+def _file_paths(app):
+    from model import db, File
+    with app.app_context():
+        return dict(db.session.query(File.md5, File.path))
+
+
+@pytest.fixture
+def uploaded(upload):
+    return {name: upload(name) for name in ('scene_0.jpg', 'scene_1.jpg', 'scene_2.jpg', 'scene_3.jpg')}
+
+
+@pytest.fixture
+def batch(client, headers):
+    def batch(**body):
+        return client.post('/modify/batch', headers=headers, json=body)
+    return batch
+
+
+def test_rename(app, batch, uploaded):
+    ids = [uploaded['scene_0.jpg'], uploaded['scene_1.jpg']]
+    response = batch(action='rename', ids=ids, prefix='a_', suffix='.bak', replace=['scene', 'img'])
+    assert response.status_code == 200 and response.json['count'] == 2
+    assert sorted(_images(app)) == ['a_img_0.jpg.bak', 'a_img_1.jpg.bak', 'scene_2.jpg', 'scene_3.jpg']
+
+    response = batch(action='rename', filters={'name': 'scene'}, prefix='b_')
+    assert response.json['count'] == 2
+    assert sorted(_images(app)) == ['a_img_0.jpg.bak', 'a_img_1.jpg.bak', 'b_scene_2.jpg', 'b_scene_3.jpg']
+
+
+def test_rename_too_long_changes_nothing(app, batch, uploaded):
+    response = batch(action='rename', ids=list(uploaded.values()), prefix='x' * 20)
+    assert response.status_code == 400
+    assert sorted(_images(app)) == sorted(uploaded)
+
+
+@pytest.mark.parametrize('body', [
+    {},
+    {'action': 'move', 'ids': []},
+    {'action': 'delete', 'ids': []},
+    {'action': 'delete', 'ids': ['not-a-uuid']},
+    {'action': 'delete', 'filters': {}},
+    {'action': 'rename', 'ids': [str(uuid.uuid4())]},
+    {'action': 'retag', 'ids': [str(uuid.uuid4())], 'add_tags': {'nope': 1}},
+    {'action': 'retag', 'ids': [str(uuid.uuid4())], 'add_tags': {'ship': 0}},
+])
+def test_invalid_requests(batch, body):
+    assert batch(**body).status_code == 400
+
+
+def test_retag(app, batch, uploaded):
+    response = batch(action='retag', filters={'tags': 'ship'}, add_tags={'ship': 5, 'bridge': 1}, remove_tags=['car'])
+    assert response.json['count'] == 2
+    images = _images(app)
+    # 已有标签覆盖数量；删除的标签连同其标签框一并删除
+    assert images['scene_0.jpg'][2:] == ({0: 5, 1: 1, 4: 1}, [0, 0, 1])
+    assert images['scene_1.jpg'][2:] == ({0: 5, 4: 1}, [0])
+    assert images['scene_2.jpg'][2:] == ({3: 1}, [])
+
+    # 未标记的图像添加标签后变为已标记
+    batch(action='retag', ids=[uploaded['scene_3.jpg']], add_tags={'harbor': 2})
+    assert _images(app)['scene_3.jpg'][0] is True
+
+
+def test_retag_to_unlabeled_then_delete(app, batch, uploaded, wait_until):
+    image_id = uploaded['scene_0.jpg']
+    img_md5, labeled_md5 = _image_files(app, image_id)
+    assert labeled_md5 is not None
+    paths = _file_paths(app)
+
+    # 删除全部标签：变为未标记，标签图像的引用被释放，文件随后删除
+    response = batch(action='retag', ids=[image_id], remove_tags=['ship', 'aircraft'])
+    assert response.status_code == 200
+    assert _images(app)['scene_0.jpg'] == (False, None, {}, [])
+    assert set(_file_paths(app)) == set(paths) - {labeled_md5}
+    assert wait_until(lambda: not os.path.exists(paths[labeled_md5]))
+
+    # 再删除图像：只释放原始文件，其余文件不受影响
+    response = batch(action='delete', ids=[image_id])
+    assert response.json['count'] == 1
+    remaining = _file_paths(app)
+    assert set(remaining) == set(paths) - {img_md5, labeled_md5}
+    assert wait_until(lambda: not os.path.exists(paths[img_md5]))
+    assert all(os.path.exists(path) for path in remaining.values())
+
+
+def test_delete_by_filters(app, batch, uploaded, wait_until):
+    paths = _file_paths(app)
+    response = batch(action='delete', filters={'tags': 'ship,tank'})
+    assert response.json['count'] == 3
+    assert list(_images(app)) == ['scene_3.jpg']
+    remaining = _file_paths(app)
+    assert list(remaining) == [_image_files(app, uploaded['scene_3.jpg'])[0]]
+    assert wait_until(lambda: os.listdir('uploads') == [os.path.basename(path) for path in remaining.values()])
+    assert not any(os.path.exists(path) for md5, path in paths.items() if md5 not in remaining)
@@ -0,0 +1,155 @@
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+def _names(app, name):
+    from model import db, Image
+    with app.app_context():
+        return sorted(n for (n,) in db.session.query(Image.img_name).filter(Image.name_filter(name)))
+
+
+@pytest.fixture
+def named_images(app, headers):
+    from model import db, Image, User
+    names = ['Harbor_North_01.jpg', 'harbor-south-02.jpg', 'bridge_100%.jpg', 'Tank "A".png', 'ab.jpg']
+    with app.app_context():
+        author = User.query.filter_by(email='tester@example.com').one()
+        db.session.add_all(Image(datetime.now(), name, author.id, False) for name in names)
+        db.session.commit()
+    return names
+
+
+@pytest.mark.sqlite
+def test_sqlite_pragmas(app):
+    from model import db
+    with app.app_context():
+        connection = db.session.connection()
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == app.config['SQLITE_PRAGMAS']['busy_timeout']
+        assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+
+
+@pytest.mark.postgresql
+def test_pool_options(app):
+    from model import db
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert app.config['SQLITE_PRAGMAS'] == {}
+    with app.app_context():
+        pool = db.engine.pool
+        assert pool.size() == options['pool_size']
+        assert pool._max_overflow == options['max_overflow']
+        assert pool._recycle == options['pool_recycle']
+        assert pool._pre_ping
+
+
+def test_upsert_rejects_unsupported_dialect(app, monkeypatch):
+    from types import SimpleNamespace
+    from model import db, TagStat, upsert_insert
+    bind = SimpleNamespace(dialect=SimpleNamespace(name='mysql'))
+    with app.app_context():
+        monkeypatch.setattr(db.session, 'get_bind', lambda *args, **kwargs: bind)
+        with pytest.raises(NotImplementedError, match='mysql'):
+            upsert_insert(TagStat)
+
+
+def test_name_filter(app, named_images):
+    # 不区分大小写；SQLite 上 3 个字符以上走 FTS5 trigram 索引，其他情况为 LIKE / ILIKE
+    assert _names(app, 'harbor') == ['Harbor_North_01.jpg', 'harbor-south-02.jpg']
+    assert _names(app, 'NORTH') == ['Harbor_North_01.jpg']
+    assert _names(app, 'rbo') == ['Harbor_North_01.jpg', 'harbor-south-02.jpg']
+    assert _names(app, 'b') == ['Harbor_North_01.jpg', 'ab.jpg', 'bridge_100%.jpg', 'harbor-south-02.jpg']
+    assert _names(app, 'AB') == ['ab.jpg']
+    assert _names(app, '"a"') == ['Tank "A".png']
+    assert _names(app, 'missing') == []
+
+
+def test_name_filter_wildcards(app, named_images):
+    # 含 % 或 _ 时按 LIKE 通配符匹配，与原有行为一致
+    assert _names(app, 'harbor_') == ['Harbor_North_01.jpg', 'harbor-south-02.jpg']
+    assert _names(app, '100%') == ['bridge_100%.jpg']
+    assert _names(app, 'h%02') == ['harbor-south-02.jpg']
+
+
+def test_name_filter_query(client, headers, named_images):
+    response = client.get('/query?name=HARBOR', headers=headers)
+    assert sorted(item['img_name'] for item in response.json) == ['Harbor_North_01.jpg', 'harbor-south-02.jpg']
+
+
+def test_info_stats(app, upload):
+    from model import count_image_num_by_date, get_tag_frequencies, get_unlabeled_image_percentage
+    for name in ('scene_0.jpg', 'scene_1.jpg', 'scene_3.jpg'):
+        upload(name)
+    with app.app_context():
+        by_date = count_image_num_by_date()
+        frequencies = get_tag_frequencies()
+        unlabeled = get_unlabeled_image_percentage()
+    today = datetime.now()
+    assert [item['date'] for item in by_date] == \
+        [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(11)]
+    assert [item['count'] for item in by_date] == [3] + [0] * 10
+    # 所有标签都在结果中，按频率降序、标签 id 升序
+    assert [(item['name'], item['frequency']) for item in frequencies] == \
+        [('ship', 2), ('aircraft', 1), ('car', 1), ('tank', 0), ('bridge', 0), ('harbor', 0)]
+    assert unlabeled == (pytest.approx(100 / 3), 3)
+
+
+def test_info_endpoint(client, headers, upload):
+    upload('scene_2.jpg')
+    info = client.post('/info', headers=headers, json={}).json
+    assert info['total_image_num'] == 1
+    assert info['image_num_by_date'][0]['count'] == 1
+    assert info['tag_freq'][0] == {'id': 3, 'name': 'tank', 'frequency': 1}
+
+
+def test_upgrade_from_empty(database, flask_db):
+    # 会话开始时已从空数据库升级，模型与迁移结果一致
+    assert flask_db('current').stdout.strip().endswith('(head)')
+    assert 'No new upgrade operations detected' in flask_db('check').stdout
+
+
+@pytest.mark.sqlite
+def test_migrations_round_trip(tmp_path, flask_db):
+    # render_as_batch 的迁移在 SQLite 上可完整降级并重新升级
+    url = 'sqlite:///' + str(tmp_path / 'scratch.db')
+    flask_db('upgrade', database_url=url)
+    flask_db('downgrade', 'base', database_url=url)
+    engine = create_engine(url)
+    try:
+        assert inspect(engine).get_table_names() == ['alembic_version']
+    finally:
+        engine.dispose()
+    flask_db('upgrade', database_url=url)
+    engine = create_engine(url)
+    try:
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT count(*) FROM sqlite_master WHERE name = 'image_name_fts'")).scalar()
+            assert connection.execute(text("SELECT count(*) FROM sqlite_master WHERE name = 'box_rtree'")).scalar()
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.sqlite
+def test_image_ids_have_text_affinity(app, headers):
+    # 声明为 UUID 的列为 NUMERIC 亲和性，形如数字的 id 会被转换为数值
+    from model import db, Image, ImageTag, User
+    with app.app_context():
+        connection = db.session.connection()
+        for table, column in [('image', 'id'), ('tags', 'image_id'), ('box', 'image_id'), ('render_job', 'image_id'),
+                              ('import_record', 'image_id'), ('image_name_fts_rowid', 'image_id')]:
+            declared = {row[1]: row[2] for row in connection.exec_driver_sql(f'PRAGMA table_info({table})')}
+            assert declared[column] == 'CHAR(32)', table
+        author = User.query.filter_by(email='tester@example.com').one()
+        ids = [uuid.UUID('12345678' * 4), uuid.UUID('4e120000' * 4)]
+        for image_id in ids:
+            image = Image(datetime.now(), 'digits.jpg', author.id, True)
+            image.id = image_id
+            db.session.add(image)
+            db.session.flush()
+            image.add_tags({0: 1})
+        db.session.commit()
+        joined = db.session.query(ImageTag.image_id).join(Image, Image.id == ImageTag.image_id). \
+            filter(Image.id.in_(ids))
+        assert sorted(image_id for (image_id,) in joined) == sorted(ids)
+        assert db.session.connection().exec_driver_sql(
+            'SELECT count(*) FROM image WHERE typeof(id) != ?', ('text',)).scalar() == 0
@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+import time
+from derivatives import DerivativeCache
+
+
+class _Config:
+    def __init__(self, folder, max_bytes):
+        self.config = {'DERIVATIVE_CACHE_FOLDER': str(folder), 'DERIVATIVE_CACHE_MAX_BYTES': max_bytes}
+        self.extensions = {}
+
+
+def _cache(folder, max_bytes=1 << 20):
+    return DerivativeCache(_Config(folder, max_bytes))
+
+
+def _render_once(folder, log):
+    def render():
+        with open(log, 'a') as fb:
+            fb.write('render\n')
+        time.sleep(0.3)
+        return b'x' * 100
+    _cache(folder).get('key', '.jpg', render)
+
+
+def test_one_render_across_processes(tmp_path):
+    # 模拟多个 gunicorn worker：各进程有独立的 DerivativeCache 实例
+    log = tmp_path / 'renders.log'
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_render_once, args=(tmp_path / 'cache', log)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0] * 4
+    assert log.read_text() == 'render\n'
+    # 锁文件在释放时删除
+    assert [name for name in os.listdir(tmp_path / 'cache') if not name.endswith('.jpg')] == []
+
+
+def test_eviction_uses_directory_size(tmp_path):
+    # 两个实例（进程）各自写入，总大小仍受同一上限约束
+    first, second = _cache(tmp_path, 1000), _cache(tmp_path, 1000)
+    for i in range(10):
+        (first if i % 2 else second).put(f'key{i}', '.bin', b'x' * 200)
+        time.sleep(0.01)  # 按 mtime 淘汰
+    sizes = [os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)]
+    assert sum(sizes) <= 1000
+    assert first.lookup('key9', '.bin') is not None
+    assert first.lookup('key0', '.bin') is None
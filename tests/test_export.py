@@ -0,0 +1,81 @@
+import io
+import json
+import zipfile
+import pytest
+
+
+@pytest.fixture
+def exported(client, headers, upload):
+    """上传 scene_0、scene_1、同名的 scene_0 副本及未标记的 scene_3，返回导出 zip"""
+    for name in ('scene_0.jpg', 'scene_1.jpg', 'scene_0.jpg', 'scene_3.jpg'):
+        upload(name)
+
+    def exported(fmt, query=''):
+        response = client.get(f'/export?format={fmt}&{query}', headers=headers)
+        assert response.status_code == 200 and response.mimetype == 'application/zip'
+        return zipfile.ZipFile(io.BytesIO(response.data))
+    return exported
+
+
+def test_archive_name():
+    from export import _archive_name
+    used = set()
+    names = [_archive_name(img_name, f'uploads/md5{ext}', used) for img_name, ext in [
+        ('a.jpg', '.jpg'),
+        ('a.jpg', '.jpg'),
+        ('A.JPG', '.jpg'),  # 按不区分大小写的主干去重
+        ('a_2.jpg', '.jpg'),  # 与追加的序号冲突
+        ('a.png', '.jpg'),  # 扩展名与存储的文件一致
+        ('a.jpg', '.png'),  # 主干不同
+        ('dir/b.jpg', '.jpg'),
+        ('..\\c.jpg', '.jpg'),
+        ('..', '.jpg'),
+        (None, '.jpg'),
+    ]]
+    assert names == ['a.jpg', 'a_2.jpg', 'A_3.jpg', 'a_2_2.jpg', 'a.png.jpg', 'a.jpg.png', 'dir_b.jpg',
+                     '_c.jpg', 'image.jpg', 'image_2.jpg']
+
+
+def test_yolo(exported):
+    zf = exported('yolo')
+    assert sorted(zf.namelist()) == [
+        'data.yaml', 'images/scene_0.jpg', 'images/scene_0_2.jpg', 'images/scene_1.jpg', 'images/scene_3.jpg',
+        'labels/scene_0.txt', 'labels/scene_0_2.txt', 'labels/scene_1.txt', 'labels/scene_3.txt']
+    with open('imgs/scene_0.jpg', 'rb') as fb:
+        assert zf.read('images/scene_0.jpg') == fb.read()
+    # 160x120 的图像，每行为 类别 中心x 中心y 宽 高
+    assert zf.read('labels/scene_0.txt').decode().splitlines() == [
+        '0 0.125000 0.208333 0.125000 0.250000',
+        '0 0.500000 0.458333 0.375000 0.250000',
+        '1 0.056250 0.075000 0.050000 0.066667',
+    ]
+    assert zf.read('labels/scene_0_2.txt') == zf.read('labels/scene_0.txt')
+    assert zf.read('labels/scene_1.txt').decode().splitlines() == [
+        '0 0.218750 0.291667 0.187500 0.250000',
+        '2 0.500000 0.541667 0.125000 0.083333',
+    ]
+    assert zf.read('labels/scene_3.txt') == b''
+    data_yaml = zf.read('data.yaml').decode()
+    assert 'nc: 6\n' in data_yaml and '  0: ship\n' in data_yaml and '  5: harbor\n' in data_yaml
+
+
+def test_coco(exported):
+    zf = exported('coco', 'tags=ship')
+    assert sorted(zf.namelist()) == [
+        'annotations/instances.json', 'images/scene_0.jpg', 'images/scene_0_2.jpg', 'images/scene_1.jpg']
+    coco = json.loads(zf.read('annotations/instances.json'))
+    assert [category['name'] for category in coco['categories']] == \
+        ['ship', 'aircraft', 'car', 'tank', 'bridge', 'harbor']
+    assert [(image['id'], image['file_name'], image['width'], image['height']) for image in coco['images']] == [
+        (1, 'scene_0.jpg', 160, 120), (2, 'scene_1.jpg', 160, 120), (3, 'scene_0_2.jpg', 160, 120)]
+    # 类别编号从 1 开始；标注编号连续
+    assert [(item['id'], item['image_id'], item['category_id'], item['bbox'], item['area'])
+            for item in coco['annotations']] == [
+        (1, 1, 1, [10, 10, 20, 30], 600), (2, 1, 1, [50, 40, 60, 30], 1800), (3, 1, 2, [5, 5, 8, 8], 64),
+        (4, 2, 1, [20, 20, 30, 30], 900), (5, 2, 3, [70, 60, 20, 10], 200),
+        (6, 3, 1, [10, 10, 20, 30], 600), (7, 3, 1, [50, 40, 60, 30], 1800), (8, 3, 2, [5, 5, 8, 8], 64),
+    ]
+
+
+def test_invalid_format(client, headers):
+    assert client.get('/export?format=voc', headers=headers).status_code == 400
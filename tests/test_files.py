@@ -0,0 +1,92 @@
+import os
+import uuid
+
+
+def _image_files(app, image_id):
+    """图像的 (原始文件 md5, 标签图像 md5)"""
+    from model import db, Image
+    with app.app_context():
+        return db.session.query(Image.img_md5, Image.labeled_image_md5).filter(Image.id == uuid.UUID(image_id)).one()
+
+
+def _files(app):
+    """File 表：md5 -> (路径, 引用数)"""
+    from model import db, File
+    with app.app_context():
+        return {md5: (path, refs) for md5, path, refs in db.session.query(File.md5, File.path, File.refs)}
+
+
+def _tombstones(app):
+    from model import FileTombstone
+    with app.app_context():
+        return FileTombstone.query.count()
+
+
+def test_upload_deduplicates_content(app, client, headers, upload):
+    first = upload('scene_3.jpg')
+    second = upload('scene_3.jpg', 'other.jpg')
+    md5, _ = _image_files(app, first)
+    assert _image_files(app, second)[0] == md5
+    files = _files(app)
+    assert list(files) == [md5]
+    path, refs = files[md5]
+    assert refs == 2 and os.path.exists(path)
+    # 只保存一份，暂存文件已清理
+    assert os.listdir('uploads') == [os.path.basename(path)]
+    assert client.get(f'/image/{md5}', headers=headers).status_code == 200
+
+
+def test_delete_releases_and_collects(app, client, headers, upload, wait_until):
+    first = upload('scene_3.jpg')
+    second = upload('scene_3.jpg', 'other.jpg')
+    md5, _ = _image_files(app, first)
+    path = _files(app)[md5][0]
+
+    assert client.post(f'/modify?id={first}&delete=true', headers=headers).status_code == 200
+    assert _files(app) == {md5: (path, 1)}
+    assert _tombstones(app) == 0 and os.path.exists(path)
+
+    assert client.post(f'/modify?id={second}&delete=true', headers=headers).status_code == 200
+    assert _files(app) == {}
+    # 提交后由 FileCollector 删除文件及墓碑
+    assert wait_until(lambda: not os.path.exists(path))
+    assert wait_until(lambda: _tombstones(app) == 0)
+    assert client.get(f'/image/{md5}', headers=headers).status_code == 404
+    # 客户端缓存的 ETag 不能让已删除的内容返回 304
+    for query, etag in (('', md5), ('?w=64', f'{md5}-64.jpg')):
+        response = client.get(f'/image/{md5}{query}', headers={**headers, 'If-None-Match': f'"{etag}"'})
+        assert response.status_code == 404
+
+    # 删除后重新上传相同内容
+    upload('scene_3.jpg')
+    assert _files(app)[md5][1] == 1 and os.path.exists(path)
+
+
+def test_labeled_images_are_reference_counted(app, client, headers, upload, wait_until):
+    ids = [upload('scene_0.jpg'), upload('scene_0.jpg')]
+    md5, labeled_md5 = _image_files(app, ids[0])
+    # 相同原图与标签框渲染出相同的标签图像
+    assert labeled_md5 is not None and _image_files(app, ids[1]) == (md5, labeled_md5)
+    files = _files(app)
+    assert files[md5][1] == 2 and files[labeled_md5][1] == 2
+    paths = [files[md5][0], files[labeled_md5][0]]
+
+    response = client.post('/modify/batch', headers=headers, json={'action': 'delete', 'ids': ids})
+    assert response.json['count'] == 2
+    assert _files(app) == {}
+    assert wait_until(lambda: not any(os.path.exists(path) for path in paths))
+
+
+def test_collect_skips_reacquired_content(app, upload):
+    from model import db, File, FileTombstone
+    image_id = upload('scene_3.jpg')
+    md5, _ = _image_files(app, image_id)
+    path = _files(app)[md5][0]
+    with app.app_context():
+        # 引用归零后、文件删除前再次登记相同内容：撤销墓碑，文件保留
+        File.release(md5)
+        File.acquire(md5, path)
+        db.session.commit()
+        assert FileTombstone.query.count() == 0
+        assert app.extensions['file_collector'].collect() == 0
+    assert os.path.exists(path)
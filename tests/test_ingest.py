@@ -0,0 +1,63 @@
+import io
+import os
+import shutil
+import zipfile
+import pytest
+
+
+def _zip(names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name in names:
+            zf.write(os.path.join('imgs', 'scene_3.jpg'), name)
+    buffer.seek(0)
+    return buffer
+
+
+def _upload_zip(client, headers, names):
+    return client.post('/upload/batch', headers=headers, data={'files': (_zip(names), 'images.zip')})
+
+
+def _image_names(app):
+    from model import db, Image
+    with app.app_context():
+        return sorted(name for (name,) in db.session.query(Image.img_name))
+
+
+def test_long_member_name_fails_alone(app, client, headers):
+    long_name = 'x' * 40 + '.jpg'
+    response = _upload_zip(client, headers, ['dir/ok.jpg', long_name])
+    assert response.status_code == 200
+    assert [result['status'] for result in response.json['results']] == ['success', 'fail']
+    assert _image_names(app) == ['ok.jpg']
+
+
+@pytest.mark.parametrize('limit, factor', [
+    ('ARCHIVE_MAX_MEMBERS', None),
+    ('ARCHIVE_MAX_MEMBER_BYTES', 0.5),
+    ('ARCHIVE_MAX_TOTAL_BYTES', 1.5),  # 第一个文件写入后超出
+])
+def test_archive_limits(app, client, headers, monkeypatch, limit, factor):
+    size = os.path.getsize(os.path.join('imgs', 'scene_3.jpg'))
+    monkeypatch.setitem(app.config, limit, int(size * factor) if factor else 1)
+    response = _upload_zip(client, headers, ['a.jpg', 'b.jpg'])
+    assert response.status_code == 400
+    # 整个请求被拒绝，已暂存的文件被删除
+    assert _image_names(app) == []
+    assert os.listdir('uploads') == []
+
+
+def test_import_images_discards_prefetched_batch(app, headers, monkeypatch, tmp_path):
+    import commands
+    for i in range(4):
+        shutil.copy(os.path.join('imgs', 'scene_3.jpg'), tmp_path / f'{i}.jpg')
+
+    def fail(*args):
+        raise RuntimeError('write failed')
+    monkeypatch.setattr(commands, 'add_images', fail)
+    with app.app_context():  # flask 命令行为所有命令推入应用上下文
+        result = app.test_cli_runner().invoke(args=['import-images', str(tmp_path), '--author', 'tester@example.com',
+                                                    '--workers', '2', '--batch-size', '2'])
+    assert isinstance(result.exception, RuntimeError)
+    # 写入第一批失败时，第二批已在进程池中暂存，同样需要删除
+    assert os.listdir('uploads') == []
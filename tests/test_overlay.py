@@ -0,0 +1,71 @@
+import uuid
+import pytest
+
+
+@pytest.fixture
+def scene_0(app, upload):
+    """上传 scene_0（ship 2 个框、aircraft 1 个框），返回文件哈希"""
+    from model import db, Image
+    image_id = upload('scene_0.jpg')
+    with app.app_context():
+        return image_id, db.session.query(Image.img_md5).filter(Image.id == uuid.UUID(image_id)).scalar()
+
+
+def _overlay(client, md5, query='', etag=None):
+    headers = {'If-None-Match': f'"{etag}"'} if etag else {}
+    return client.get(f'/image/{md5}/overlay?{query}', headers=headers)
+
+
+def _etag(client, md5, query=''):
+    response = _overlay(client, md5, query)
+    assert response.status_code == 200
+    return response.get_etag()[0]
+
+
+def test_etag_depends_on_params(client, scene_0):
+    _, md5 = scene_0
+    etags = {query: _etag(client, md5, query) for query in
+             ('', 'tags=ship', 'tags=aircraft', 'w=64', 'fmt=png', 'tags=ship&w=64&fmt=png')}
+    assert len(set(etags.values())) == len(etags)
+    # 类别的顺序与重复不影响键；全部类别等同于不指定
+    assert _etag(client, md5, 'tags=aircraft, ship,ship') == _etag(client, md5, 'tags=ship,aircraft')
+    assert _etag(client, md5, 'tags=' + ','.join(['ship', 'aircraft', 'car', 'tank', 'bridge', 'harbor'])) == etags['']
+
+
+def test_revalidate(client, scene_0):
+    _, md5 = scene_0
+    response = _overlay(client, md5, 'tags=ship')
+    assert response.cache_control.public and response.cache_control.no_cache
+    etag = response.get_etag()[0]
+    response = _overlay(client, md5, 'tags=ship', etag=etag)
+    assert response.status_code == 304 and response.get_etag() == (etag, False)
+    # 其他参数的请求不能用该 ETag 返回 304
+    assert _overlay(client, md5, 'tags=aircraft', etag=etag).status_code == 200
+
+
+def test_etag_follows_boxes_and_palette(app, client, headers, scene_0, monkeypatch):
+    import view
+    image_id, md5 = scene_0
+    before = _overlay(client, md5)
+    ship_only = _etag(client, md5, 'tags=ship')
+
+    # 标签框变化：ETag 与缓存的图像随之变化，未涉及的类别不变
+    response = client.post('/modify/batch', headers=headers,
+                           json={'action': 'retag', 'ids': [image_id], 'remove_tags': ['aircraft']})
+    assert response.status_code == 200
+    after = _overlay(client, md5, etag=before.get_etag()[0])
+    assert after.status_code == 200 and after.get_etag() != before.get_etag()
+    assert after.data != before.data
+    assert _etag(client, md5, 'tags=ship') == ship_only
+
+    monkeypatch.setattr(view, 'PALETTE_VERSION', 'changed')
+    assert _etag(client, md5, 'tags=ship') != ship_only
+
+
+def test_invalid_and_missing(client, headers, scene_0):
+    image_id, md5 = scene_0
+    assert _overlay(client, md5, 'tags=nope').status_code == 400
+    assert _overlay(client, md5, 'w=33').status_code == 400
+    etag = _etag(client, md5, 'tags=tank')  # 没有该类别的标签框，删除后键不变
+    assert client.post(f'/modify?id={image_id}&delete=true', headers=headers).status_code == 200
+    assert _overlay(client, md5, 'tags=tank', etag=etag).status_code == 404
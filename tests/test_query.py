@@ -0,0 +1,61 @@
+import base64
+import json
+import pytest
+
+
+@pytest.fixture
+def batch_uploaded(client, headers):
+    """一次批量上传 5 张图像，img_date 全部相同，返回按 id 排序的 id 列表"""
+    files = [(open(f'imgs/scene_{i}.jpg', 'rb'), f'scene_{i}.jpg') for i in range(5)]
+    try:
+        response = client.post('/upload/batch', headers=headers, data={'files': files})
+    finally:
+        for fb, _ in files:
+            fb.close()
+    assert response.status_code == 200
+    return sorted(result['id'].replace('-', '') for result in response.json['results'])
+
+
+def _query(client, headers, query=''):
+    return client.get(f'/query?{query}', headers=headers)
+
+
+def _ids(response):
+    return [item['id'].replace('-', '') for item in response.json]
+
+
+def test_keyset_pages_with_equal_dates(client, headers, batch_uploaded):
+    assert len({item['img_date'] for item in _query(client, headers).json}) == 1
+    pages, cursor = [], None
+    while True:
+        response = _query(client, headers, 'limit=2' + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        pages.append(_ids(response))
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    # 日期相同时按 id 排序，分页不重复、不遗漏
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sum(pages, []) == batch_uploaded == _ids(_query(client, headers))
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-base64!',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+    base64.urlsafe_b64encode(b'2026-01-01T00:00:00').decode(),
+    base64.urlsafe_b64encode(b'yesterday|0123').decode(),
+    base64.urlsafe_b64encode(b'2026-01-01T00:00:00|not-a-uuid').decode(),
+])
+def test_invalid_cursor(client, headers, cursor):
+    response = _query(client, headers, f'limit=2&cursor={cursor}')
+    assert response.status_code == 400
+    assert response.json == {'error': 'Invalid cursor'}
+
+
+@pytest.mark.parametrize('query', ['', 'limit=3', 'tags=ship'])
+def test_stream_matches_buffered(app, client, headers, batch_uploaded, monkeypatch, query):
+    monkeypatch.setitem(app.config, 'QUERY_STREAM_BATCH', 2)  # 跨越多个批次
+    buffered = _query(client, headers, query)
+    streamed = _query(client, headers, f'{query}&stream=true')
+    assert streamed.status_code == 200 and streamed.mimetype == 'application/json'
+    assert json.loads(streamed.data) == buffered.json
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+
+
+def test_render_job_requires_token(app, client, headers):
+    from model import db, RenderJob
+    with app.app_context():
+        job = RenderJob(status=RenderJob.PENDING)
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+    assert client.get(f'/render/{job_id}').status_code == 401
+    response = client.get(f'/render/{job_id}', headers=headers)
+    assert response.status_code == 202 and response.json['status'] == RenderJob.PENDING
+
+
+def test_requeue_stale_running_jobs(app):
+    from model import db, RenderJob
+    now = datetime.now()
+    with app.app_context():
+        db.session.add_all([
+            RenderJob(status=RenderJob.RUNNING, started_at=now - timedelta(hours=1)),
+            RenderJob(status=RenderJob.RUNNING, started_at=now),
+            RenderJob(status=RenderJob.RUNNING, created_at=now - timedelta(hours=1)),  # 升级前开始的任务
+            RenderJob(status=RenderJob.DONE, started_at=now - timedelta(hours=1)),
+        ])
+        db.session.commit()
+        assert RenderJob.requeue_stale(timedelta(minutes=10)) == 2
+        assert [job.status for job in RenderJob.query.order_by(RenderJob.id)] == [
+            RenderJob.PENDING, RenderJob.RUNNING, RenderJob.PENDING, RenderJob.DONE]
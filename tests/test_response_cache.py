@@ -0,0 +1,63 @@
+def _catalog_version(app):
+    from model import get_catalog_version
+    with app.app_context():
+        return get_catalog_version()
+
+
+def _query(client, headers, query='', etag=None):
+    if etag is not None:
+        headers = {**headers, 'If-None-Match': f'"{etag}"'}
+    return client.get(f'/query?{query}', headers=headers)
+
+
+def _names(response):
+    return sorted(item['img_name'] for item in response.json)
+
+
+def test_write_changes_etag(app, client, headers, upload):
+    upload('scene_0.jpg')
+    version = _catalog_version(app)
+    first = _query(client, headers)
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    assert _query(client, headers).get_etag() == first.get_etag()
+
+    upload('scene_1.jpg')
+    assert _catalog_version(app) > version  # 上传及提交后的渲染、感知哈希各自提交
+    second = _query(client, headers)
+    # 版本号变化后旧条目不再命中
+    assert second.get_etag() != first.get_etag()
+    assert _names(second) == ['scene_0.jpg', 'scene_1.jpg']
+
+
+def test_if_none_match(client, headers, upload):
+    upload('scene_0.jpg')
+    etag, _ = _query(client, headers).get_etag()
+    response = _query(client, headers, etag=etag)
+    assert response.status_code == 304 and response.data == b''
+    assert response.get_etag() == (etag, False)
+
+    # 写入后客户端缓存的 ETag 失效
+    upload('scene_1.jpg')
+    response = _query(client, headers, etag=etag)
+    assert response.status_code == 200 and _names(response) == ['scene_0.jpg', 'scene_1.jpg']
+
+
+def test_params_do_not_collide(client, headers, upload):
+    for name in ('scene_0.jpg', 'scene_1.jpg', 'scene_2.jpg'):
+        upload(name)
+    by_name = {}
+    for name in ('scene_0', 'scene_1'):
+        response = _query(client, headers, f'name={name}')
+        by_name[name] = (response.get_etag(), _names(response))
+    assert by_name['scene_0'][0] != by_name['scene_1'][0]
+    # 第二个请求不会命中第一个请求的条目
+    assert by_name['scene_0'][1] == ['scene_0.jpg'] and by_name['scene_1'][1] == ['scene_1.jpg']
+    assert _names(_query(client, headers, 'tags=tank')) == ['scene_2.jpg']
+    assert _names(_query(client, headers, 'tags=ship')) == ['scene_0.jpg', 'scene_1.jpg']
+
+    # 参数顺序及 tags 顺序不同的等价请求共用条目
+    assert _query(client, headers, 'tags=ship,car&limit=5').get_etag() == \
+        _query(client, headers, 'limit=5&tags=car,ship,ship').get_etag()
+    # 相同参数的不同接口不共用条目
+    info = client.post('/info', headers=headers, json={})
+    assert info.get_etag() != _query(client, headers).get_etag()
@@ -0,0 +1,51 @@
+import uuid
+import pytest
+
+
+def _phash(app, image_id):
+    from model import db, Image
+    with app.app_context():
+        return db.session.query(Image.phash).filter(Image.id == uuid.UUID(image_id)).scalar()
+
+
+@pytest.fixture
+def reject_distance(app, monkeypatch):
+    def reject_distance(distance):
+        monkeypatch.setitem(app.config, 'PHASH_REJECT_DISTANCE', distance)
+    return reject_distance
+
+
+def test_phash_computed_after_commit(app, upload, monkeypatch):
+    import view
+
+    # 未配置拒绝距离时请求中不解码图像，感知哈希由 RenderQueue 计算
+    def fail(item):
+        raise AssertionError('hashed on the request path')
+    monkeypatch.setattr(view, 'hash_staged', fail)
+    image_id = upload('scene_3.jpg')
+    assert _phash(app, image_id) is not None
+
+
+def test_reject_near_duplicate(app, client, headers, upload, reject_distance):
+    reject_distance(0)
+    image_id = upload('scene_3.jpg')
+    assert _phash(app, image_id) is not None
+    with open('imgs/scene_3.jpg', 'rb') as fb:
+        response = client.post('/upload', headers=headers, data={'file': (fb, 'again.jpg')})
+    assert response.status_code == 409
+    assert response.json['similar'] == [{'id': image_id, 'img_name': 'scene_3.jpg', 'distance': 0}]
+
+
+def test_reject_near_duplicate_within_batch(app, client, headers, reject_distance):
+    reject_distance(0)
+    files = [(open('imgs/scene_3.jpg', 'rb'), 'first.jpg'), (open('imgs/scene_4.jpg', 'rb'), 'other.jpg'),
+             (open('imgs/scene_3.jpg', 'rb'), 'second.jpg')]
+    try:
+        response = client.post('/upload/batch', headers=headers, data={'files': files})
+    finally:
+        for fb, _ in files:
+            fb.close()
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [result['status'] for result in results] == ['success', 'success', 'fail']
+    assert results[2]['similar'] == [{'filename': 'first.jpg', 'distance': 0}]
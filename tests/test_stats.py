@@ -0,0 +1,93 @@
+import pytest
+
+
+def _stats(app):
+    """统计表中的非零行：({日期: (总数, 未标记数)}, {标签 id: 频率})"""
+    from model import db, ImageDailyStat, TagStat
+    with app.app_context():
+        days = {day: (total, unlabeled) for day, total, unlabeled in
+                db.session.query(ImageDailyStat.day, ImageDailyStat.total, ImageDailyStat.unlabeled) if total}
+        tags = {tag_id: frequency for tag_id, frequency in
+                db.session.query(TagStat.tag_id, TagStat.frequency) if frequency}
+    return days, tags
+
+
+def assert_matches_recount(app):
+    """增量维护的统计与按 image、tags 表全量重建的结果一致，返回统计"""
+    from model import rebuild_stats
+    incremental = _stats(app)
+    with app.app_context():
+        rebuild_stats()
+    assert _stats(app) == incremental
+    return incremental
+
+
+@pytest.fixture
+def uploaded(upload):
+    return {name: upload(name) for name in ('scene_0.jpg', 'scene_1.jpg', 'scene_2.jpg', 'scene_3.jpg')}
+
+
+def test_stats_after_upload(app, client, headers, upload, uploaded):
+    # 相同内容再次上传为新图像，同样计入统计
+    upload('scene_0.jpg', 'scene_0_copy.jpg')
+    with open('imgs/scene_4.jpg', 'rb') as fb:
+        response = client.post('/upload/batch', headers=headers, data={'files': [(fb, 'scene_4.jpg')]})
+    assert response.status_code == 200
+    days, tags = assert_matches_recount(app)
+    assert list(days.values()) == [(6, 3)]
+    assert tags == {0: 2, 1: 1, 2: 1, 3: 1}
+
+
+def test_stats_after_retag(app, client, headers, uploaded):
+    ids = list(uploaded.values())
+    response = client.post('/modify/batch', headers=headers,
+                           json={'action': 'retag', 'ids': ids, 'add_tags': {'bridge': 1}, 'remove_tags': ['ship']})
+    assert response.json['count'] == 4
+    days, tags = assert_matches_recount(app)
+    assert list(days.values()) == [(4, 0)]
+    assert tags == {1: 1, 2: 1, 3: 1, 4: 4}
+
+    # 删除全部标签后变为未标记
+    response = client.post('/modify/batch', headers=headers, json={
+        'action': 'retag', 'ids': ids, 'remove_tags': ['aircraft', 'car', 'tank', 'bridge']})
+    assert response.status_code == 200
+    days, tags = assert_matches_recount(app)
+    assert list(days.values()) == [(4, 4)]
+    assert tags == {}
+
+
+def test_stats_after_delete(app, client, headers, uploaded):
+    response = client.post(f"/modify?id={uploaded['scene_0.jpg']}&delete=true", headers=headers)
+    assert response.status_code == 200
+    days, tags = assert_matches_recount(app)
+    assert list(days.values()) == [(3, 1)]
+    assert tags == {0: 1, 2: 1, 3: 1}
+
+    response = client.post('/modify/batch', headers=headers, json={
+        'action': 'delete', 'ids': [uploaded['scene_1.jpg'], uploaded['scene_3.jpg']]})
+    assert response.json['count'] == 2
+    days, tags = assert_matches_recount(app)
+    assert list(days.values()) == [(1, 0)]
+    assert tags == {3: 1}
+
+
+def test_info_served_from_rollups(app, client, headers, uploaded):
+    from model import db, ImageTag, rebuild_stats
+    before = client.post('/info', headers=headers, json={}).json
+    # 绕过统计直接修改 tags 表：/info 不重新计数，重建后才反映
+    with app.app_context():
+        db.session.query(ImageTag).filter(ImageTag.tag_id == 3).delete()
+        db.session.commit()
+    assert client.post('/info', headers=headers, json={}).json['tag_freq'] == before['tag_freq']
+    with app.app_context():
+        rebuild_stats()
+    tag_freq = client.post('/info', headers=headers, json={}).json['tag_freq']
+    assert {item['name']: item['frequency'] for item in tag_freq}['tank'] == 0
+
+
+def test_info_empty_catalog(client, headers):
+    response = client.post('/info', headers=headers, json={})
+    assert response.status_code == 200
+    assert response.json['unlabeled_image_percentage'] == 0.0
+    assert response.json['total_image_num'] == 0
+    assert [item['count'] for item in response.json['image_num_by_date']] == [0] * 11
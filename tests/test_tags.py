@@ -0,0 +1,35 @@
+import pytest
+
+
+@pytest.fixture
+def uploaded(upload):
+    return {name: upload(name) for name in ('scene_0.jpg', 'scene_1.jpg', 'scene_2.jpg', 'scene_3.jpg')}
+
+
+def _names(app, *args):
+    from model import db, Image, Tag
+    with app.app_context():
+        return sorted(name for (name,) in db.session.query(Image.img_name).filter(Tag.images_filter(*args)))
+
+
+@pytest.mark.parametrize('tag_names, match, min_num, expected', [
+    # scene_0：ship 2、aircraft 1；scene_1：ship 1、car 1；scene_2：tank 1
+    (['ship', 'aircraft'], 'any', None, ['scene_0.jpg', 'scene_1.jpg']),
+    (['ship', 'aircraft'], 'all', None, ['scene_0.jpg']),  # scene_1 缺少 aircraft
+    (['ship', 'car'], 'all', None, ['scene_1.jpg']),
+    (['ship'], 'all', 2, ['scene_0.jpg']),  # scene_1 的 ship 数量不足
+    (['ship', 'aircraft'], 'all', 2, []),  # scene_0 的 aircraft 数量不足
+    (['ship', 'tank'], 'any', 1, ['scene_0.jpg', 'scene_1.jpg', 'scene_2.jpg']),
+    (['ship', 'tank'], 'any', 2, ['scene_0.jpg']),
+    (['ship', 'nope'], 'all', None, []),  # 未知标签无法全部满足
+    (['ship', 'nope'], 'any', None, ['scene_0.jpg', 'scene_1.jpg']),
+])
+def test_images_filter(app, uploaded, tag_names, match, min_num, expected):
+    assert _names(app, tag_names, match, min_num) == expected
+
+
+def test_query_tag_params(client, headers, uploaded):
+    response = client.get('/query?tags=ship,aircraft&match=all&min_count=1', headers=headers)
+    assert [item['img_name'] for item in response.json] == ['scene_0.jpg']
+    assert client.get('/query?tags=ship&match=some', headers=headers).status_code == 400
+    assert client.get('/query?tags=ship&min_count=x', headers=headers).status_code == 400
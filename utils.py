@@ -1,7 +1,12 @@
 import hashlib
+import json
 import os
+import sqlite3
+import tempfile
+import threading
 from pathlib import Path
 import cv2
+import numpy as np
 import pickle as pkl
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
@@ -14,6 +19,10 @@ CATEGORIES = {
     5: 'harbor',
 }
 
+# 标签索引的 mmap 大小，多个 worker 通过系统页缓存共享
+LABEL_DB_MMAP_SIZE = 256 * 1024 * 1024
+LABEL_QUERY_CHUNK = 500
+
 def rgb(r,g,b):
     return b, g, r
 
@@ -26,58 +35,297 @@ COLORS = {
     5: rgb(245, 113, 112)
 }
 
+# 调色板版本，COLORS 修改后叠加图的缓存键随之改变
+PALETTE_VERSION = hashlib.md5(repr(sorted(COLORS.items())).encode()).hexdigest()[:8]
+
+# 派生图像可用的输出格式及编码参数
+DERIVATIVE_FORMATS = {
+    'jpg': ('image/jpeg', [cv2.IMWRITE_JPEG_QUALITY, 85]),
+    'png': ('image/png', []),
+    'webp': ('image/webp', [cv2.IMWRITE_WEBP_QUALITY, 80]),
+}
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_md5_from_image(image):
-    """从cv2图像对象计算MD5哈希值"""
+def save_stream(stream, folder: str, chunk_size: int = 1 << 20):
+    """边写入临时文件边计算MD5，返回 (md5, 临时文件路径)
+
+    临时文件与目标目录位于同一文件系统，调用方确认后可用 os.replace 原子改名
+    """
+    Path(folder).mkdir(parents=True, exist_ok=True)
     hash_md5 = hashlib.md5()
-    # 将图像编码为JPEG格式（或任何其他格式），以便可以计算哈希值
-    is_success, im_buf_arr = cv2.imencode(".jpg", image)
-    if not is_success:
-        raise ValueError("Failed to encode image.")
-    byte_im = im_buf_arr.tobytes()
-    hash_md5.update(byte_im)
-    return hash_md5.hexdigest()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while chunk := stream.read(chunk_size):
+                hash_md5.update(chunk)
+                out.write(chunk)
+        os.chmod(tmp_path, 0o644)  # mkstemp 默认仅属主可读，需允许前端服务器读取
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return hash_md5.hexdigest(), tmp_path
 
 
 class SarTools:
+    """标签数据访问
+
+    优先使用由 label.pkl 转换得到的 SQLite 索引（同名 .db 文件），按图像名按需查询，
+    启动耗时与标签规模无关，页面经 mmap 由各进程通过系统缓存共享；
+    索引不存在时退化为首次访问时加载整个 pickle
+    """
+
     def __init__(self, label_pkl: str):
         self.label_pkl = label_pkl
-        self.label_data = self.__init_data()
+        self.label_db = str(Path(label_pkl).with_suffix('.db'))
+        if not os.path.exists(self.label_db) and not os.path.exists(self.label_pkl):
+            raise FileNotFoundError(self.label_pkl)
+        self._local = threading.local()
+        self._label_data = None
 
+    @property
+    def label_data(self) -> dict:
+        """完整的 pickle 标签数据，仅在没有 SQLite 索引时使用"""
+        if self._label_data is None:
+            with open(self.label_pkl, 'rb') as fb:
+                self._label_data = pkl.load(fb)
+        return self._label_data
 
-    def __init_data(self):
-        if not os.path.exists(self.label_pkl):
-            raise FileNotFoundError(self.label_pkl)
-        fb = open(self.label_pkl, 'rb')
-        return pkl.load(fb)
+    def _connection(self):
+        # sqlite3 连接不能跨线程或跨进程复用
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(f"file:{self.label_db}?mode=ro", uri=True)
+            conn.execute(f"PRAGMA mmap_size = {LABEL_DB_MMAP_SIZE}")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get_label(self, image_name: str) -> dict | None:
+        """返回 {"tags": {tid: num}, "box": {tid: [[x, y, w, h], ...]}}，无标签时返回 None"""
+        if not os.path.exists(self.label_db):
+            return self.label_data.get(image_name)
+        row = self._connection().execute(
+            "SELECT tags, box FROM label WHERE image_name = ?", (image_name,)).fetchone()
+        if row is None:
+            return None
+        return {"tags": _decode_id_dict(row[0]), "box": _decode_id_dict(row[1])}
+
+    def get_labels(self, image_names) -> dict:
+        """批量查询标签，返回 图像名 -> 标签数据，无标签的图像不在结果中"""
+        image_names = list(set(image_names))
+        if not os.path.exists(self.label_db):
+            return {name: self.label_data[name] for name in image_names if name in self.label_data}
+        labels = {}
+        for i in range(0, len(image_names), LABEL_QUERY_CHUNK):
+            chunk = image_names[i:i + LABEL_QUERY_CHUNK]
+            rows = self._connection().execute(
+                f"SELECT image_name, tags, box FROM label WHERE image_name IN ({','.join('?' * len(chunk))})", chunk)
+            for name, tags, box in rows:
+                labels[name] = {"tags": _decode_id_dict(tags), "box": _decode_id_dict(box)}
+        return labels
 
     def get_tags(self, image_name: str) -> dict | None:
-        if image_name in self.label_data.keys():
-            return self.label_data[image_name]["tags"]
-        return None
+        label = self.get_label(image_name)
+        return label["tags"] if label is not None else None
+
+    def get_boxes(self, image_name: str) -> dict | None:
+        label = self.get_label(image_name)
+        return label["box"] if label is not None else None
 
     def draw_box(self, image_name: str, image_path: str, save_path: str):
-        image = cv2.imread(image_path)
-        id_boxes: dict = self.label_data[image_name]["box"]
-        for tid, boxes in id_boxes.items():
-            for box in boxes:
-                x, y, w, h = [int(i) for i in box]
-                cv2.rectangle(image, (x, y), (x+w, y+h), COLORS[tid], 2)
-        # 获取处理后图像的MD5哈希值
-        md5_hash = get_md5_from_image(image)
-
-        # 创建保存路径的目录（如果它不存在）
-        Path(save_path).mkdir(parents=True, exist_ok=True)
-
-        # 构建完整的目标文件路径，包括带有md5哈值的新文件名和扩展名
-        target_file_path = Path(save_path) / f"{md5_hash}.jpg"  # 假设我们使用的是JPEG格式
-
-        # 保存图像
-        cv2.imwrite(str(target_file_path), image)
-        return md5_hash, f"{save_path}/{md5_hash}.jpg"
+        return render_boxes(self.get_boxes(image_name), image_path, save_path)
+
+
+def _decode_id_dict(data: str) -> dict:
+    # JSON 对象的键为字符串，还原为类别 id
+    return {int(tid): value for tid, value in json.loads(data).items()}
+
+
+def render_derivative(image_path: str, width: int | None = None, fmt: str = 'jpg') -> bytes:
+    """生成缩放后的图像并编码为 fmt 格式，不放大原图"""
+    image, _ = load_image(image_path, width)
+    return encode_image(image, fmt)
+
+
+def load_image(image_path: str, width: int | None = None):
+    """解码图像，width 小于原图宽度时缩小，返回 (图像, 缩放比例)"""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Failed to read image: {image_path}")
+    scale = 1.0
+    if width and width < image.shape[1]:
+        scale = width / image.shape[1]
+        height = max(1, round(image.shape[0] * scale))
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    return image, scale
+
+
+def encode_image(image, fmt: str = 'jpg') -> bytes:
+    is_success, im_buf_arr = cv2.imencode(f".{fmt}", image, DERIVATIVE_FORMATS[fmt][1])
+    if not is_success:
+        raise ValueError("Failed to encode image.")
+    return im_buf_arr.tobytes()
+
+
+def perceptual_hash(image_path: str) -> int | None:
+    """64 位感知哈希（pHash）：缩小为 32x32 灰度图后做 DCT，左上 8x8 低频系数与其中位数比较
+
+    重新编码、缩放及轻微裁剪后的图像哈希相近；无法解码时返回 None
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+    small = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])  # 直流分量不参与中位数
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+# JPEG 中带有图像尺寸的帧头（SOF）标记，不含 DHT(C4)、JPG(C8)、DAC(CC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_size(image_path: str) -> tuple[int, int] | None:
+    """图像 (宽, 高)，PNG、JPEG 只读取文件头，其他格式解码后获取；无法读取时返回 None"""
+    with open(image_path, 'rb') as f:
+        head = f.read(24)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            return int.from_bytes(head[16:20], 'big'), int.from_bytes(head[20:24], 'big')
+        if head[:2] == b'\xff\xd8':
+            f.seek(2)
+            size = _jpeg_size(f)
+            if size is not None:
+                return size
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None
+    return image.shape[1], image.shape[0]
+
+
+def _jpeg_size(f):
+    # 逐个跳过标记段直到帧头，帧头中依次为精度(1)、高(2)、宽(2)
+    while True:
+        byte = f.read(1)
+        while byte == b'\xff':  # 填充字节
+            marker = f.read(1)
+            if marker != b'\xff':
+                break
+            byte = marker
+        else:
+            return None
+        if not marker:
+            return None
+        code = marker[0]
+        if code == 0x01 or 0xD0 <= code <= 0xD8:  # 无长度字段的标记
+            continue
+        if code == 0xD9 or code == 0xDA:  # 图像结束或扫描数据开始前仍未遇到帧头
+            return None
+        length = int.from_bytes(f.read(2), 'big')
+        if length < 2:
+            return None
+        if code in _JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            return int.from_bytes(data[3:5], 'big'), int.from_bytes(data[1:3], 'big')
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def draw_overlay(image, boxes, scale: float = 1.0, thickness: int = 2):
+    """在图像副本上绘制标签框，boxes 为 (类别 id, x, y, w, h) 序列，坐标按 scale 缩放
+
+    坐标换算与裁剪一次完成，每个框的四条边以 NumPy 切片赋值，不逐像素处理；原图保持不变，可反复使用
+    """
+    out = image.copy()
+    if not len(boxes):
+        return out
+    height, width = out.shape[:2]
+    boxes = np.asarray(boxes, dtype=np.float64)
+    x1 = np.rint(boxes[:, 1] * scale).astype(np.int64)
+    y1 = np.rint(boxes[:, 2] * scale).astype(np.int64)
+    x2 = np.rint((boxes[:, 1] + boxes[:, 3]) * scale).astype(np.int64)
+    y2 = np.rint((boxes[:, 2] + boxes[:, 4]) * scale).astype(np.int64)
+    visible = (x2 >= 0) & (y2 >= 0) & (x1 < width) & (y1 < height)
+    # 超出图像的边裁到图像内，右、下边界为闭区间
+    x1, x2 = np.clip(x1, 0, width - 1), np.clip(x2, 0, width - 1)
+    y1, y2 = np.clip(y1, 0, height - 1), np.clip(y2, 0, height - 1)
+    t = thickness
+    for tid, left, top, right, bottom in zip(boxes[visible, 0].astype(int), x1[visible], y1[visible],
+                                             x2[visible], y2[visible]):
+        color = COLORS[tid]
+        out[top:top + t, left:right + 1] = color
+        out[max(bottom - t + 1, top):bottom + 1, left:right + 1] = color
+        out[top:bottom + 1, left:left + t] = color
+        out[top:bottom + 1, max(right - t + 1, left):right + 1] = color
+    return out
+
+
+def convert_label_pickle(label_pkl: str, label_db: str) -> int:
+    """将 label.pkl 转换为 SQLite 标签索引，返回写入的图像数
+
+    先写入临时文件再原子替换，运行中的进程不会读到不完整的索引
+    """
+    with open(label_pkl, 'rb') as fb:
+        label_data = pkl.load(fb)
+    Path(label_db).parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(label_db)), suffix='.part')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        conn.execute("CREATE TABLE label (image_name TEXT PRIMARY KEY, tags TEXT NOT NULL, box TEXT NOT NULL) "
+                     "WITHOUT ROWID")
+        conn.executemany("INSERT INTO label VALUES (?, ?, ?)", (
+            (name, json.dumps({int(tid): int(num) for tid, num in label["tags"].items()}),
+             json.dumps({int(tid): [[float(v) for v in box] for box in boxes]
+                         for tid, boxes in label["box"].items()}))
+            for name, label in label_data.items()))
+        conn.commit()
+        conn.execute("VACUUM")
+        conn.close()
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, label_db)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return len(label_data)
+
+
+def render_boxes(id_boxes: dict, image_path: str, save_path: str):
+    """在图像上绘制标签框并保存，返回 (md5, 保存路径)
+
+    只编码一次 JPEG，MD5 与写入文件使用同一份字节；不依赖 SarTools，可在子进程中执行
+    """
+    byte_im = encode_boxes(id_boxes, image_path)
+    md5_hash = hashlib.md5(byte_im).hexdigest()
+
+    # 创建保存路径的目录（如果它不存在）
+    Path(save_path).mkdir(parents=True, exist_ok=True)
+
+    # 以md5命名，先写临时文件再原子改名，避免读到写了一半的文件
+    target_file_path = f"{save_path}/{md5_hash}.jpg"
+    fd, tmp_path = tempfile.mkstemp(dir=save_path, suffix='.part')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(byte_im)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, target_file_path)
+    return md5_hash, target_file_path
+
+
+def encode_boxes(id_boxes: dict, image_path: str) -> bytes:
+    """在图像上绘制标签框，返回 JPEG 编码后的字节"""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Failed to read image: {image_path}")
+    for tid, boxes in id_boxes.items():
+        for box in boxes:
+            x, y, w, h = [int(i) for i in box]
+            cv2.rectangle(image, (x, y), (x+w, y+h), COLORS[tid], 2)
+    is_success, im_buf_arr = cv2.imencode(".jpg", image)
+    if not is_success:
+        raise ValueError("Failed to encode image.")
+    return im_buf_arr.tobytes()
 
 
 
@@ -1,18 +1,40 @@
+import base64
+import binascii
+import hashlib
+import mimetypes
 import os.path
-from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify, send_file
-from werkzeug.utils import secure_filename
-from model import User, db, Image, Tag, File, count_image_num_by_date, get_tag_frequencies, get_unlabeled_image_percentage
+import time
+from datetime import date, datetime, timedelta
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context, current_app
+from sqlalchemy import and_, or_
+from model import User, RefreshToken, db, Image, Tag, Box, File, RenderJob, count_image_num_by_date, get_tag_frequencies, \
+    get_unlabeled_image_percentage, get_user_identity, get_tag_names, hamming_distance
 from functools import wraps
 import jwt
-from utils import allowed_file, SarTools
-from config import _SECRET_KEY, FILE_SAVE_FOLDER, FILE_ROUTE
-import hashlib
+from utils import allowed_file, render_derivative, load_image, encode_image, draw_overlay, DERIVATIVE_FORMATS, \
+    CATEGORIES, PALETTE_VERSION, SarTools
+from derivatives import DerivativeCache
+from response_cache import ResponseCache
+from ingest import ArchiveLimitError, is_archive, iter_archive, stage_file, hash_staged, discard_staged, add_images
+from bulk import delete_images, rename_images, retag_images
+from export import EXPORT_FORMATS, stream_dataset
+from collector import FileCollector
+from tasks import RenderQueue
+from metrics import metrics
+from config import _SECRET_KEY, FILE_ROUTE, FILE_MAX_AGE, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL, OVERLAY_BASE_CACHE_BYTES
+from cache import LRUCache, TTLCache
 import uuid
 
 account_bp = Blueprint('account_bp', __name__)
 file_bp = Blueprint('file_bp', __name__)
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
 sar_tools = SarTools("label/label.pkl")
+render_queue = RenderQueue(sar_tools)
+derivative_cache = DerivativeCache()
+response_cache = ResponseCache()
+file_collector = FileCollector()
+# (文件哈希, 宽度) -> (已解码的底图, 缩放比例)，切换叠加类别时无需重新解码
+overlay_bases = LRUCache(OVERLAY_BASE_CACHE_BYTES, sizeof=lambda item: item[0].nbytes)
 
 
 @account_bp.route('/register', methods=['POST'])
@@ -37,53 +59,233 @@ def login(): # 登录接口
         data = request.json
         email = data.get('email')
         passwd = data.get('password')
-        if User.query.filter(User.email == email).first() is None:
-            return jsonify(status="fail", msg="邮箱未注册")
         user = User.query.filter(User.email == email).first()
+        if user is None:
+            return jsonify(status="fail", msg="邮箱未注册")
         if user.check_password(passwd):
-            token = jwt.encode({
-                'sub': data['email'],
-                'exp': datetime.utcnow() + timedelta(days=1)
-            }, _SECRET_KEY, algorithm="HS256")
-            return jsonify(status="success", msg="登录成功", token=token, user = user.name)
+            if user.needs_rehash():
+                # 哈希配置已变更，使用明文密码透明升级
+                user.set_password(passwd)
+            refresh_token = RefreshToken.issue(user.id)
+            db.session.commit()
+            return jsonify(status="success", msg="登录成功", token=create_access_token(user.email),
+                           refresh_token=refresh_token, user = user.name)
         else:
             return jsonify(status="fail", msg="密码错误")
 
+
+@account_bp.route('/refresh', methods=['POST'])
+def refresh(): # 刷新令牌接口，无需再次提交密码
+    data = request.json or {}
+    token = data.get('refresh_token')
+    token_hash = RefreshToken.hash_token(token or '')
+    rotated = RefreshToken.rotate(token_hash)
+    record = RefreshToken.query.filter(RefreshToken.token_hash == token_hash).first()
+    if record is None or record.expires_at <= datetime.now():
+        return jsonify(status="fail", msg="刷新令牌无效"), 401
+    if not rotated:
+        # 已轮换的令牌被再次使用（或并发请求中的另一个已完成轮换），可能已泄露，吊销该用户所有刷新令牌
+        RefreshToken.revoke_all(record.user_id)
+        db.session.commit()
+        return jsonify(status="fail", msg="刷新令牌无效"), 401
+    user = db.session.get(User, record.user_id)
+    if user is None:
+        db.session.commit()  # 用户已删除，提交对该令牌的吊销
+        return jsonify(status="fail", msg="刷新令牌无效"), 401
+    refresh_token = RefreshToken.issue(user.id)
+    db.session.commit()
+    return jsonify(status="success", msg="刷新成功", token=create_access_token(user.email),
+                   refresh_token=refresh_token, user=user.name)
+
+
+def create_access_token(email):
+    return jwt.encode({
+        'sub': email,
+        'exp': datetime.utcnow() + current_app.config['ACCESS_TOKEN_EXPIRES']
+    }, _SECRET_KEY, algorithm="HS256")
+
 # 登录鉴权， 用于上传，获取数据等
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if 'x-access-token' in request.headers:
-            token = request.headers['x-access-token']
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-
-        try:
-            data = jwt.decode(token, _SECRET_KEY, algorithms=["HS256"])
-            current_user = data['sub']
-        except:
-            return jsonify({'message': 'Token is invalid!'}), 401
-
+        current_user, error = authenticate(request.headers.get('x-access-token'))
+        if error:
+            return jsonify({'message': error}), 401
         return f(current_user, *args, **kwargs)
 
     return decorated
 
 
+def authenticate(token):
+    """校验令牌，返回 (用户身份 UserIdentity, 错误信息)"""
+    if not token:
+        return None, 'Token is missing!'
+
+    try:
+        data = decode_token(token)
+    except:
+        return None, 'Token is invalid!'
+
+    current_user = get_user_identity(data['sub'])
+    if current_user is None:
+        return None, 'User not found!'
+    return current_user, None
+
+
+def decode_token(token):
+    """解码并校验 JWT，结果缓存至令牌过期或 TOKEN_CACHE_TTL 到期"""
+    data = token_cache.get(token)
+    if data is None:
+        data = jwt.decode(token, _SECRET_KEY, algorithms=["HS256"])
+        token_cache.set(token, data, ttl=data['exp'] - time.time())
+    return data
+
+
 
 @file_bp.route(f'/{FILE_ROUTE}/<filehash>')
 def get_file(filehash):
-    file = File.query.filter_by(md5=filehash).first()
-    if file is None:
+    if 'w' in request.args or 'fmt' in request.args:
+        return get_derivative(filehash)
+    path = File.get_path(filehash)
+    if path is None:
+        return jsonify({'error': 'File not found'}), 404
+    # URL 中的哈希即文件内容，可直接作为强 ETag，文件存在时无需读取即可返回 304
+    if filehash in request.if_none_match:
+        return _immutable(current_app.response_class(status=304), filehash)
+
+    accel_prefix = current_app.config['FILE_ACCEL_REDIRECT']
+    if accel_prefix:
+        # 由 nginx 发送文件内容（含 Range 处理），worker 只返回响应头
+        response = current_app.response_class(mimetype=mimetypes.guess_type(path)[0])
+        response.headers['X-Accel-Redirect'] = accel_prefix + os.path.basename(path)
+        return _immutable(response, filehash)
+    # conditional 处理 If-None-Match / Range；USE_X_SENDFILE 时由前端服务器发送
+    response = send_file(os.path.abspath(path), conditional=True, etag=filehash, max_age=FILE_MAX_AGE)
+    response.accept_ranges = 'bytes'
+    return _immutable(response, filehash)
+
+
+def get_derivative(filehash):
+    """缩略图 /image/<hash>?w=256&fmt=webp，首次请求时生成并缓存"""
+    try:
+        fmt, width = _derivative_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    etag = f"{filehash}-{width or 'full'}.{fmt}"
+    path = File.get_path(filehash)
+    if path is None:
+        return jsonify({'error': 'File not found'}), 404
+    if etag in request.if_none_match:
+        return _immutable(current_app.response_class(status=304), etag)
+    def render():
+        with metrics.derivative_duration.time(fmt=fmt):
+            return render_derivative(path, width, fmt)
+
+    cached_path = derivative_cache.get(etag, f".{fmt}", render)
+    response = send_file(os.path.abspath(cached_path), mimetype=DERIVATIVE_FORMATS[fmt][0],
+                         conditional=True, etag=etag, max_age=FILE_MAX_AGE)
+    response.accept_ranges = 'bytes'
+    return _immutable(response, etag)
+
+
+def _derivative_params():
+    """解析派生图像的 fmt 与 w 参数，参数无效时抛出 ValueError（消息即错误信息）"""
+    fmt = request.args.get('fmt', 'jpg')
+    if fmt not in DERIVATIVE_FORMATS:
+        raise ValueError(f'Invalid fmt, must be one of {", ".join(DERIVATIVE_FORMATS)}')
+    width = None
+    if request.args.get('w'):
+        try:
+            width = int(request.args['w'])
+        except ValueError:
+            width = None
+        if width not in current_app.config['DERIVATIVE_WIDTHS']:
+            widths = ', '.join(str(w) for w in current_app.config['DERIVATIVE_WIDTHS'])
+            raise ValueError(f'Invalid w, must be one of {widths}')
+    return fmt, width
+
+
+@file_bp.route(f'/{FILE_ROUTE}/<filehash>/overlay')
+def get_overlay(filehash):
+    """按类别叠加标签框 /image/<hash>/overlay?tags=ship,car&w=512&fmt=webp
+
+    标签框来自 box 表，在缓存的已解码底图上绘制；结果按 (文件哈希, 类别, 调色板版本, 标签框, 尺寸, 格式) 缓存，
+    标签框随标签数据补录而变化，因此响应需重新验证
+    """
+    try:
+        fmt, width = _derivative_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    tag_ids = sorted(CATEGORIES)
+    if request.args.get('tags'):
+        name_to_id = {name: tid for tid, name in CATEGORIES.items()}
+        names = {tag.strip() for tag in request.args['tags'].split(',') if tag.strip()}
+        if not names <= name_to_id.keys():
+            return jsonify({'error': f'Invalid tags, must be among {", ".join(CATEGORIES.values())}'}), 400
+        tag_ids = sorted(name_to_id[name] for name in names)
+
+    boxes = Box.for_file(filehash, tag_ids)
+    key = f"{filehash}-overlay-{','.join(map(str, tag_ids))}-{PALETTE_VERSION}-{boxes}-{width or 'full'}.{fmt}"
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    path = File.get_path(filehash)
+    if path is None:
         return jsonify({'error': 'File not found'}), 404
-    return send_file(file.path)
+    if etag in request.if_none_match:
+        return _revalidate(current_app.response_class(status=304), etag)
+
+    def render():
+        base = overlay_bases.get((filehash, width))
+        with metrics.overlay_duration.time(base='hit' if base is not None else 'miss'):
+            if base is None:
+                base = load_image(path, width)
+                overlay_bases.set((filehash, width), base)
+            image, scale = base
+            return encode_image(draw_overlay(image, boxes, scale), fmt)
 
+    cached_path = derivative_cache.get(key, f".{fmt}", render)
+    response = send_file(os.path.abspath(cached_path), mimetype=DERIVATIVE_FORMATS[fmt][0],
+                         conditional=True, etag=etag)
+    return _revalidate(response, etag)
+
+
+def _revalidate(response, etag):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _immutable(response, filehash):
+    response.set_etag(filehash)
+    response.cache_control.public = True
+    response.cache_control.max_age = FILE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+
+@file_bp.route('/render/<int:job_id>')
+@token_required
+def get_render_job(current_user, job_id):
+    """渲染任务状态；完成后重定向到标签可视化图像"""
+    job = db.session.get(RenderJob, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    response = jsonify(job.serialize())
+    if job.status == RenderJob.DONE:
+        response.status_code = 303
+        response.headers['Location'] = f"/{FILE_ROUTE}/{job.result_md5}"
+    elif job.status == RenderJob.FAILED:
+        response.status_code = 500
+    else:
+        response.status_code = 202
+    return response
 
 
 @file_bp.route('/upload', methods=['POST'])
 @token_required
 def upload_file(current_user):
-    user = User.query.filter(User.email == current_user).first()
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -92,57 +294,202 @@ def upload_file(current_user):
         return jsonify({'error': 'No selected file'}), 400
 
     if file and allowed_file(file.filename):
-        image_name = file.filename
-        tags = sar_tools.get_tags(image_name)
-        is_labeled = True
-        if tags is None:
-            is_labeled = False
-        image = Image(img_date=datetime.now(), img_name=file.filename,
-                       author_id=user.id, is_labeled=is_labeled)
-
-        md5_hash = hashlib.md5(file.read()).hexdigest()
-        _, ext = os.path.splitext(secure_filename(file.filename))
-        file.seek(0)
-        image.img_url = f"{FILE_ROUTE}/{md5_hash}"
-        img_path = f"{FILE_SAVE_FOLDER}/{md5_hash}{ext}"
-        image_file = File(md5=md5_hash, path=img_path)
-        image.img_md5 = md5_hash
-        file.save(f"{img_path}")
-        db.session.add(image_file)
-        db.session.add(image)
-
-
-        if is_labeled:
-            # 添加标签后图像
-            labeled_img_hash, labeled_img_path = sar_tools.draw_box(image_name, img_path, FILE_SAVE_FOLDER)
-            image.labeled_image_url = f"{FILE_ROUTE}/{labeled_img_hash}"
-            image.labeled_image_md5 = labeled_img_hash
-            label_img_file = File(md5=labeled_img_hash, path=labeled_img_path)
-            db.session.commit() # 先提交image，确定image_id
-            image.add_tags(tags)
-            db.session.add(label_img_file)
-            db.session.commit()
-
-        db.session.commit()
-        return jsonify({'message': f'File {image_name} has been uploaded successfully.'}), 200
+        # 流式写入临时文件并计算MD5，相同内容只保存一份
+        staged = stage_file(file.stream, file.filename)
+        result, status = finish_upload(staged, current_user)
+        return jsonify(result), status
     else:
         return jsonify({'error': 'File type not allowed'}), 400
 
 
+def finish_upload(staged, current_user):
+    """登记一个已暂存的上传文件并提交渲染任务，返回 (响应内容, 状态码)（ASGI 入口共用）"""
+    image_name = staged['name']
+    similar = _near_duplicates(staged)
+    if similar:
+        discard_staged([staged])
+        return {'error': 'Near-duplicate image already exists', 'similar': similar}, 409
+    label = sar_tools.get_label(image_name)
+    try:
+        rows, jobs = add_images([staged], current_user.id, {image_name: label} if label else {})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        discard_staged([staged])
+        raise
+
+    result = {'message': f'File {image_name} has been uploaded successfully.', 'id': str(rows[0]['id'])}
+    for job in jobs:
+        # 标签可视化图像由后台进程渲染
+        render_queue.submit(job)
+        result['render_job'] = job.serialize()
+    _submit_phashes([staged])
+    return result, 200
+
+
+def _near_duplicates(staged, batch=()):
+    """配置了 PHASH_REJECT_DISTANCE 时计算感知哈希，返回距离在阈值内的已有图像及 batch 中已暂存的图像
+
+    未配置时不在请求中解码图像，感知哈希在提交后由 _submit_phashes 交给渲染进程池计算
+    """
+    distance = current_app.config['PHASH_REJECT_DISTANCE']
+    if distance is None:
+        return []
+    phash = hash_staged(staged)
+    if phash is None:
+        return []
+    similar = [{'id': str(image.id), 'img_name': image.img_name, 'distance': d}
+               for image, d in Image.find_similar(phash, distance, limit=5)]
+    # 同一批中尚未提交的图像
+    for other in batch:
+        if other.get('phash') is not None and len(similar) < 5:
+            d = hamming_distance(phash, other['phash'])
+            if d <= distance:
+                similar.append({'filename': other['name'], 'distance': d})
+    return similar
+
+
+def _submit_phashes(staged):
+    """提交后为上传时未计算感知哈希的内容提交计算任务，相同内容只计算一次"""
+    for md5_hash in {item['md5'] for item in staged if item.get('phash') is None}:
+        path = File.get_path(md5_hash)
+        if path is not None:
+            render_queue.submit_phash(md5_hash, path)
+
+
+@file_bp.route('/upload/batch', methods=['POST'])
+@token_required
+def upload_batch(current_user):
+    """批量上传：支持多个文件及 zip/tar 压缩包，所有记录在一个事务中写入"""
+    files = [file for key in request.files for file in request.files.getlist(key) if file.filename]
+    if not files:
+        return jsonify({'error': 'No file part'}), 400
+
+    config = current_app.config
+    max_name_length = Image.img_name.type.length
+    results, staged = [], []
+    try:
+        for file in files:
+            if is_archive(file.filename):
+                entries = iter_archive(file, config['ARCHIVE_MAX_MEMBERS'], config['ARCHIVE_MAX_MEMBER_BYTES'],
+                                       config['ARCHIVE_MAX_TOTAL_BYTES'])
+            else:
+                entries = [(file.filename, file.stream)]
+            for filename, stream in entries:
+                if not allowed_file(filename):
+                    results.append({'filename': filename, 'status': 'fail', 'error': 'File type not allowed'})
+                    continue
+                if len(filename) > max_name_length:
+                    results.append({'filename': filename, 'status': 'fail',
+                                    'error': f'File name must be at most {max_name_length} characters'})
+                    continue
+                item = stage_file(stream, filename)
+                similar = _near_duplicates(item, staged)
+                if similar:
+                    discard_staged([item])
+                    results.append({'filename': filename, 'status': 'fail',
+                                    'error': 'Near-duplicate image already exists', 'similar': similar})
+                    continue
+                staged.append(item)
+                results.append(item)
+        labels = sar_tools.get_labels(item['name'] for item in staged)
+        rows, jobs = add_images(staged, current_user.id, labels)
+        db.session.commit()
+    except ArchiveLimitError as e:
+        db.session.rollback()
+        discard_staged(staged)
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        db.session.rollback()
+        discard_staged(staged)
+        raise
+
+    for job in jobs:
+        render_queue.submit(job)
+    _submit_phashes(staged)
+    jobs_by_image = {job.image_id: job for job in jobs}
+    rows = iter(rows)
+    report = []
+    for result in results:
+        if 'md5' not in result:
+            report.append(result)
+            continue
+        row = next(rows)
+        entry = {'filename': result['name'], 'status': 'success', 'id': str(row['id']),
+                 'md5': row['img_md5'], 'is_labeled': row['is_labeled']}
+        if row['id'] in jobs_by_image:
+            entry['render_job'] = jobs_by_image[row['id']].serialize()
+        report.append(entry)
+    return jsonify({'message': f'{len(staged)} files have been uploaded successfully.', 'results': report}), 200
+
+
+def _query_cache_params(args):
+    """/query 的缓存参数：与参数顺序、tags 与 box_tags 的顺序及重复无关"""
+    params = []
+    for name, value in sorted(args.items(multi=True)):
+        if name in ('tags', 'box_tags'):
+            value = ','.join(sorted({tag.strip() for tag in value.split(',') if tag.strip()}))
+        elif name == 'id':
+            try:
+                value = uuid.UUID(value).hex
+            except ValueError:
+                pass
+        params.append((name, value))
+    return params
+
 
 @file_bp.route('/query', methods=['GET', 'POST'])
 @token_required
+@response_cache.cached(_query_cache_params)
 def query_item(current_user):
     filters = request.args
+    try:
+        query = Image.query.filter(*image_filters(filters))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # 分页参数：按 (img_date, id) 做 keyset 分页
+    limit = None
+    if filters.get('limit'):
+        try:
+            limit = int(filters['limit'])
+            if limit <= 0:
+                raise ValueError
+        except ValueError:
+            return jsonify({'error': 'Invalid limit, must be a positive integer'}), 400
+    query = query.order_by(Image.img_date, Image.id)
+    if filters.get('cursor'):
+        try:
+            query = _after_cursor(query, _decode_cursor(filters['cursor']))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    if filters.get('stream') == 'true':
+        return Response(stream_with_context(_stream_images(query, limit)), mimetype='application/json')
+
+    if limit is None:
+        return jsonify(Image.serialize_many(query.all()))
+    limit = min(limit, current_app.config['QUERY_MAX_LIMIT'])
+    images = query.limit(limit + 1).all()
+    response = jsonify(Image.serialize_many(images[:limit]))
+    if len(images) > limit:
+        response.headers['X-Next-Cursor'] = _encode_cursor(images[limit - 1])
+    return response
 
-    query = Image.query
-    if not filters:
-        return jsonify([image.serialize() for image in query.all()])
 
+BOX_FILTERS = ('box_tags', 'min_area', 'max_area', 'min_boxes', 'region')
+
+
+def image_filters(filters):
+    """将 /query 的筛选参数转换为 Image 查询条件列表（/modify/batch 共用）
+
+    参数无效时抛出 ValueError（消息即错误信息）；没有筛选参数时返回空列表
+    """
+    conditions = []
     if 'name' in filters:
         name = filters.get('name')
         if name:
-            query = query.filter(Image.img_name.like(f"%{name}%"))
+            conditions.append(Image.name_filter(name))
 
     if 'start_date' in filters and 'end_date' in filters:
         try:
@@ -151,32 +498,192 @@ def query_item(current_user):
             if start_date_str and end_date_str:
                 start_date = datetime.strptime(filters['start_date'], '%Y-%m-%dT%H:%M:%S.%f')
                 end_date = datetime.strptime(filters['end_date'], '%Y-%m-%dT%H:%M:%S.%f') + timedelta(days=1)
-                query = query.filter(Image.img_date >= start_date, Image.img_date < end_date)
+                conditions += [Image.img_date >= start_date, Image.img_date < end_date]
             elif start_date_str:
                 start_date = datetime.strptime(filters['start_date'], '%Y-%m-%dT%H:%M:%S.%f')
-                query = query.filter(Image.img_date >= start_date)
+                conditions.append(Image.img_date >= start_date)
             elif end_date_str:
                 end_date = datetime.strptime(filters['end_date'], '%Y-%m-%dT%H:%M:%S.%f') + timedelta(days=1)
-                query = query.filter(Image.img_date <= end_date)
+                conditions.append(Image.img_date <= end_date)
         except ValueError:
-            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DDTHH:MM:SS.'}), 400
+            raise ValueError('Invalid date format. Use YYYY-MM-DDTHH:MM:SS.')
 
     if 'id' in filters:
         try:
             image_id = uuid.UUID(filters['id'])  # 尝试将字符串转换为UUID
-            query = query.filter(Image.id == image_id)
         except ValueError:
-            return jsonify({'error': 'Invalid id, must be a valid UUID'}), 400
+            raise ValueError('Invalid id, must be a valid UUID')
+        conditions.append(Image.id == image_id)
 
     if 'tags' in filters:
         tags = filters['tags']
         if tags:
-            tag_list = tags.split(',')
-            tag_query = Tag.get_images_by_tags(tag_list)
-            query = query.intersect(tag_query)  # 使用 intersect 来获取交集
+            tag_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
+            match = filters.get('match') or 'any'
+            if match not in ('any', 'all'):
+                raise ValueError('Invalid match, must be any or all')
+            min_num = None
+            if filters.get('min_count'):
+                try:
+                    min_num = int(filters['min_count'])
+                except ValueError:
+                    raise ValueError('Invalid min_count, must be an integer')
+            conditions.append(Tag.images_filter(tag_list, match, min_num))
+
+    # 标签框筛选：类别、面积、数量与区域，由标签框索引检索
+    if any(filters.get(name) for name in BOX_FILTERS):
+        conditions.append(Box.images_filter(**_parse_box_filter(filters)))
+    return conditions
+
+
+def _parse_box_filter(filters):
+    """解析 /query 的标签框参数为 Box.images_filter 的参数，参数无效时抛出 ValueError（消息即错误信息）"""
+    params = {}
+    if filters.get('box_tags'):
+        params['tag_names'] = [tag.strip() for tag in filters['box_tags'].split(',') if tag.strip()]
+    for name in ('min_area', 'max_area', 'min_boxes'):
+        if filters.get(name):
+            try:
+                params[name] = int(filters[name])
+            except ValueError:
+                raise ValueError(f'Invalid {name}, must be an integer')
+    if filters.get('region'):
+        try:
+            region = tuple(int(value) for value in filters['region'].split(','))
+            if len(region) != 4 or region[0] > region[2] or region[1] > region[3]:
+                raise ValueError
+        except ValueError:
+            raise ValueError('Invalid region, must be x1,y1,x2,y2')
+        params['region'] = region
+        params['region_match'] = filters.get('region_match') or 'inside'
+        if params['region_match'] not in ('inside', 'overlap'):
+            raise ValueError('Invalid region_match, must be inside or overlap')
+    return params
+
 
-    images = query.all()
-    return jsonify([image.serialize() for image in images])
+def _encode_cursor(image):
+    raw = f"{image.img_date.isoformat()}|{image.id.hex}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError(cursor)
+    date_str, _, id_hex = raw.partition('|')
+    return datetime.fromisoformat(date_str), uuid.UUID(id_hex)
+
+
+def _after_cursor(query, position):
+    img_date, image_id = position
+    return query.filter(or_(Image.img_date > img_date,
+                            and_(Image.img_date == img_date, Image.id > image_id)))
+
+
+def _stream_images(query, limit=None):
+    """逐批查询并输出 JSON 数组，内存占用与结果总数无关"""
+    batch_size = current_app.config['QUERY_STREAM_BATCH']
+    remaining = limit
+    position = None
+    yield '['
+    first = True
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        page = query if position is None else _after_cursor(query, position)
+        images = page.limit(size).all()
+        if not images:
+            break
+        for item in Image.serialize_many(images):
+            yield ('' if first else ',') + current_app.json.dumps(item)
+            first = False
+        position = (images[-1].img_date, images[-1].id)
+        if remaining is not None:
+            remaining -= len(images)
+        if len(images) < size:
+            break
+    yield ']'
+
+
+@file_bp.route('/export', methods=['GET'])
+@token_required
+def export_dataset(current_user):
+    """导出数据集 /export?format=coco|yolo&<与 /query 相同的筛选参数>
+
+    边查询边生成 zip，包含原始图像及 COCO 或 YOLO 格式的标注
+    """
+    fmt = request.args.get('format', 'coco')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Invalid format, must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+    try:
+        query = Image.query.filter(*image_filters(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f"sarms-{fmt}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
+    response = Response(stream_with_context(stream_dataset(_export_batches(query), fmt)),
+                        mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _export_batches(query):
+    """按 (img_date, id) 逐批给出 (图像 id, 名称, 文件路径)"""
+    batch_size = current_app.config['QUERY_STREAM_BATCH']
+    query = query.join(File, File.md5 == Image.img_md5). \
+        with_entities(Image.id, Image.img_name, File.path, Image.img_date).order_by(Image.img_date, Image.id)
+    position = None
+    while True:
+        page = query if position is None else _after_cursor(query, position)
+        rows = page.limit(batch_size).all()
+        # 只读；导出可能持续很久，批次之间不保持事务
+        db.session.rollback()
+        if not rows:
+            break
+        yield [(image_id, img_name, path) for image_id, img_name, path, _ in rows]
+        if len(rows) < batch_size:
+            break
+        position = (rows[-1].img_date, rows[-1].id)
+
+
+@file_bp.route('/similar', methods=['GET'])
+@token_required
+@response_cache.cached()
+def similar_images(current_user):
+    """近似图像 /similar?id=<uuid>&distance=8&limit=20，按感知哈希的汉明距离由近到远返回"""
+    filters = request.args
+    if not filters.get('id'):
+        return jsonify({'error': 'No id provided'}), 400
+    try:
+        image_id = uuid.UUID(filters['id'])
+    except ValueError:
+        return jsonify({'error': 'Invalid id, must be a valid UUID'}), 400
+    max_distance = current_app.config['SIMILAR_MAX_DISTANCE']
+    try:
+        distance = int(filters.get('distance') or current_app.config['SIMILAR_DEFAULT_DISTANCE'])
+        if not 0 <= distance <= max_distance:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'Invalid distance, must be an integer between 0 and {max_distance}'}), 400
+    limit = current_app.config['QUERY_MAX_LIMIT']
+    if filters.get('limit'):
+        try:
+            limit = min(int(filters['limit']), limit)
+            if limit <= 0:
+                raise ValueError
+        except ValueError:
+            return jsonify({'error': 'Invalid limit, must be a positive integer'}), 400
+
+    image = db.session.get(Image, image_id)
+    if image is None:
+        return jsonify({'error': 'Image not found'}), 404
+    if image.phash is None:
+        return jsonify({'error': 'Image has no perceptual hash, run flask phash backfill'}), 409
+    matches = Image.find_similar(image.phash, distance, limit, exclude_id=image.id)
+    items = Image.serialize_many(image for image, _ in matches)
+    for item, (_, d) in zip(items, matches):
+        item['distance'] = d
+    return jsonify(items)
 
 
 @file_bp.route('/modify', methods=['POST'])
@@ -205,23 +712,111 @@ def modify_item(current_user):
         db.session.commit()
         return jsonify({'message': 'Image renamed successfully'}), 200
     elif 'delete' in filters and filters['delete'] == 'true': # 删除
-        image_file = File.query.filter(File.md5 == image.img_md5).first()
-        os.remove(image_file.path) # 删除原图像
-        db.session.delete(image_file)
-        if image.is_labeled:
-            label_img_file = File.query.filter(File.md5 == image.labeled_image_md5).first()
-            # 删除标签可视化图像
-            os.remove(label_img_file.path)
-            db.session.delete(label_img_file)
-        db.session.delete(image)
+        # 无引用的文件在提交后由 file_collector 删除
+        delete_images([image.id])
         db.session.commit()
         return jsonify({'message': 'Image deleted successfully'}), 200
     else:
         return jsonify({'error': 'Invalid request'}), 400
 
 
+@file_bp.route('/modify/batch', methods=['POST'])
+@token_required
+def modify_batch(current_user):
+    """批量修改，所有修改在一个事务中完成
+
+    请求体为 JSON：用 ids（图像 id 列表）或 filters（与 /query 相同的筛选参数）选择图像，action 为
+      rename  prefix、suffix、replace（[旧子串, 新子串]），名称改为 prefix + 替换后的原名 + suffix
+      retag   add_tags（标签名 -> 数量）、remove_tags（标签名列表）
+      delete  删除图像，无引用的文件在提交后删除
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action not in ('rename', 'retag', 'delete'):
+        return jsonify({'error': 'Invalid action, must be rename, retag or delete'}), 400
+
+    try:
+        image_ids = _batch_targets(data)
+        if action == 'rename':
+            params = _rename_params(data)
+        elif action == 'retag':
+            params = _retag_params(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if action == 'rename':
+            count = rename_images(image_ids, **params)
+        elif action == 'retag':
+            count = retag_images(image_ids, **params)
+        else:
+            count = delete_images(image_ids)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        db.session.rollback()
+        raise
+    done = {'rename': 'renamed', 'retag': 'retagged', 'delete': 'deleted'}[action]
+    return jsonify({'message': f'{count} images {done} successfully', 'count': count}), 200
+
+
+def _batch_targets(data):
+    """/modify/batch 选中的图像 id，参数无效时抛出 ValueError"""
+    if 'ids' in data:
+        ids = data['ids']
+        max_ids = current_app.config['BULK_MAX_IDS']
+        if not isinstance(ids, list) or not ids:
+            raise ValueError('Invalid ids, must be a non-empty list')
+        if len(ids) > max_ids:
+            raise ValueError(f'Too many ids, at most {max_ids} per request')
+        try:
+            return list({uuid.UUID(image_id) for image_id in ids})
+        except (TypeError, AttributeError, ValueError):
+            raise ValueError('Invalid id, must be a valid UUID')
+    filters = data.get('filters')
+    if not isinstance(filters, dict):
+        raise ValueError('No ids or filters provided')
+    # 与查询字符串一致，参数值均按字符串处理
+    conditions = image_filters({name: str(value) for name, value in filters.items()})
+    if not conditions:
+        raise ValueError('No filters provided')
+    return [image_id for (image_id,) in db.session.query(Image.id).filter(*conditions)]
+
+
+def _rename_params(data):
+    params = {'prefix': data.get('prefix') or '', 'suffix': data.get('suffix') or '', 'replace': data.get('replace')}
+    if not isinstance(params['prefix'], str) or not isinstance(params['suffix'], str):
+        raise ValueError('Invalid prefix or suffix, must be strings')
+    replace = params['replace']
+    if replace is not None and (not isinstance(replace, list) or len(replace) != 2 or
+                                not all(isinstance(value, str) for value in replace) or not replace[0]):
+        raise ValueError('Invalid replace, must be [old, new]')
+    if not (params['prefix'] or params['suffix'] or replace):
+        raise ValueError('No prefix, suffix or replace provided')
+    return params
+
+
+def _retag_params(data):
+    name_to_id = {name: tid for tid, name in get_tag_names().items()}
+    add_tags, remove_tags = data.get('add_tags') or {}, data.get('remove_tags') or []
+    if not isinstance(add_tags, dict) or not isinstance(remove_tags, list):
+        raise ValueError('Invalid add_tags or remove_tags')
+    if not add_tags and not remove_tags:
+        raise ValueError('No add_tags or remove_tags provided')
+    unknown = [name for name in [*add_tags, *remove_tags] if name not in name_to_id]
+    if unknown:
+        raise ValueError(f'Unknown tags: {", ".join(map(str, unknown))}')
+    if any(not isinstance(num, int) or isinstance(num, bool) or num <= 0 for num in add_tags.values()):
+        raise ValueError('Invalid add_tags, counts must be positive integers')
+    return {'add_tags': {name_to_id[name]: num for name, num in add_tags.items()},
+            'remove_tags': sorted({name_to_id[name] for name in remove_tags} - {name_to_id[name] for name in add_tags})}
+
+
 @file_bp.route('/info', methods=['POST'])
 @token_required
+@response_cache.cached(lambda args: date.today().isoformat())  # 统计最近 10 天，跨天后结果变化
 def get_info(current_user):
     image_num_by_date = count_image_num_by_date()
     tag_freq = get_tag_frequencies()